@@ -6,7 +6,6 @@ import click
 from datetime import datetime
 
 from rdb.chunking.chunker import DocumentChunker
-from rdb.embedding.embedder import DocumentEmbedder
 from rdb.storage.database import DatabaseManager
 from rdb.utils.helpers import Timer
 
@@ -40,12 +39,13 @@ def build_cmd(ctx, input, output, embedding_model, batch_size, force, stats):
         else:
             click.echo(f"  Index file: ✗ Not found")
         
-        if config.metadata_file.exists():
+        from rdb.retrieval.index_manager import find_metadata_file, load_metadata
+        metadata_file = find_metadata_file(config.index_dir)
+        
+        if metadata_file is not None:
             try:
-                import pickle
-                with open(config.metadata_file, 'rb') as f:
-                    chunks = pickle.load(f)
-                click.echo(f"  Metadata file: ✓ {config.metadata_file}")
+                chunks = load_metadata(metadata_file)
+                click.echo(f"  Metadata file: ✓ {metadata_file}")
                 click.echo(f"  Total chunks: {len(chunks)}")
                 
                 # Chunk type distribution
@@ -85,10 +85,12 @@ def build_cmd(ctx, input, output, embedding_model, batch_size, force, stats):
             click.echo("Build cancelled.")
             return
     
+    # Imported here so that --help and --stats don't pay for torch
+    from rdb.embedding.embedder import DocumentEmbedder
+    
     # Initialize components
     chunker = DocumentChunker(config)
     embedder = DocumentEmbedder(config)
-    db_manager = DatabaseManager(config)
     
     session_data = {
         'started_at': datetime.now(),
@@ -130,7 +132,7 @@ def build_cmd(ctx, input, output, embedding_model, batch_size, force, stats):
             # Step 3: Build index
             click.echo("\nStep 3: Building FAISS index...")
             with Timer("Index building") as index_timer:
-                embedder.build_index(embeddings)
+                embedder.build_index(embeddings, normalize=False)
                 index_file, metadata_file = embedder.save_index(output_dir)
             
             click.echo(f"Built index in {index_timer}")
@@ -142,7 +144,8 @@ def build_cmd(ctx, input, output, embedding_model, batch_size, force, stats):
         })
         
         # Log session to database
-        session_id = db_manager.log_indexing_session(session_data)
+        with DatabaseManager(config) as db_manager:
+            session_id = db_manager.log_indexing_session(session_data)
         
         click.echo(f"\nIndex building completed successfully!")
         click.echo(f"Total chunks: {len(chunks)}")
@@ -156,7 +159,8 @@ def build_cmd(ctx, input, output, embedding_model, batch_size, force, stats):
             'completed_at': datetime.now(),
             'status': 'interrupted'
         })
-        db_manager.log_indexing_session(session_data)
+        with DatabaseManager(config) as db_manager:
+            db_manager.log_indexing_session(session_data)
         
         click.echo("\nIndex building interrupted by user.")
         
@@ -166,7 +170,8 @@ def build_cmd(ctx, input, output, embedding_model, batch_size, force, stats):
             'status': 'failed',
             'error': str(e)
         })
-        db_manager.log_indexing_session(session_data)
+        with DatabaseManager(config) as db_manager:
+            db_manager.log_indexing_session(session_data)
         
         click.echo(f"\nIndex building failed: {e}")
         raise click.ClickException(str(e))
@@ -11,6 +11,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from rdb.config.settings import Config
 from rdb.utils.logging import setup_logging
+from rdb.utils.helpers import list_json_files
 from .scrape import scrape_cmd
 from .build import build_cmd
 from .search import search_cmd
@@ -67,7 +68,7 @@ def status(ctx):
    click.echo("Data Status:")
    
    if config.raw_data_dir.exists():
-       json_files = list(config.raw_data_dir.glob("*.json"))
+       json_files = list_json_files(config.raw_data_dir)
        click.echo(f"  Raw data files: {len(json_files)}")
    else:
        click.echo("  Raw data files: Not found")
@@ -82,8 +83,10 @@ def status(ctx):
    else:
        click.echo("  Index file: ✗ Not found")
    
-   if config.metadata_file.exists():
-       click.echo(f"  Metadata file: ✓ {config.metadata_file}")
+   from rdb.retrieval.index_manager import find_metadata_file
+   metadata_file = find_metadata_file(config.index_dir)
+   if metadata_file is not None:
+       click.echo(f"  Metadata file: ✓ {metadata_file}")
    else:
        click.echo("  Metadata file: ✗ Not found")
 
@@ -26,8 +26,8 @@ def scrape_cmd(ctx, output, delay_min, delay_max, max_retries, resume, force, hi
     
     # Handle history command
     if history:
-        db_manager = DatabaseManager(config)
-        stats = db_manager.get_scraping_stats()
+        with DatabaseManager(config) as db_manager:
+            stats = db_manager.get_scraping_stats()
         
         click.echo("Scraping Statistics:")
         click.echo(f"  Total sessions: {stats['total_sessions']}")
@@ -46,11 +46,11 @@ def scrape_cmd(ctx, output, delay_min, delay_max, max_retries, resume, force, hi
     
     # Initialize scraper
     scraper = WikiScraper(config)
-    db_manager = DatabaseManager(config)
     
     click.echo("Starting Arch Wiki scraping...")
     click.echo(f"Output directory: {output or config.raw_data_dir}")
-    click.echo(f"Delay range: {config.scrape_delay_min}-{config.scrape_delay_max}s")
+    click.echo(f"Delay range: {config.scrape_delay_min}-{config.scrape_delay_max}s "
+               f"per worker, {max(1, config.scrape_workers)} worker(s)")
     
     if not resume and not force:
         click.echo("\nThis will scrape the entire Arch Wiki.")
@@ -92,7 +92,8 @@ def scrape_cmd(ctx, output, delay_min, delay_max, max_retries, resume, force, hi
         })
         
         # Log session to database
-        session_id = db_manager.log_scraping_session(session_data)
+        with DatabaseManager(config) as db_manager:
+            session_id = db_manager.log_scraping_session(session_data)
         
         click.echo(f"\nScraping completed successfully!")
         click.echo(f"Pages scraped: {success_count}")
@@ -104,7 +105,8 @@ def scrape_cmd(ctx, output, delay_min, delay_max, max_retries, resume, force, hi
             'completed_at': datetime.now(),
             'status': 'interrupted'
         })
-        db_manager.log_scraping_session(session_data)
+        with DatabaseManager(config) as db_manager:
+            db_manager.log_scraping_session(session_data)
         
         click.echo("\nScraping interrupted by user.")
         
@@ -114,7 +116,8 @@ def scrape_cmd(ctx, output, delay_min, delay_max, max_retries, resume, force, hi
             'status': 'failed',
             'error': str(e)
         })
-        db_manager.log_scraping_session(session_data)
+        with DatabaseManager(config) as db_manager:
+            db_manager.log_scraping_session(session_data)
         
         click.echo(f"\nScraping failed: {e}")
         raise click.ClickException(str(e))
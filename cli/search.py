@@ -6,7 +6,6 @@ import click
 import time
 from datetime import datetime
 
-from rdb.retrieval.retriever import DocumentRetriever
 from rdb.storage.database import DatabaseManager
 from rdb.utils.helpers import Timer
 
@@ -29,10 +28,10 @@ def search_cmd(ctx, query, top_k, refine, no_refine, refiner_model, interactive,
     
     # Handle history command
     if history:
-        db_manager = DatabaseManager(config)
-        
-        # Get search statistics
-        stats = db_manager.get_search_stats()
+        with DatabaseManager(config) as db_manager:
+            # Get search statistics and recent searches
+            stats = db_manager.get_search_stats()
+            recent_searches = db_manager.get_recent_searches(limit)
         
         click.echo("Search Statistics:")
         click.echo(f"  Total searches: {stats['total_searches']}")
@@ -40,9 +39,6 @@ def search_cmd(ctx, query, top_k, refine, no_refine, refiner_model, interactive,
         click.echo(f"  Searches with refinement: {stats['refined_searches']}")
         click.echo(f"  Last search: {stats['last_search']}")
         
-        # Get recent searches
-        recent_searches = db_manager.get_recent_searches(limit)
-        
         if recent_searches:
             click.echo(f"\nRecent Searches (last {len(recent_searches)}):")
             for search in recent_searches:
@@ -83,6 +79,8 @@ def search_cmd(ctx, query, top_k, refine, no_refine, refiner_model, interactive,
         original_refinement_setting = config.enable_query_refinement
         config.enable_query_refinement = use_refinement
         
+        # Imported here so that --help and --history don't pay for torch
+        from rdb.retrieval.retriever import DocumentRetriever
         retriever = DocumentRetriever(config)
         if not retriever.load_index():
             raise click.ClickException("Could not load search index. Run 'rdb build' first.")
@@ -98,8 +96,6 @@ def search_cmd(ctx, query, top_k, refine, no_refine, refiner_model, interactive,
         retriever.search_interactive(top_k=config.default_top_k, show_refinement=show_refinement)
     else:
         # Single query mode
-        db_manager = DatabaseManager(config)
-        
         click.echo(f"Searching for: '{query}'")
         
         search_data = {
@@ -124,7 +120,8 @@ def search_cmd(ctx, query, top_k, refine, no_refine, refiner_model, interactive,
             })
             
             # Log search to database
-            db_manager.log_search(search_data)
+            with DatabaseManager(config) as db_manager:
+                db_manager.log_search(search_data)
             
             if not results:
                 click.echo("No results found.")
@@ -138,7 +135,8 @@ def search_cmd(ctx, query, top_k, refine, no_refine, refiner_model, interactive,
                 'results_count': 0,
                 'search_time_ms': 0
             })
-            db_manager.log_search(search_data)
+            with DatabaseManager(config) as db_manager:
+                db_manager.log_search(search_data)
             
             raise click.ClickException(f"Search failed: {e}")
 
@@ -18,6 +18,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from rdb import RDB
 from rdb.config.settings import Config
 from rdb.utils.logging import setup_logging
+from rdb.utils.helpers import list_json_files
 
 
 def main():
@@ -49,7 +50,7 @@ def main():
    
    # Check if data exists
    if config.raw_data_dir.exists():
-       json_files = list(config.raw_data_dir.glob("*.json"))
+       json_files = list_json_files(config.raw_data_dir)
        print(f"Found {len(json_files)} scraped files")
    else:
        print("No scraped data found")
@@ -73,7 +74,7 @@ def main():
    print("3. Building Search Index")
    print("-" * 30)
    
-   if config.raw_data_dir.exists() and list(config.raw_data_dir.glob("*.json")):
+   if config.raw_data_dir.exists() and list_json_files(config.raw_data_dir):
        print("Scraped data found. Building index...")
        try:
            chunk_count = rdb.build_index()
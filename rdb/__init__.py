@@ -9,11 +9,29 @@ __version__ = "0.1.0"
 __author__ = "Topher Ludlow"
 __email__ = "topherludlow@protonmail.com"
 
+import importlib
+
 from .config.settings import Config
-from .scraper.wiki_scraper import WikiScraper
-from .chunking.chunker import DocumentChunker
-from .embedding.embedder import DocumentEmbedder
-from .retrieval.retriever import DocumentRetriever
+
+# Components are imported on first access (PEP 562) so that importing rdb
+# does not pull in torch, sentence-transformers and faiss.
+_LAZY_IMPORTS = {
+   "WikiScraper": ".scraper.wiki_scraper",
+   "DocumentChunker": ".chunking.chunker",
+   "DocumentEmbedder": ".embedding.embedder",
+   "DocumentRetriever": ".retrieval.retriever",
+}
+
+
+def __getattr__(name):
+   """Import heavy components lazily on first attribute access."""
+   if name in _LAZY_IMPORTS:
+       module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+       value = getattr(module, name)
+       globals()[name] = value
+       return value
+   raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class RDB:
    """Main RDB interface for document retrieval operations."""
@@ -29,24 +47,28 @@ class RDB:
    def get_scraper(self):
        """Get or create scraper instance."""
        if self.scraper is None:
+           from .scraper.wiki_scraper import WikiScraper
            self.scraper = WikiScraper(self.config)
        return self.scraper
    
    def get_chunker(self):
        """Get or create chunker instance."""
        if self.chunker is None:
+           from .chunking.chunker import DocumentChunker
            self.chunker = DocumentChunker(self.config)
        return self.chunker
    
    def get_embedder(self):
        """Get or create embedder instance."""
        if self.embedder is None:
+           from .embedding.embedder import DocumentEmbedder
            self.embedder = DocumentEmbedder(self.config)
        return self.embedder
    
    def get_retriever(self):
        """Get or create retriever instance."""
        if self.retriever is None:
+           from .retrieval.retriever import DocumentRetriever
            self.retriever = DocumentRetriever(self.config)
        return self.retriever
    
@@ -73,6 +95,11 @@ class RDB:
        """Search documents with optional query refinement."""
        retriever = self.get_retriever()
        return retriever.search(query, top_k=top_k, refine_query=refine_query)
+   
+   def search_batch(self, queries, top_k=5, refine_query=False):
+       """Search several queries with one batched encode and index search."""
+       retriever = self.get_retriever()
+       return retriever.search_batch(queries, top_k=top_k, refine_query=refine_query)
 
 __all__ = [
    "RDB",
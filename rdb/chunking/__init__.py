@@ -2,12 +2,13 @@
 Document chunking module for RDB.
 """
 
-from .models import Chunk
+from .models import Chunk, FlatDoc
 from .chunker import DocumentChunker
 from .strategies import ChunkingStrategy, SmallChunkStrategy, MediumChunkStrategy, LargeChunkStrategy
 
 __all__ = [
     "Chunk",
+    "FlatDoc",
     "DocumentChunker",
     "ChunkingStrategy", 
     "SmallChunkStrategy",
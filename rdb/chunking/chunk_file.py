@@ -0,0 +1,145 @@
+"""
+Memory-mapped JSONL chunk storage with lazily decoded chunk views.
+"""
+
+import mmap
+import os
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator
+
+import numpy as np
+
+from ..utils.helpers import dumps_json, loads_json
+
+
+CHUNK_FIELDS = ('page_title', 'section_path', 'content', 'chunk_text', 'url', 'chunk_type', 'section_level')
+
+
+def index_path(chunks_file: Path) -> Path:
+    """Get the path of the byte offset sidecar for a JSONL chunks file."""
+    return chunks_file.with_suffix(chunks_file.suffix + '.idx')
+
+
+def _temp_path(path: Path) -> Path:
+    """Get the path a file is written to before it atomically replaces path."""
+    return path.with_name(path.name + '.tmp')
+
+
+def write_offsets(offsets: np.ndarray, output_file: Path) -> None:
+    """Atomically write the byte offset sidecar of a JSONL chunks file."""
+    idx_file = index_path(output_file)
+    offsets.astype(np.int64).tofile(_temp_path(idx_file))
+    os.replace(_temp_path(idx_file), idx_file)
+
+
+def scan_offsets(data) -> np.ndarray:
+    """Find the line byte offsets of JSONL data by scanning it for newlines."""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(buffer == ord('\n')) + 1
+    if len(buffer) and buffer[-1] != ord('\n'):
+        # Last line without a trailing newline
+        ends = np.append(ends, len(buffer))
+    return np.concatenate(([0], ends)).astype(np.int64)
+
+
+def write_chunks_jsonl(records: Iterable[Dict[str, Any]], output_file: Path) -> int:
+    """Write chunk records as JSONL plus an int64 byte offset sidecar, returning the count."""
+    # Both files are written aside and moved into place, sidecar first; ChunkFile
+    # rescans if the process dies in between and the sidecar doesn't match the data
+    offsets = [0]
+    with open(_temp_path(output_file), 'wb') as f:
+        for record in records:
+            line = dumps_json(record) + b'\n'
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+
+    # N + 1 offsets: line i spans offsets[i]:offsets[i + 1]
+    write_offsets(np.array(offsets, dtype=np.int64), output_file)
+    os.replace(_temp_path(output_file), output_file)
+    return len(offsets) - 1
+
+
+class ChunkView:
+    """Chunk backed by a line of a memory-mapped JSONL file, decoded on first access."""
+
+    __slots__ = ('_file', '_pos', '_data')
+
+    def __init__(self, chunk_file: 'ChunkFile', pos: int):
+        """Initialize a view of the chunk at the given line."""
+        self._file = chunk_file
+        self._pos = pos
+        self._data = None
+
+    def __getattr__(self, name: str) -> Any:
+        if name not in CHUNK_FIELDS:
+            raise AttributeError(name)
+        return self.to_dict()[name]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Decode the underlying JSON record."""
+        if self._data is None:
+            self._data = self._file.read_record(self._pos)
+        return self._data
+
+    def __repr__(self) -> str:
+        return f"ChunkView({self._pos})"
+
+
+class ChunkFile(Sequence):
+    """Read-only sequence of ChunkViews over a memory-mapped JSONL chunks file."""
+
+    def __init__(self, chunks_file: Path):
+        """Map the chunks file and load its byte offsets."""
+        self.path = Path(chunks_file)
+
+        self._fh = open(self.path, 'rb')
+        size = os.fstat(self._fh.fileno()).st_size
+        if size > 0:
+            self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._mm = b''  # mmap cannot map an empty file
+        self.offsets = self._load_offsets(size)
+
+    def _load_offsets(self, size: int) -> np.ndarray:
+        """Load the sidecar offsets, rebuilding them if the sidecar is missing or doesn't match the file."""
+        try:
+            offsets = np.fromfile(index_path(self.path), dtype=np.int64)
+            if len(offsets) and offsets[0] == 0 and offsets[-1] == size:
+                return offsets
+        except (OSError, ValueError):
+            pass
+
+        offsets = scan_offsets(self._mm)
+        try:
+            write_offsets(offsets, self.path)
+        except OSError:
+            pass  # e.g. a read-only data directory; the offsets are rescanned next time
+        return offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ChunkView(self, pos) for pos in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        return ChunkView(self, i)
+
+    def read_record(self, pos: int) -> Dict[str, Any]:
+        """Decode the JSON record on the given line."""
+        return loads_json(self._mm[self.offsets[pos]:self.offsets[pos + 1]])
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Decode records in file order without caching them in views."""
+        for pos in range(len(self)):
+            yield self.read_record(pos)
+
+    def close(self) -> None:
+        """Unmap and close the underlying file."""
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._fh.close()
@@ -2,16 +2,38 @@
 Document chunker for RDB.
 """
 
-import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
 from ..config.settings import Config
 from ..utils.logging import get_logger
-from .models import Chunk
+from ..utils.helpers import PAGES_JSONL, dumps_json, list_json_files, read_json_file, read_jsonl_file
+from .models import Chunk, FlatDoc
+from .chunk_file import ChunkFile, write_chunks_jsonl
 from .strategies import SmallChunkStrategy, MediumChunkStrategy, LargeChunkStrategy
 
 
+# Chunker used by each worker process, created once per worker by _init_worker
+_worker_chunker = None
+
+
+def _init_worker(config: Config) -> None:
+    """Create the chunker for a worker process."""
+    global _worker_chunker
+    _worker_chunker = DocumentChunker(config)
+
+
+def _chunk_file(json_file: Path) -> List[Chunk]:
+    """Chunk one scraped page in a worker process."""
+    return _worker_chunker._chunk_file(json_file)
+
+
+def _chunk_document(doc: Dict[str, Any]) -> List[Chunk]:
+    """Chunk one page read from pages.jsonl in a worker process."""
+    return _worker_chunker._chunk_document(doc)
+
+
 class DocumentChunker:
     """Creates multi-level chunks from scraped documents."""
     
@@ -36,65 +58,114 @@ class DocumentChunker:
         if not input_dir.exists():
             raise FileNotFoundError(f"Directory not found: {input_dir}")
         
-        json_files = list(input_dir.glob("*.json"))
-        if not json_files:
+        json_files = list_json_files(input_dir)
+        pages_file = input_dir / PAGES_JSONL
+        has_pages_file = pages_file.exists()
+        if not json_files and not has_pages_file:
             raise FileNotFoundError(f"No JSON files found in: {input_dir}")
         
         self.logger.info(f"Processing {len(json_files)} JSON files...")
+        if has_pages_file:
+            self.logger.info(f"Processing pages from {pages_file}...")
+        
+        # Skip the page list file
+        json_files = [f for f in json_files if f.name != "page_list.json"]
         
         self.chunks = []
-        for json_file in json_files:
-            if json_file.name == "page_list.json":
-                continue  # Skip the page list file
-                
-            self.logger.debug(f"Processing: {json_file.name}")
-            try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    doc = json.load(f)
-                self._process_document(doc)
-            except Exception as e:
-                self.logger.error(f"Error processing {json_file}: {e}")
-                continue
+        workers = self.config.chunk_workers if has_pages_file else min(self.config.chunk_workers, len(json_files))
+        if workers > 1:
+            # Pages are independent, so chunk them in parallel; map keeps file order
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self.config,)) as executor:
+                for file_chunks in executor.map(_chunk_file, json_files, chunksize=16):
+                    self.chunks.extend(file_chunks)
+                if has_pages_file:
+                    for doc_chunks in executor.map(_chunk_document, read_jsonl_file(pages_file), chunksize=16):
+                        self.chunks.extend(doc_chunks)
+        else:
+            for json_file in json_files:
+                self.chunks.extend(self._chunk_file(json_file))
+            if has_pages_file:
+                for doc in read_jsonl_file(pages_file):
+                    self.chunks.extend(self._chunk_document(doc))
         
         self.logger.info(f"Created {len(self.chunks)} total chunks")
         return self.chunks
     
+    def _chunk_file(self, json_file: Path) -> List[Chunk]:
+        """Read a scraped page and create its chunks, logging and skipping unreadable files."""
+        self.logger.debug(f"Processing: {json_file.name}")
+        try:
+            doc = read_json_file(json_file)
+            return self._chunk_document(doc)
+        except Exception as e:
+            self.logger.error(f"Error processing {json_file}: {e}")
+            return []
+    
     def _process_document(self, doc: Dict[str, Any]) -> None:
         """Process a single document and create all chunk levels."""
+        self.chunks.extend(self._chunk_document(doc))
+    
+    def _chunk_document(self, doc: Dict[str, Any]) -> List[Chunk]:
+        """Create all chunk levels for a single document."""
         page_title = doc.get('title', 'Unknown')
         url = doc.get('url', '')
         sections = doc.get('sections', [])
         
         if not sections:
             self.logger.warning(f"No sections found in document: {page_title}")
-            return
+            return []
         
-        # Create chunks using different strategies
+        # Create chunks using different strategies, sharing one flattened copy of the sections
         try:
-            large_chunks = self.large_strategy.create_chunks(page_title, url, sections)
-            medium_chunks = self.medium_strategy.create_chunks(page_title, url, sections)
-            small_chunks = self.small_strategy.create_chunks(page_title, url, sections)
+            doc_sections = FlatDoc.from_sections(url, sections)
+            large_chunks = self.large_strategy.create_chunks(page_title, url, doc_sections)
+            medium_chunks = self.medium_strategy.create_chunks(page_title, url, doc_sections)
+            small_chunks = self.small_strategy.create_chunks(page_title, url, doc_sections)
             
-            # Add all chunks to the collection
-            self.chunks.extend(large_chunks)
-            self.chunks.extend(medium_chunks)
-            self.chunks.extend(small_chunks)
+            return large_chunks + medium_chunks + small_chunks
             
         except Exception as e:
             self.logger.error(f"Error chunking document {page_title}: {e}")
+            return []
     
     def save_chunks(self, output_file: Optional[str] = None) -> None:
-        """Save chunks to JSON file."""
+        """Save chunks to JSON file, or to JSONL if the file name ends in .jsonl."""
         if output_file is None:
             output_file = self.config.chunks_file
         else:
             output_file = Path(output_file)
         
+        if output_file.suffix == '.jsonl':
+            self.save_chunks_jsonl(output_file)
+            return
+        
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        
+        chunks_data = list(self._chunk_records())
+        
+        with open(output_file, 'wb') as f:
+            f.write(dumps_json(chunks_data, indent=True))
+        
+        self.logger.info(f"Saved {len(chunks_data)} chunks to {output_file}")
+    
+    def save_chunks_jsonl(self, output_file: Optional[str] = None) -> None:
+        """Save chunks to a JSONL file with a byte offset sidecar for memory-mapped loading."""
+        if output_file is None:
+            output_file = self.config.chunks_file.with_suffix('.jsonl')
+        else:
+            output_file = Path(output_file)
+        
         output_file.parent.mkdir(parents=True, exist_ok=True)
         
-        chunks_data = []
+        count = write_chunks_jsonl(self._chunk_records(), output_file)
+        
+        self.logger.info(f"Saved {count} chunks to {output_file}")
+    
+    def _chunk_records(self):
+        """Yield chunks as plain dicts for serialization."""
         for chunk in self.chunks:
-            chunks_data.append({
+            yield {
                 'page_title': chunk.page_title,
                 'section_path': chunk.section_path,
                 'content': chunk.content,
@@ -102,15 +173,13 @@ class DocumentChunker:
                 'url': chunk.url,
                 'chunk_type': chunk.chunk_type,
                 'section_level': chunk.section_level
-            })
-        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(chunks_data, f, indent=2, ensure_ascii=False)
-        
-        self.logger.info(f"Saved {len(chunks_data)} chunks to {output_file}")
+            }
     
     def load_chunks(self, input_file: Optional[str] = None) -> List[Chunk]:
-        """Load chunks from JSON file."""
+        """Load chunks from JSON file.
+        
+        JSONL files are memory-mapped instead, and chunks are decoded lazily on access.
+        """
         if input_file is None:
             input_file = self.config.chunks_file
         else:
@@ -119,8 +188,12 @@ class DocumentChunker:
         if not input_file.exists():
             raise FileNotFoundError(f"Chunks file not found: {input_file}")
         
-        with open(input_file, 'r', encoding='utf-8') as f:
-            chunks_data = json.load(f)
+        if input_file.suffix == '.jsonl':
+            self.chunks = ChunkFile(input_file)
+            self.logger.info(f"Mapped {len(self.chunks)} chunks from {input_file}")
+            return self.chunks
+        
+        chunks_data = read_json_file(input_file)
         
         self.chunks = []
         for chunk_data in chunks_data:
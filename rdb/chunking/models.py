@@ -3,6 +3,7 @@ Data models for chunking module.
 """
 
 from dataclasses import dataclass
+from typing import List, Dict, Any
 
 
 @dataclass
@@ -15,3 +16,30 @@ class Chunk:
     url: str
     chunk_type: str
     section_level: int
+
+
+@dataclass
+class FlatDoc:
+    """Document sections flattened once into parallel lists, shared by all strategies."""
+    titles: List[str]
+    contents: List[str]
+    levels: List[int]
+    section_urls: List[str]
+    has_content: List[bool]
+    
+    @classmethod
+    def from_sections(cls, url: str, sections: List[Dict[str, Any]]) -> 'FlatDoc':
+        """Flatten a list of section dicts from a scraped document."""
+        titles = [section.get('title', 'Untitled') for section in sections]
+        contents = [section.get('content', '') for section in sections]
+        
+        return cls(
+            titles=titles,
+            contents=contents,
+            levels=[section.get('level', 1) for section in sections],
+            section_urls=[url + "#" + title.replace(' ', '_').replace('/', '') for title in titles],
+            has_content=[bool(content.strip()) for content in contents]
+        )
+    
+    def __len__(self) -> int:
+        return len(self.titles)
@@ -4,10 +4,19 @@ Chunking strategies for different chunk sizes.
 
 import re
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 
 from ..config.settings import Config
-from .models import Chunk
+from .models import Chunk, FlatDoc
+
+
+# Paragraphs treated as code/commands in small chunks. Plain str methods on these
+# are several times faster than an equivalent precompiled regex for this test.
+CODE_FENCE = '```'
+COMMAND_PREFIXES = ('$ ', '# ')
+
+# A code paragraph is merged into the previous unit if that unit is shorter than this
+CODE_MERGE_MAX_LENGTH = 200
 
 
 class ChunkingStrategy(ABC):
@@ -18,51 +27,54 @@ class ChunkingStrategy(ABC):
         self.config = config
     
     @abstractmethod
-    def create_chunks(self, page_title: str, url: str, sections: List[Dict]) -> List[Chunk]:
+    def create_chunks(self, page_title: str, url: str, sections: Union[FlatDoc, List[Dict]]) -> List[Chunk]:
         """Create chunks from document sections."""
         pass
     
-    def _build_section_path(self, sections: List[Dict], current_section: Dict) -> str:
+    def _flatten(self, url: str, sections: Union[FlatDoc, List[Dict]]) -> FlatDoc:
+        """Get sections as a FlatDoc, flattening a list of section dicts if needed."""
+        if isinstance(sections, FlatDoc):
+            return sections
+        return FlatDoc.from_sections(url, sections)
+    
+    def _build_section_path(self, doc: FlatDoc, index: int) -> str:
         """Build hierarchical section path."""
         # For now, just use the section title
         # TODO: Implement proper hierarchy building if needed
-        return current_section.get('title', 'Untitled')
+        return doc.titles[index]
 
 
 class SmallChunkStrategy(ChunkingStrategy):
     """Strategy for creating small chunks (paragraphs/logical units)."""
     
-    def create_chunks(self, page_title: str, url: str, sections: List[Dict]) -> List[Chunk]:
+    def create_chunks(self, page_title: str, url: str, sections: Union[FlatDoc, List[Dict]]) -> List[Chunk]:
         """Create small chunks by splitting sections into logical units."""
+        doc = self._flatten(url, sections)
         chunks = []
         
-        for section in sections:
-            section_title = section.get('title', 'Untitled')
-            section_content = section.get('content', '')
-            section_level = section.get('level', 1)
-            
-            if not section_content.strip():
+        for i in range(len(doc)):
+            if not doc.has_content[i]:
                 continue
             
-            section_path = self._build_section_path(sections, section)
-            section_anchor = section_title.replace(' ', '_').replace('/', '')
-            section_url = url + f"#{section_anchor}"
+            section_path = self._build_section_path(doc, i)
+            section_url = doc.section_urls[i]
+            section_level = doc.levels[i]
+            
+            # Context prefix shared by every unit of this section
+            prefix = f"{page_title} - {section_path}: "
             
             # Split section into small units
-            small_units = self._split_into_small_units(section_content)
+            small_units = self._split_into_small_units(doc.contents[i])
             
             for unit in small_units:
                 if not unit.strip():
                     continue
                 
-                # Create chunk text with context
-                chunk_text = f"{page_title} - {section_path}: {unit}"
-                
                 chunks.append(Chunk(
                     page_title=page_title,
                     section_path=section_path,
                     content=unit,
-                    chunk_text=chunk_text,
+                    chunk_text=prefix + unit,
                     url=section_url,
                     chunk_type="small",
                     section_level=section_level
@@ -72,45 +84,50 @@ class SmallChunkStrategy(ChunkingStrategy):
     
     def _split_into_small_units(self, content: str) -> List[str]:
         """Split section content into small logical units."""
-        # Split by double newlines (paragraphs)
-        paragraphs = content.split('\n\n')
-        
         units = []
-        current_unit = ""
         
-        for paragraph in paragraphs:
+        # Paragraphs of the unit being built, with its length as if joined
+        current_parts: List[str] = []
+        current_len = 0
+        max_len = self.config.chunk_size_small
+        
+        # Split by double newlines (paragraphs)
+        for paragraph in content.split('\n\n'):
             paragraph = paragraph.strip()
             if not paragraph:
                 continue
             
             # Handle code blocks specially
-            if '```' in paragraph or paragraph.startswith('$ ') or paragraph.startswith('# '):
+            if CODE_FENCE in paragraph or paragraph.startswith(COMMAND_PREFIXES):
                 # Code block - keep with surrounding context
-                if current_unit:
-                    units.append(current_unit + '\n\n' + paragraph)
-                    current_unit = ""
+                if current_parts:
+                    current_parts.append(paragraph)
+                    units.append('\n\n'.join(current_parts))
+                    current_parts = []
+                    current_len = 0
                 else:
                     # Check if previous unit is short, merge with it
-                    if units and len(units[-1]) < 200:
+                    if units and len(units[-1]) < CODE_MERGE_MAX_LENGTH:
                         units[-1] = units[-1] + '\n\n' + paragraph
                     else:
                         units.append(paragraph)
             else:
                 # Regular paragraph
-                if current_unit and len(current_unit + paragraph) > self.config.chunk_size_small:
+                if current_parts and current_len + len(paragraph) > max_len:
                     # Current unit would be too long, save and start new
-                    units.append(current_unit)
-                    current_unit = paragraph
+                    units.append('\n\n'.join(current_parts))
+                    current_parts = [paragraph]
+                    current_len = len(paragraph)
                 else:
                     # Add to current unit
-                    if current_unit:
-                        current_unit += '\n\n' + paragraph
-                    else:
-                        current_unit = paragraph
+                    if current_parts:
+                        current_len += 2
+                    current_parts.append(paragraph)
+                    current_len += len(paragraph)
         
         # Save final unit
-        if current_unit:
-            units.append(current_unit)
+        if current_parts:
+            units.append('\n\n'.join(current_parts))
         
         return units
 
@@ -118,36 +135,30 @@ class SmallChunkStrategy(ChunkingStrategy):
 class MediumChunkStrategy(ChunkingStrategy):
     """Strategy for creating medium chunks (full sections)."""
     
-    def create_chunks(self, page_title: str, url: str, sections: List[Dict]) -> List[Chunk]:
+    def create_chunks(self, page_title: str, url: str, sections: Union[FlatDoc, List[Dict]]) -> List[Chunk]:
         """Create medium chunks from individual sections."""
+        doc = self._flatten(url, sections)
         chunks = []
         
-        for section in sections:
-            section_title = section.get('title', 'Untitled')
-            section_content = section.get('content', '')
-            section_level = section.get('level', 1)
-            
-            if not section_content.strip():
+        for i in range(len(doc)):
+            if not doc.has_content[i]:
                 continue
             
             # Build section path
-            section_path = self._build_section_path(sections, section)
+            section_path = self._build_section_path(doc, i)
+            section_content = doc.contents[i]
             
             # Create chunk text with full context
             chunk_text = f"{page_title} - {section_path}: {section_content}"
             
-            # Create URL with section anchor
-            section_anchor = section_title.replace(' ', '_').replace('/', '')
-            section_url = url + f"#{section_anchor}"
-            
             chunks.append(Chunk(
                 page_title=page_title,
                 section_path=section_path,
                 content=section_content,
                 chunk_text=chunk_text,
-                url=section_url,
+                url=doc.section_urls[i],
                 chunk_type="medium",
-                section_level=section_level
+                section_level=doc.levels[i]
             ))
         
         return chunks
@@ -156,17 +167,18 @@ class MediumChunkStrategy(ChunkingStrategy):
 class LargeChunkStrategy(ChunkingStrategy):
     """Strategy for creating large chunks (grouped sections or full pages)."""
     
-    def create_chunks(self, page_title: str, url: str, sections: List[Dict]) -> List[Chunk]:
+    def create_chunks(self, page_title: str, url: str, sections: Union[FlatDoc, List[Dict]]) -> List[Chunk]:
         """Create large chunks by grouping sections or using entire page."""
+        doc = self._flatten(url, sections)
         chunks = []
         
         # Get major sections (level 1 and 2)
-        major_sections = [s for s in sections if s.get('level', 1) <= 2]
+        major_sections = [i for i, level in enumerate(doc.levels) if level <= 2]
         
         if len(major_sections) <= 3:
             # Small page - use entire page as one large chunk
-            all_content = "\n\n".join([s.get('content', '') for s in sections])
-            all_titles = " > ".join([s.get('title', '') for s in major_sections[:3]])
+            all_content = "\n\n".join(doc.contents)
+            all_titles = " > ".join([doc.titles[i] for i in major_sections[:3]])
             
             chunk_text = f"{page_title}: {all_content}"
             
@@ -184,19 +196,19 @@ class LargeChunkStrategy(ChunkingStrategy):
             current_group = []
             current_group_title = ""
             
-            for section in sections:
-                if section.get('level', 1) == 1:
+            for i, level in enumerate(doc.levels):
+                if level == 1:
                     # Save previous group if exists
                     if current_group:
                         self._save_large_chunk_group(
                             page_title, url, current_group_title, current_group, chunks
                         )
                     # Start new group
-                    current_group = [section]
-                    current_group_title = section.get('title', '')
-                elif section.get('level', 1) == 2 and current_group:
+                    current_group = [doc.contents[i]]
+                    current_group_title = doc.titles[i]
+                elif level == 2 and current_group:
                     # Add to current group
-                    current_group.append(section)
+                    current_group.append(doc.contents[i])
             
             # Save final group
             if current_group:
@@ -207,22 +219,23 @@ class LargeChunkStrategy(ChunkingStrategy):
         return chunks
     
     def _save_large_chunk_group(self, page_title: str, url: str, group_title: str, 
-                               group_sections: List[Dict], chunks: List[Chunk]) -> None:
+                               group_contents: List[str], chunks: List[Chunk]) -> None:
         """Save a group of sections as a large chunk."""
-        group_content = "\n\n".join([s.get('content', '') for s in group_sections])
+        group_content = "\n\n".join(group_contents)
         
         # Don't create empty chunks
         if not group_content.strip():
             return
         
         chunk_text = f"{page_title} - {group_title}: {group_content}"
+        group_anchor = group_title.replace(' ', '_')
         
         chunks.append(Chunk(
             page_title=page_title,
             section_path=group_title,
             content=group_content,
             chunk_text=chunk_text,
-            url=url + f"#{group_title.replace(' ', '_')}",
+            url=f"{url}#{group_anchor}",
             chunk_type="large",
             section_level=1
         ))
@@ -3,11 +3,28 @@ Configuration management for RDB.
 """
 
 import os
-import torch
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
 
+DATA_SUBDIRS = ("raw", "chunks", "index", "cache")
+
+
+@lru_cache(maxsize=None)
+def _ensure_data_dirs(data_dir: Path) -> None:
+   """Create the data subdirectories, once per data directory per process."""
+   for name in DATA_SUBDIRS:
+       (data_dir / name).mkdir(parents=True, exist_ok=True)
+
+
+@lru_cache(maxsize=1)
+def _cuda_available() -> bool:
+   """Check for CUDA once per process; the probe initializes the driver."""
+   import torch
+   return torch.cuda.is_available()
+
+
 class Config:
    """Configuration settings for RDB."""
    
@@ -54,40 +71,84 @@ class Config:
        self.cache_dir = self.data_dir / "cache"
        
        # Create directories
-       for dir_path in [self.raw_data_dir, self.chunks_dir, self.index_dir, self.cache_dir]:
-           dir_path.mkdir(parents=True, exist_ok=True)
+       _ensure_data_dirs(self.data_dir)
        
        # Scraping settings
        self.scrape_delay_min = float(os.getenv("RDB_SCRAPE_DELAY_MIN", "1.0"))
        self.scrape_delay_max = float(os.getenv("RDB_SCRAPE_DELAY_MAX", "3.0"))
        self.scrape_max_retries = int(os.getenv("RDB_SCRAPE_MAX_RETRIES", "3"))
+       # Concurrent page fetches, each waiting its own scrape delay between requests, so the
+       # request rate grows with the worker count; more than 1 is opt-in to spare the wiki
+       self.scrape_workers = int(os.getenv("RDB_SCRAPE_WORKERS", "1"))
+       self.compress_raw_pages = os.getenv("RDB_COMPRESS_RAW_PAGES", "true").lower() == "true"
+       # Append scraped pages to one pages.jsonl instead of writing a file per page
+       self.raw_pages_jsonl = os.getenv("RDB_RAW_PAGES_JSONL", "false").lower() == "true"
        
        # Chunking settings
        self.chunk_size_small = int(os.getenv("RDB_CHUNK_SIZE_SMALL", "300"))
        self.chunk_size_medium = int(os.getenv("RDB_CHUNK_SIZE_MEDIUM", "800"))
        self.chunk_size_large = int(os.getenv("RDB_CHUNK_SIZE_LARGE", "2000"))
        self.chunk_overlap = int(os.getenv("RDB_CHUNK_OVERLAP", "50"))
+       self.chunk_workers = int(os.getenv("RDB_CHUNK_WORKERS", str(os.cpu_count() or 1)))
        
        # Embedding settings
        self.embedding_model = os.getenv("RDB_EMBEDDING_MODEL", "intfloat/e5-large-v2")
        self.embedding_batch_size = int(os.getenv("RDB_EMBEDDING_BATCH_SIZE", "32"))
-       gpu_available = torch.cuda.is_available()
-       self.use_gpu = os.getenv("RDB_USE_GPU", str(gpu_available)).lower() == "true"
-       self.device = "cuda" if self.use_gpu else "cpu"
+       self.embedding_cache = os.getenv("RDB_EMBEDDING_CACHE", "true").lower() == "true"
+       self.embedding_half_precision = os.getenv("RDB_EMBEDDING_HALF_PRECISION", "true").lower() == "true"
+       # Query encoding only (none or int8, CPU); passages keep full precision so the
+       # index and embedding cache stay exact
+       self.embedding_quantize = os.getenv("RDB_EMBEDDING_QUANTIZE", "none").lower()
+       # Compiling takes seconds at startup, so it pays off only in long-running processes
+       self.embedding_compile = os.getenv("RDB_EMBEDDING_COMPILE", "false").lower() == "true"
+       # GPU detection imports torch, so it is deferred until first needed
+       self._use_gpu: Optional[bool] = None
+       self._device: Optional[str] = None
+       
+       # Index settings: flat below the HNSW threshold, HNSW up to the IVF-PQ threshold
+       self.index_hnsw_threshold = int(os.getenv("RDB_INDEX_HNSW_THRESHOLD", "10000"))
+       self.index_ivfpq_threshold = int(os.getenv("RDB_INDEX_IVFPQ_THRESHOLD", "200000"))
+       self.hnsw_m = int(os.getenv("RDB_HNSW_M", "32"))
+       self.hnsw_ef_construction = int(os.getenv("RDB_HNSW_EF_CONSTRUCTION", "200"))
+       self.hnsw_ef_search = int(os.getenv("RDB_HNSW_EF_SEARCH", "64"))
+       self.ivf_nlist = int(os.getenv("RDB_IVF_NLIST", "4096"))
+       self.ivf_pq_m = int(os.getenv("RDB_IVF_PQ_M", "64"))
+       self.ivf_pq_nbits = int(os.getenv("RDB_IVF_PQ_NBITS", "8"))
+       self.ivf_nprobe = int(os.getenv("RDB_IVF_NPROBE", "16"))
+       self.index_quantization = os.getenv("RDB_INDEX_QUANTIZATION", "none").lower()  # none, sq8 or pq
+       self.mmap_index = os.getenv("RDB_MMAP_INDEX", "true").lower() == "true"
+       # GPU search index when use_gpu is set: a copy of the index, or a CAGRA graph (cuVS builds)
+       self.gpu_index_type = os.getenv("RDB_GPU_INDEX", "mirror").lower()  # mirror or cagra
        
        # Retrieval settings
        self.default_top_k = int(os.getenv("RDB_DEFAULT_TOP_K", "5"))
        self.enable_query_refinement = os.getenv("RDB_ENABLE_QUERY_REFINEMENT", "false").lower() == "true"
+       # Off ranks by raw cosine similarity, e.g. for evaluating the embedding model alone
+       self.enable_score_boosting = os.getenv("RDB_ENABLE_SCORE_BOOSTING", "true").lower() == "true"
+       self.query_cache_size = int(os.getenv("RDB_QUERY_CACHE_SIZE", "1024"))
+       # Answer near-identical queries from recent results; off by default since
+       # a cached answer can differ slightly from what a fresh search would return
+       self.enable_semantic_cache = os.getenv("RDB_ENABLE_SEMANTIC_CACHE", "false").lower() == "true"
+       self.semantic_cache_threshold = float(os.getenv("RDB_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+       self.semantic_cache_size = int(os.getenv("RDB_SEMANTIC_CACHE_SIZE", "256"))
        
        # Query refinement settings
        self.refiner_model = os.getenv("RDB_REFINER_MODEL", None)
        self.refiner_max_tokens = int(os.getenv("RDB_REFINER_MAX_TOKENS", "30"))
-       self.refiner_temperature = float(os.getenv("RDB_REFINER_TEMPERATURE", "0.7"))
+       self.refiner_quant = os.getenv("RDB_REFINER_QUANT", "none").lower()  # none or nf4 (GPU only)
+       # Compiling pays off in long-running processes; each CLI/web search is a fresh process
+       self.refiner_compile = os.getenv("RDB_REFINER_COMPILE", "false").lower() == "true"
+       # Only used on CPUs with native bf16 (AVX-512 BF16 or AMX); others stay on float32
+       self.refiner_cpu_bf16 = os.getenv("RDB_REFINER_CPU_BF16", "true").lower() == "true"
        
        # File paths
-       self.chunks_file = self.chunks_dir / "chunks.json"
+       self.chunks_file = self.chunks_dir / "chunks.jsonl"  # JSON arrays are still read from .json paths
+       # A chunks.json saved before the switch to JSONL stays in use until it is removed
+       legacy_chunks_file = self.chunks_dir / "chunks.json"
+       if not self.chunks_file.exists() and legacy_chunks_file.exists():
+           self.chunks_file = legacy_chunks_file
        self.index_file = self.index_dir / "index.faiss"
-       self.metadata_file = self.index_dir / "metadata.pkl"
+       self.metadata_file = self.index_dir / "metadata.pkl"  # legacy; new builds write metadata.parquet
        
        # Logging
        self.log_level = os.getenv("RDB_LOG_LEVEL", "INFO")
@@ -97,6 +158,31 @@ class Config:
        self.user_agent = os.getenv("RDB_USER_AGENT", 
            "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
    
+   @property
+   def use_gpu(self) -> bool:
+       """Whether to use the GPU, from RDB_USE_GPU or CUDA availability."""
+       if self._use_gpu is None:
+           env_value = os.getenv("RDB_USE_GPU")
+           if env_value is None:
+               env_value = str(_cuda_available())
+           self._use_gpu = env_value.lower() == "true"
+       return self._use_gpu
+
+   @use_gpu.setter
+   def use_gpu(self, value: bool) -> None:
+       self._use_gpu = value
+
+   @property
+   def device(self) -> str:
+       """Torch device name for models."""
+       if self._device is None:
+           self._device = "cuda" if self.use_gpu else "cpu"
+       return self._device
+
+   @device.setter
+   def device(self, value: str) -> None:
+       self._device = value
+
    def get_cache_path(self, cache_type: str, identifier: str) -> Path:
        """Get cache file path for a specific cache type and identifier."""
        cache_subdir = self.cache_dir / cache_type
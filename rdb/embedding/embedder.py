@@ -2,21 +2,42 @@
 Document embedder for creating vector representations.
 """
 
-import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from itertools import islice
+
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
-import pickle
 from pathlib import Path
-from typing import List, Optional
-from tqdm import tqdm
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
 from ..config.settings import Config
 from ..utils.logging import get_logger
+from ..utils.helpers import read_json_file
 from ..chunking.chunker import Chunk
+from ..chunking.chunk_file import ChunkFile
+from ..retrieval.index_manager import create_index, save_metadata
 from .models import EmbeddingModel
 
 
+# Chunks passed to each encode call; bounds the prefixed texts held in memory at once
+ENCODE_BLOCK_SIZE = 8192
+
+
+@dataclass
+class _TextBlock:
+   """One block of chunk rows, split by where each row's embedding comes from."""
+   rows: List[int] = field(default_factory=list)
+   texts: List[str] = field(default_factory=list)
+   cached_rows: List[int] = field(default_factory=list)
+   cache_rows: List[int] = field(default_factory=list)
+   duplicate_rows: List[int] = field(default_factory=list)
+   source_rows: List[int] = field(default_factory=list)
+
+
 class DocumentEmbedder:
    """Creates embeddings for document chunks and builds search index."""
    
@@ -24,12 +45,14 @@ class DocumentEmbedder:
        """Initialize document embedder with configuration."""
        self.config = config
        self.logger = get_logger(__name__)
-       self.model = EmbeddingModel(config.embedding_model, device=config.device)
-       self.chunks: Optional[List[dict]] = None
+       self.model = EmbeddingModel(config.embedding_model, device=config.device,
+                                            half_precision=config.embedding_half_precision,
+                                            compile_model=config.embedding_compile)
+       self.chunks: Optional[Sequence] = None
        self.index: Optional[faiss.Index] = None
    
-   def load_chunks(self, chunks_file: Optional[str] = None) -> List[dict]:
-       """Load chunks from JSON file."""
+   def load_chunks(self, chunks_file: Optional[str] = None) -> Sequence:
+       """Load chunks from a JSON file, or memory-map a JSONL file."""
        if chunks_file is None:
            chunks_file = self.config.chunks_file
        else:
@@ -37,31 +60,91 @@ class DocumentEmbedder:
        
        self.logger.info(f"Loading chunks from {chunks_file}...")
        
-       with open(chunks_file, 'r', encoding='utf-8') as f:
-           self.chunks = json.load(f)
+       if chunks_file.suffix == '.jsonl':
+           # Records are decoded as they are read, so memory doesn't grow with the corpus
+           self.chunks = ChunkFile(chunks_file)
+       else:
+           self.chunks = read_json_file(chunks_file)
        
        self.logger.info(f"Loaded {len(self.chunks)} chunks")
        return self.chunks
    
-   def create_embeddings(self, chunks: Optional[List] = None, batch_size: Optional[int] = None) -> np.ndarray:
-       """Create embeddings for all chunks."""
-       if chunks is not None:
-           # Convert Chunk objects to dict if needed
-           if chunks and hasattr(chunks[0], 'chunk_text'):
-               self.chunks = [
-                   {
-                       'page_title': chunk.page_title,
-                       'section_path': chunk.section_path,
-                       'content': chunk.content,
-                       'chunk_text': chunk.chunk_text,
-                       'url': chunk.url,
-                       'chunk_type': chunk.chunk_type,
-                       'section_level': chunk.section_level
-                   }
-                   for chunk in chunks
-               ]
+   def _chunk_records(self) -> Iterator[dict]:
+       """Iterate over loaded chunks as dicts."""
+       if isinstance(self.chunks, ChunkFile):
+           return self.chunks.iter_records()
+       # Chunk dataclass fields, read straight from the instance dict without copying
+       return (chunk.__dict__ if isinstance(chunk, Chunk) else chunk for chunk in self.chunks)
+   
+   def _read_text_block(self, records: Iterator[dict], start: int, seen: Dict[bytes, int],
+                        cached: Dict[bytes, int], digests: List[bytes]) -> "_TextBlock":
+       """Take the next block of chunks as passage texts, splitting off ones already embedded."""
+       block = _TextBlock()
+       for row, chunk in enumerate(islice(records, ENCODE_BLOCK_SIZE), start):
+           # Use chunk_text which has context, add e5's required prefix
+           text = f"passage: {chunk['chunk_text']}"
+           # Keyed by digest so the full texts of the corpus aren't kept in memory
+           digest = blake2b(text.encode('utf-8'), digest_size=16).digest()
+           digests.append(digest)
+           
+           source = seen.setdefault(digest, row)
+           if source != row:
+               block.duplicate_rows.append(row)
+               block.source_rows.append(source)
+           elif digest in cached:
+               block.cached_rows.append(row)
+               block.cache_rows.append(cached[digest])
            else:
-               self.chunks = chunks
+               block.rows.append(row)
+               block.texts.append(text)
+       return block
+   
+   def _embedding_cache_file(self) -> Path:
+       """Get the embedding cache file for the current model."""
+       model_key = hashlib.sha256(self.config.embedding_model.encode('utf-8')).hexdigest()[:16]
+       return self.config.get_cache_path("embeddings", model_key)
+   
+   def _load_embedding_cache(self) -> Tuple[Dict[bytes, int], Optional[np.ndarray]]:
+       """Load cached embeddings from the last build with this model, keyed by text digest."""
+       cache_file = self._embedding_cache_file()
+       if not self.config.embedding_cache or not cache_file.exists():
+           return {}, None
+       
+       try:
+           with np.load(cache_file) as data:
+               cache_digests, cache_embeddings = data['digests'], data['embeddings']
+       except Exception as e:
+           self.logger.warning(f"Ignoring unreadable embedding cache {cache_file}: {e}")
+           return {}, None
+       
+       if cache_embeddings.shape[1] != self.model.dimension:
+           return {}, None
+       
+       return {digest.tobytes(): i for i, digest in enumerate(cache_digests)}, cache_embeddings
+   
+   def _save_embedding_cache(self, digests: List[bytes], embeddings: np.ndarray) -> None:
+       """Save this build's embeddings by text digest, replacing the previous cache."""
+       if not self.config.embedding_cache:
+           return
+       
+       cache_file = self._embedding_cache_file()
+       tmp_file = cache_file.with_suffix('.tmp')
+       try:
+           with open(tmp_file, 'wb') as f:
+               np.savez(f, digests=np.frombuffer(b''.join(digests), dtype=np.uint8).reshape(-1, 16),
+                        embeddings=embeddings)
+           tmp_file.replace(cache_file)
+       except Exception as e:
+           self.logger.warning(f"Failed to save embedding cache: {e}")
+   
+   def create_embeddings(self, chunks: Optional[Sequence] = None, batch_size: Optional[int] = None) -> np.ndarray:
+       """Create L2-normalized embeddings for all chunks.
+       
+       Texts embedded by the previous build with the same model are taken from the cache.
+       """
+       if chunks is not None:
+           # Chunk objects are kept as-is; _chunk_records views them as dicts when needed
+           self.chunks = chunks
        
        if not self.chunks:
            raise ValueError("No chunks loaded. Call load_chunks() first or provide chunks.")
@@ -69,46 +152,75 @@ class DocumentEmbedder:
        if batch_size is None:
            batch_size = self.config.embedding_batch_size
        
-       self.logger.info("Preparing documents for embedding...")
-       
-       documents = []
-       for chunk in self.chunks:
-           # Use chunk_text which has context, add e5's required prefix
-           doc_text = f"passage: {chunk['chunk_text']}"
-           documents.append(doc_text)
+       num_chunks = len(self.chunks)
+       self.logger.info(f"Creating embeddings for {num_chunks} documents...")
        
-       self.logger.info(f"Creating embeddings for {len(documents)} documents...")
+       embeddings = np.empty((num_chunks, self.model.dimension), dtype=np.float32)
+       records = self._chunk_records()
+       seen: Dict[bytes, int] = {}
+       digests: List[bytes] = []
+       cached, cache_embeddings = self._load_embedding_cache()
+       num_duplicates = 0
+       num_cached = 0
        
-       # Create embeddings in batches
-       all_embeddings = []
-       for i in tqdm(range(0, len(documents), batch_size), desc="Embedding batches"):
-           batch = documents[i:i + batch_size]
-           batch_embeddings = self.model.encode(batch)
-           all_embeddings.append(batch_embeddings)
+       # Each block is one encode call, so sentence-transformers still sorts by length
+       # and batches internally; normalized on the model's device, so build_index can
+       # skip a CPU pass. The next block is decoded and prefixed in a background thread
+       # while the model encodes the current one. Identical texts are encoded once.
+       with ThreadPoolExecutor(max_workers=1) as prefetcher:
+           read_args = (seen, cached, digests)
+           next_block = prefetcher.submit(self._read_text_block, records, 0, *read_args)
+           for start in range(0, num_chunks, ENCODE_BLOCK_SIZE):
+               block = next_block.result()
+               if start + ENCODE_BLOCK_SIZE < num_chunks:
+                   next_block = prefetcher.submit(self._read_text_block, records,
+                                                  start + ENCODE_BLOCK_SIZE, *read_args)
+               
+               if block.texts:
+                   embeddings[block.rows] = self.model.encode(
+                       block.texts,
+                       batch_size=batch_size,
+                       show_progress_bar=True,
+                       normalize_embeddings=True
+                   )
+               if block.cached_rows:
+                   embeddings[block.cached_rows] = cache_embeddings[block.cache_rows]
+                   num_cached += len(block.cached_rows)
+               # Sources are in this or an earlier block, so already filled in
+               if block.duplicate_rows:
+                   embeddings[block.duplicate_rows] = embeddings[block.source_rows]
+                   num_duplicates += len(block.duplicate_rows)
        
-       # Combine all embeddings
-       embeddings = np.vstack(all_embeddings)
+       if num_cached:
+           self.logger.info(f"Reused cached embeddings for {num_cached} unchanged chunk texts")
+       if num_duplicates:
+           self.logger.info(f"Reused embeddings for {num_duplicates} duplicate chunk texts")
        self.logger.info(f"Created embeddings: shape {embeddings.shape}")
        
+       self._save_embedding_cache(digests, embeddings)
+       
        return embeddings
    
-   def build_index(self, embeddings: np.ndarray) -> faiss.Index:
-       """Build FAISS index from embeddings."""
+   def build_index(self, embeddings: np.ndarray, normalize: bool = True) -> faiss.Index:
+       """Build FAISS index from embeddings.
+       
+       Pass normalize=False for embeddings from create_embeddings, which are already normalized.
+       """
        self.logger.info("Building FAISS index...")
        
        dimension = embeddings.shape[1]
        self.logger.info(f"Vector dimension: {dimension}")
        
-       # Use IndexFlatIP for inner product (cosine similarity after normalization)
-       self.index = faiss.IndexFlatIP(dimension)
+       embeddings = np.ascontiguousarray(embeddings, dtype='float32')
        
-       # Normalize embeddings for cosine similarity
-       self.logger.info("Normalizing embeddings...")
-       faiss.normalize_L2(embeddings)
+       # Normalize embeddings for cosine similarity (inner product on unit vectors)
+       if normalize:
+           self.logger.info("Normalizing embeddings...")
+           faiss.normalize_L2(embeddings)
        
-       # Add to index
+       # Flat, HNSW or IVF-PQ depending on corpus size
        self.logger.info("Adding embeddings to index...")
-       self.index.add(embeddings.astype('float32'))
+       self.index = create_index(embeddings, self.config)
        
        self.logger.info(f"Index built with {self.index.ntotal} vectors")
        return self.index
@@ -123,14 +235,12 @@ class DocumentEmbedder:
        output_dir.mkdir(parents=True, exist_ok=True)
        
        index_file = output_dir / "index.faiss"
-       metadata_file = output_dir / "metadata.pkl"
        
        self.logger.info(f"Saving index to {index_file}...")
        faiss.write_index(self.index, str(index_file))
        
-       self.logger.info(f"Saving metadata to {metadata_file}...")
-       with open(metadata_file, 'wb') as f:
-           pickle.dump(self.chunks, f)
+       metadata_file = save_metadata(self._chunk_records(), output_dir)
+       self.logger.info(f"Saved metadata to {metadata_file}")
        
        self.logger.info("Index and metadata saved!")
        return str(index_file), str(metadata_file)
@@ -145,7 +255,7 @@ class DocumentEmbedder:
        embeddings = self.create_embeddings()
        
        # Build index
-       self.build_index(embeddings)
+       self.build_index(embeddings, normalize=False)
        
        # Save index
        return self.save_index(output_dir)
@@ -2,6 +2,7 @@
 Embedding model management for RDB.
 """
 
+from functools import lru_cache
 from sentence_transformers import SentenceTransformer
 import torch
 from typing import List, Union
@@ -13,8 +14,14 @@ from ..utils.logging import get_logger
 class EmbeddingModel:
    """Wrapper for sentence transformer models."""
    
-   def __init__(self, model_name: str = 'intfloat/e5-large-v2', device: str = 'cpu'):
-       """Initialize embedding model."""
+   def __init__(self, model_name: str = 'intfloat/e5-large-v2', device: str = 'cpu',
+                half_precision: bool = True, query_cache_size: int = 1024, quantize: str = "none",
+                compile_model: bool = False):
+       """Initialize embedding model, in BF16/FP16 on CUDA when half_precision is set.
+       
+       quantize="int8" runs the model's linear layers with dynamic int8 weights on CPU.
+       compile_model compiles the transformer forward pass with torch.compile.
+       """
        self.model_name = model_name
        self.device = device
        self.logger = get_logger(__name__)
@@ -25,14 +32,48 @@ class EmbeddingModel:
        # Load model
        self.model = SentenceTransformer(model_name, device=device)
        
+       # Half precision uses tensor cores and halves activation memory on GPU
+       if half_precision and str(device).startswith('cuda'):
+           if torch.cuda.is_bf16_supported():
+               self.model.to(torch.bfloat16)
+           else:
+               self.model.half()
+           self.logger.info(f"Using {next(self.model.parameters()).dtype} weights")
+       
+       if quantize == "int8" and not str(device).startswith('cuda'):
+           self._quantize_int8()
+       elif quantize != "none":
+           self.logger.warning(f"Embedding quantization '{quantize}' not supported on {device}, ignoring it")
+       
+       if compile_model:
+           self._compile()
+       
        # Get model info
        self.dimension = self.model.get_sentence_embedding_dimension()
        self.max_seq_length = self.model.max_seq_length
        
+       # Per-instance LRU of query embeddings, so repeated queries skip the forward pass
+       self._encode_query_cached = lru_cache(maxsize=query_cache_size)(self._encode_query_text)
+       
        self.logger.info(f"Model loaded successfully!")
        self.logger.info(f"Embedding dimension: {self.dimension}")
        self.logger.info(f"Max sequence length: {self.max_seq_length}")
    
+   def _quantize_int8(self) -> None:
+       """Swap linear layers for dynamically quantized int8 ones (VNNI/AMX int8 matmuls on CPU)."""
+       from torch.ao.quantization import quantize_dynamic
+       
+       quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+       self.logger.info("Using dynamic int8 quantized linear layers")
+   
+   def _compile(self) -> None:
+       """Compile the transformer's forward pass and warm it up, so queries don't pay for tracing."""
+       self.logger.info("Compiling embedding model forward pass")
+       transformer = self.model[0].auto_model
+       # Batch size and sequence length vary per call, so trace with dynamic shapes
+       transformer.forward = torch.compile(transformer.forward, dynamic=True)
+       self.model.encode(["warmup"], convert_to_numpy=True)
+   
    def encode(self, texts: Union[str, List[str]], batch_size: int = 32, 
               show_progress_bar: bool = False, normalize_embeddings: bool = False) -> np.ndarray:
        """Encode texts into embeddings."""
@@ -47,17 +88,32 @@ class EmbeddingModel:
            convert_to_numpy=True
        )
        
-       return embeddings
+       # FAISS needs float32, whatever precision the model runs in
+       return np.asarray(embeddings, dtype=np.float32)
    
    def encode_query(self, query: str) -> np.ndarray:
-       """Encode a single query with proper prefix for e5 models."""
+       """Encode a single query with proper prefix for e5 models, L2-normalized."""
        if self.model_name.startswith('intfloat/e5'):
            # E5 models require "query: " prefix for queries
            query_text = f"query: {query}"
        else:
            query_text = query
        
-       return self.encode([query_text])[0]
+       return self._encode_query_cached(query_text)
+   
+   def _encode_query_text(self, query_text: str) -> np.ndarray:
+       """Encode one prefixed query; results are shared through the cache, so read-only."""
+       self.logger.debug(f"Query embedding cache miss: {query_text}")
+       embedding = self.encode([query_text], normalize_embeddings=True)[0]
+       embedding.setflags(write=False)
+       return embedding
+   
+   def encode_queries(self, queries: List[str], batch_size: int = 32) -> np.ndarray:
+       """Encode several queries in one batch with proper prefix for e5 models, L2-normalized."""
+       if self.model_name.startswith('intfloat/e5'):
+           queries = [f"query: {query}" for query in queries]
+       
+       return self.encode(queries, batch_size=batch_size, normalize_embeddings=True)
    
    def encode_passage(self, passage: str) -> np.ndarray:
        """Encode a single passage with proper prefix for e5 models."""
@@ -77,5 +133,6 @@ class EmbeddingModel:
            'dimension': self.dimension,
            'max_seq_length': self.max_seq_length,
            'is_cuda_available': torch.cuda.is_available(),
-           'current_device': str(self.model.device)
+           'current_device': str(self.model.device),
+           'query_cache': self._encode_query_cached.cache_info()._asdict()
        }
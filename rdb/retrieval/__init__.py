@@ -2,8 +2,25 @@
 Retrieval module for RDB.
 """
 
-from .retriever import DocumentRetriever
-from .refiner import QueryRefiner
-from .index_manager import IndexManager
+import importlib
+
+# Imported on first access so that index and metadata helpers can be used
+# without loading the embedding model stack (torch, sentence-transformers).
+_LAZY_IMPORTS = {
+   "DocumentRetriever": ".retriever",
+   "QueryRefiner": ".refiner",
+   "IndexManager": ".index_manager",
+}
+
+
+def __getattr__(name):
+   """Import retrieval components lazily on first attribute access."""
+   if name in _LAZY_IMPORTS:
+       module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+       value = getattr(module, name)
+       globals()[name] = value
+       return value
+   raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = ["DocumentRetriever", "QueryRefiner", "IndexManager"]
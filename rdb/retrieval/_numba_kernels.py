@@ -0,0 +1,67 @@
+"""
+Compiled ranking kernels for post-processing FAISS search results.
+
+Numba is optional; without it the same kernels run as vectorized NumPy.
+"""
+
+import numpy as np
+
+try:
+   from numba import njit, prange
+   NUMBA_AVAILABLE = True
+except ImportError:
+   NUMBA_AVAILABLE = False
+
+
+def _rank_topk_numpy(scores: np.ndarray, indices: np.ndarray, boost_flags: np.ndarray,
+                    query_boost: np.ndarray):
+   """Apply boosts and order each row by boosted score (NumPy fallback)."""
+   n = boost_flags.shape[0]
+   valid = (indices >= 0) & (indices < n)
+
+   if n:
+       row_boost = boost_flags[np.clip(indices, 0, n - 1)]
+   else:
+       row_boost = np.ones(indices.shape, dtype=np.float64)
+
+   boosted = np.where(valid, scores * row_boost * query_boost, -np.inf)
+   order = np.argsort(-boosted, axis=1, kind='stable')
+   return boosted, order
+
+
+if NUMBA_AVAILABLE:
+   @njit(parallel=True, cache=True)
+   def _rank_topk_numba(scores, indices, boost_flags, query_boost):
+       """Apply boosts and order each row by boosted score (compiled)."""
+       n_rows, k = scores.shape
+       n = boost_flags.shape[0]
+       boosted = np.empty((n_rows, k), dtype=np.float64)
+       order = np.empty((n_rows, k), dtype=np.int64)
+
+       for r in prange(n_rows):
+           for j in range(k):
+               idx = indices[r, j]
+               if idx >= 0 and idx < n:
+                   boosted[r, j] = scores[r, j] * boost_flags[idx] * query_boost[r, j]
+               else:
+                   boosted[r, j] = -np.inf
+           order[r] = np.argsort(-boosted[r], kind='mergesort')
+
+       return boosted, order
+
+
+def rank_topk(scores: np.ndarray, indices: np.ndarray, boost_flags: np.ndarray,
+             query_boost: np.ndarray):
+   """Boost FAISS scores and return (boosted_scores, order) per query row.
+
+   Rows of ``order`` list positions into the FAISS result row, best first.
+   Invalid FAISS ids (-1 or out of range) get a score of -inf and sort last.
+   """
+   scores = np.ascontiguousarray(scores, dtype=np.float64)
+   indices = np.ascontiguousarray(indices, dtype=np.int64)
+   boost_flags = np.ascontiguousarray(boost_flags, dtype=np.float64)
+   query_boost = np.ascontiguousarray(np.broadcast_to(query_boost, scores.shape), dtype=np.float64)
+
+   if NUMBA_AVAILABLE:
+       return _rank_topk_numba(scores, indices, boost_flags, query_boost)
+   return _rank_topk_numpy(scores, indices, boost_flags, query_boost)
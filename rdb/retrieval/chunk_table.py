@@ -0,0 +1,176 @@
+"""
+Struct-of-arrays view over index metadata for fast post-search ranking.
+"""
+
+from hashlib import blake2b
+
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Any, Sequence, Set, Tuple
+
+try:
+   import xxhash
+except ImportError:
+   xxhash = None
+
+
+# Static (query-independent) boost factors
+TYPE_BOOST = 1.1
+ACTION_BOOST = 1.1
+ACTION_KEYWORDS = ('connect', 'configure', 'setup', 'install')
+ACTION_MIN_LENGTH = 200
+
+CHUNK_TYPES = ('small', 'medium', 'large')
+
+# Precomputed ChunkTable arrays, saved next to the index metadata
+CHUNK_TABLE_FILE = "chunk_table.npz"
+
+# Characters ignored when comparing page titles, so "Wi-Fi" and "wifi" match
+TITLE_IGNORED_CHARS = str.maketrans('', '', '-_ ')
+
+
+def normalize_title(title: str) -> str:
+   """Normalize a page title for deduplication comparison."""
+   return title.lower().translate(TITLE_IGNORED_CHARS)
+
+
+def content_hash(content: str) -> int:
+   """Stable 64-bit hash of stripped chunk content, using xxh3 when xxhash is installed."""
+   data = content.strip().encode('utf-8')
+   if xxhash is not None:
+       return xxhash.xxh3_64_intdigest(data)
+   return int.from_bytes(blake2b(data, digest_size=8).digest(), 'little')
+
+
+def table_fingerprint() -> str:
+   """Fingerprint of the constants the saved arrays are derived from; a saved table is stale if it differs."""
+   settings = repr((TYPE_BOOST, ACTION_BOOST, ACTION_KEYWORDS, ACTION_MIN_LENGTH, CHUNK_TYPES))
+   return blake2b(settings.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class ChunkTable:
+   """Parallel NumPy arrays derived once from the loaded chunk metadata."""
+
+   def __init__(self, chunks: List[Dict[str, Any]]):
+       """Build per-chunk arrays from a list of chunk dicts."""
+       self.size = len(chunks)
+
+       # Query-independent part of the score boost, one float per FAISS row
+       self.static_boost = np.ones(self.size, dtype=np.float64)
+
+       # Deduplication key part: hash of the stripped content
+       self.content_hash = np.empty(self.size, dtype=np.uint64)
+
+       # Page title id per chunk and the distinct page titles by id
+       self.title_ids = np.empty(self.size, dtype=np.int64)
+       self.titles: List[str] = []
+       title_ids: Dict[str, int] = {}
+
+       # Index into CHUNK_TYPES per chunk, -1 for unknown types
+       self.type_codes = np.full(self.size, -1, dtype=np.int8)
+       type_codes = {chunk_type: code for code, chunk_type in enumerate(CHUNK_TYPES)}
+
+       for i, chunk in enumerate(chunks):
+           boost = 1.0
+           chunk_type = chunk.get('chunk_type')
+           self.type_codes[i] = type_codes.get(chunk_type, -1)
+
+           # Boost medium/large chunks over small intro chunks
+           if chunk_type in ('medium', 'large'):
+               boost *= TYPE_BOOST
+
+           # Boost chunks with actual configuration content
+           content = chunk.get('content', '')
+           if len(content) > ACTION_MIN_LENGTH:
+               content_lower = content.lower()
+               if any(word in content_lower for word in ACTION_KEYWORDS):
+                   boost *= ACTION_BOOST
+
+           self.static_boost[i] = boost
+
+           self.content_hash[i] = content_hash(content)
+           title = chunk.get('page_title', '')
+           if title not in title_ids:
+               title_ids[title] = len(title_ids)
+               self.titles.append(title)
+           self.title_ids[i] = title_ids[title]
+
+       self._index_titles_and_types()
+
+   def _index_titles_and_types(self) -> None:
+       """Derive the per-title and per-type lookups, which only need the distinct titles."""
+       # Normalized page title per chunk, the other deduplication key part
+       title_keys = [normalize_title(title) for title in self.titles]
+       self.title_keys: List[str] = [title_keys[title_id] for title_id in self.title_ids]
+       self.title_key_set = frozenset(title_keys)
+
+       # Inverted index from lowercased title word to title ids, for the query-dependent title boost
+       word_titles: Dict[str, List[int]] = {}
+       for title_id, title in enumerate(self.titles):
+           for word in set(title.lower().replace('_', ' ').split()):
+               word_titles.setdefault(word, []).append(title_id)
+       self.word_title_ids = {
+           word: np.array(ids, dtype=np.int64) for word, ids in word_titles.items()
+       }
+
+       # FAISS row ids per chunk type, for restricting searches to a subset
+       self.type_ids = {
+           chunk_type: np.flatnonzero(self.type_codes == code).astype(np.int64)
+           for code, chunk_type in enumerate(CHUNK_TYPES)
+       }
+
+   def save(self, table_file: Path) -> None:
+       """Save the per-chunk arrays next to the index, so loading skips scanning every chunk."""
+       with open(table_file, 'wb') as f:
+           np.savez(f, static_boost=self.static_boost, content_hash=self.content_hash,
+                    title_ids=self.title_ids, type_codes=self.type_codes,
+                    titles=np.array(self.titles, dtype=str),
+                    fingerprint=np.array(table_fingerprint()))
+
+   @classmethod
+   def load(cls, table_file: Path, chunks: Sequence) -> "ChunkTable":
+       """Load arrays saved with the index, rebuilding from the chunks if missing or stale."""
+       try:
+           with np.load(table_file) as data:
+               # Rebuilt when the chunks or the boost constants changed since the table was saved
+               if len(data['title_ids']) != len(chunks) or str(data['fingerprint']) != table_fingerprint():
+                   return cls(chunks)
+               table = cls.__new__(cls)
+               table.size = len(chunks)
+               table.static_boost = data['static_boost']
+               table.content_hash = data['content_hash']
+               table.title_ids = data['title_ids']
+               table.type_codes = data['type_codes']
+               table.titles = data['titles'].tolist()
+       except (OSError, KeyError, ValueError):
+           return cls(chunks)
+
+       table._index_titles_and_types()
+       return table
+
+   def title_matches(self, query_words: Set[str], ids: np.ndarray) -> np.ndarray:
+       """Get a mask of which FAISS ids have a page title sharing a word with the query."""
+       matching = [self.word_title_ids[word] for word in query_words if word in self.word_title_ids]
+       valid = (ids >= 0) & (ids < self.size)
+       if not matching:
+           return np.zeros(ids.shape, dtype=bool)
+       # Invalid ids (-1 padding from FAISS) are looked up as row 0, then masked out
+       return valid & np.isin(self.title_ids[np.where(valid, ids, 0)], np.concatenate(matching))
+
+   def page_title(self, i: int) -> str:
+       """Get a chunk's page title without materializing its metadata row."""
+       return self.titles[self.title_ids[i]]
+
+   def is_title(self, text: str) -> bool:
+       """Check whether text names a page, compared like titles are for deduplication."""
+       return normalize_title(text.strip()) in self.title_key_set
+
+   def dedup_key(self, i: int) -> Tuple[int, str]:
+       """Get the (content hash, normalized title) deduplication key of a chunk."""
+       return int(self.content_hash[i]), self.title_keys[i]
+
+   def ids_for_types(self, chunk_types: List[str]) -> np.ndarray:
+       """Get sorted FAISS row ids of all chunks with one of the given types."""
+       empty = np.empty(0, dtype=np.int64)
+       ids = [self.type_ids.get(chunk_type, empty) for chunk_type in chunk_types]
+       return np.sort(np.concatenate(ids)) if ids else empty
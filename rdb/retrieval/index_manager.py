@@ -5,11 +5,178 @@ FAISS index management for RDB.
 import faiss
 import pickle
 import numpy as np
+from collections import Counter
+from collections.abc import Sequence
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 
 from ..config.settings import Config
 from ..utils.logging import get_logger
+from .chunk_table import CHUNK_TABLE_FILE, ChunkTable
+
+try:
+   import pyarrow as pa
+   import pyarrow.parquet as pq
+   PYARROW_AVAILABLE = True
+except ImportError:
+   PYARROW_AVAILABLE = False
+
+
+METADATA_PARQUET = "metadata.parquet"
+METADATA_PICKLE = "metadata.pkl"
+
+
+QUANTIZATION_MODES = ("none", "sq8", "pq")
+
+
+def save_metadata(chunks: Iterable[Dict[str, Any]], output_dir: Path) -> Path:
+   """Save chunk metadata as Parquet, or as a pickle if pyarrow is not installed."""
+   chunks = list(chunks)
+   if PYARROW_AVAILABLE:
+       metadata_file = output_dir / METADATA_PARQUET
+       stale_file = output_dir / METADATA_PICKLE
+       pq.write_table(pa.Table.from_pylist(chunks), str(metadata_file))
+   else:
+       metadata_file = output_dir / METADATA_PICKLE
+       stale_file = output_dir / METADATA_PARQUET
+       with open(metadata_file, 'wb') as f:
+           pickle.dump(chunks, f)
+   
+   # Don't leave metadata from an older build next to the new one
+   if stale_file.exists():
+       stale_file.unlink()
+   
+   # Per-chunk ranking features depend only on the chunks, so compute them once per build
+   ChunkTable(chunks).save(output_dir / CHUNK_TABLE_FILE)
+   
+   return metadata_file
+
+
+def find_metadata_file(index_dir: Path) -> Optional[Path]:
+   """Find the metadata file in an index directory, preferring Parquet over legacy pickle."""
+   parquet_file = index_dir / METADATA_PARQUET
+   if PYARROW_AVAILABLE and parquet_file.exists():
+       return parquet_file
+   
+   pickle_file = index_dir / METADATA_PICKLE
+   if pickle_file.exists():
+       return pickle_file
+   
+   return None
+
+
+class MappedChunks(Sequence):
+   """Read-only chunk list backed by a memory-mapped Parquet table; rows become dicts on access."""
+   
+   def __init__(self, table: "pa.Table"):
+       """Wrap an Arrow table of chunk metadata."""
+       self.table = table
+   
+   def __len__(self) -> int:
+       return self.table.num_rows
+   
+   def __getitem__(self, i):
+       if isinstance(i, slice):
+           return [self[j] for j in range(*i.indices(len(self)))]
+       if i < 0:
+           i += len(self)
+       if not 0 <= i < len(self):
+           raise IndexError("chunk index out of range")
+       return self.table.slice(i, 1).to_pylist()[0]
+   
+   def __iter__(self):
+       # Convert a record batch at a time instead of slicing row by row
+       for batch in self.table.to_batches():
+           yield from batch.to_pylist()
+
+
+def load_metadata(metadata_file: Path, memory_map: bool = False) -> Sequence:
+   """Load chunk metadata from a Parquet or pickle file.
+   
+   With memory_map, Parquet metadata is returned as a lazily converted MappedChunks.
+   """
+   if metadata_file.suffix == '.parquet':
+       table = pq.read_table(str(metadata_file), memory_map=memory_map)
+       return MappedChunks(table) if memory_map else table.to_pylist()
+   
+   with open(metadata_file, 'rb') as f:
+       return pickle.load(f)
+
+
+def count_chunk_types(chunks: Sequence) -> Dict[str, int]:
+   """Count chunks per chunk_type; memory-mapped Parquet metadata is counted in Arrow."""
+   if isinstance(chunks, MappedChunks):
+       if 'chunk_type' not in chunks.table.column_names:
+           return {'unknown': len(chunks)} if len(chunks) else {}
+       column = chunks.table.column('chunk_type').fill_null('unknown')
+       return {item['values']: item['counts'] for item in column.value_counts().to_pylist()}
+   
+   return dict(Counter(chunk.get('chunk_type', 'unknown') for chunk in chunks))
+
+
+def create_index(embeddings: np.ndarray, config: Config) -> faiss.Index:
+   """Build an inner-product index sized to the corpus from normalized float32 embeddings.
+   
+   Small corpora use a flat index, medium ones HNSW, and very large ones IVF. Stored
+   vectors are kept as float32, 8-bit scalar quantized or product quantized depending
+   on config.index_quantization; the largest tier always uses at least PQ. Flat PQ is
+   built as a single-list IVF so filtered searches work, and corpora too small to train
+   the PQ codebooks fall back to SQ8.
+   """
+   logger = get_logger(__name__)
+   num_vectors, dimension = embeddings.shape
+   quantization = config.index_quantization
+   
+   if quantization not in QUANTIZATION_MODES:
+       raise ValueError(f"Unknown index quantization: {quantization} (expected one of {QUANTIZATION_MODES})")
+   
+   pq_codec = f"PQ{config.ivf_pq_m}x{config.ivf_pq_nbits}"
+   if num_vectors < 2 ** config.ivf_pq_nbits:
+       # PQ training needs at least one vector per codebook centroid
+       if quantization == "pq" or num_vectors >= config.index_ivfpq_threshold:
+           logger.warning(f"Too few vectors ({num_vectors}) to train {pq_codec}, using SQ8 instead")
+       pq_codec = "SQ8"
+   codec = {"none": "Flat", "sq8": "SQ8", "pq": pq_codec}[quantization]
+   
+   if num_vectors < config.index_hnsw_threshold:
+       if quantization == "none":
+           index = faiss.IndexFlatIP(dimension)
+       elif codec.startswith("PQ"):
+           # A single-list IVF scans every code like IndexPQ, but accepts filtered search parameters
+           index = faiss.index_factory(dimension, f"IVF1,{pq_codec}", faiss.METRIC_INNER_PRODUCT)
+       else:
+           index = faiss.index_factory(dimension, codec, faiss.METRIC_INNER_PRODUCT)
+       logger.info(f"Using {type(index).__name__} for {num_vectors} vectors")
+   elif num_vectors < config.index_ivfpq_threshold:
+       if quantization == "none":
+           index = faiss.IndexHNSWFlat(dimension, config.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+       else:
+           index = faiss.index_factory(dimension, f"HNSW{config.hnsw_m}_{codec}", faiss.METRIC_INNER_PRODUCT)
+       index.hnsw.efConstruction = config.hnsw_ef_construction
+       logger.info(f"Using {type(index).__name__} (M={config.hnsw_m}) for {num_vectors} vectors")
+   else:
+       factory = f"IVF{config.ivf_nlist},{'SQ8' if quantization == 'sq8' else pq_codec}"
+       index = faiss.index_factory(dimension, factory, faiss.METRIC_INNER_PRODUCT)
+       logger.info(f"Using {factory} for {num_vectors} vectors")
+   
+   if not index.is_trained:
+       # Train on a random sample; FAISS needs a few dozen points per centroid
+       train_size = min(num_vectors, 64 * max(config.ivf_nlist, 2 ** config.ivf_pq_nbits))
+       sample = np.random.default_rng(0).choice(num_vectors, train_size, replace=False)
+       logger.info(f"Training index on {train_size} vectors...")
+       index.train(embeddings[np.sort(sample)])
+   
+   index.add(embeddings)
+   configure_search(index, config)
+   return index
+
+
+def configure_search(index: faiss.Index, config: Config) -> None:
+   """Apply query-time accuracy settings for approximate index types."""
+   if isinstance(index, faiss.IndexHNSW):
+       index.hnsw.efSearch = config.hnsw_ef_search
+   elif isinstance(index, faiss.IndexIVF):
+       index.nprobe = config.ivf_nprobe
 
 
 class IndexManager:
@@ -20,7 +187,18 @@ class IndexManager:
        self.config = config
        self.logger = get_logger(__name__)
        self.index: Optional[faiss.Index] = None
-       self.chunks: Optional[List[Dict[str, Any]]] = None
+       self.chunks: Optional[Sequence] = None  # list, or MappedChunks for Parquet metadata
+       
+       # Precomputed ChunkTable arrays saved with the loaded index, if any
+       self.chunk_table_file: Optional[Path] = None
+       
+       # GPU mirror of the index for unfiltered searches, if enabled and supported
+       self.gpu_index: Optional[faiss.Index] = None
+       self._gpu_resources = None
+       
+       # Chunk type histogram for get_stats, and the chunks it was counted from
+       self._chunk_type_counts: Optional[Dict[str, int]] = None
+       self._counted_chunks: Optional[Sequence] = None
    
    def load_index(self, index_dir: Optional[str] = None) -> bool:
        """Load FAISS index and metadata from files."""
@@ -30,23 +208,30 @@ class IndexManager:
            index_dir = Path(index_dir)
        
        index_file = index_dir / "index.faiss"
-       metadata_file = index_dir / "metadata.pkl"
+       metadata_file = find_metadata_file(index_dir)
        
        if not index_file.exists():
            self.logger.error(f"Index file not found: {index_file}")
            return False
        
-       if not metadata_file.exists():
-           self.logger.error(f"Metadata file not found: {metadata_file}")
+       if metadata_file is None:
+           self.logger.error(f"Metadata file not found in: {index_dir}")
            return False
        
        try:
            self.logger.info(f"Loading index from {index_file}...")
-           self.index = faiss.read_index(str(index_file))
+           if self.config.mmap_index:
+               # Vectors are paged in by the OS on demand instead of read up front
+               self.index = faiss.read_index(str(index_file), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+           else:
+               self.index = faiss.read_index(str(index_file))
+           configure_search(self.index, self.config)
+           self._mirror_to_gpu()
            
            self.logger.info(f"Loading metadata from {metadata_file}...")
-           with open(metadata_file, 'rb') as f:
-               self.chunks = pickle.load(f)
+           self.chunks = load_metadata(metadata_file, memory_map=self.config.mmap_index)
+           table_file = index_dir / CHUNK_TABLE_FILE
+           self.chunk_table_file = table_file if table_file.exists() else None
            
            self.logger.info(f"Loaded index with {self.index.ntotal} vectors and {len(self.chunks)} chunks")
            return True
@@ -66,15 +251,13 @@ class IndexManager:
        output_dir.mkdir(parents=True, exist_ok=True)
        
        index_file = output_dir / "index.faiss"
-       metadata_file = output_dir / "metadata.pkl"
        
        try:
            self.logger.info(f"Saving index to {index_file}...")
            faiss.write_index(index, str(index_file))
            
-           self.logger.info(f"Saving metadata to {metadata_file}...")
-           with open(metadata_file, 'wb') as f:
-               pickle.dump(chunks, f)
+           metadata_file = save_metadata(chunks, output_dir)
+           self.logger.info(f"Saved metadata to {metadata_file}")
            
            self.logger.info("Index and metadata saved successfully!")
            return str(index_file), str(metadata_file)
@@ -83,14 +266,75 @@ class IndexManager:
            self.logger.error(f"Error saving index: {e}")
            raise
    
-   def search(self, query_embedding: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
-       """Search the index for similar vectors."""
+   def search(self, query_embedding: np.ndarray, top_k: int,
+              allowed_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+       """Search the index for similar vectors, optionally restricted to a subset of ids."""
        if not self.is_loaded():
            raise RuntimeError("Index not loaded")
        
-       scores, indices = self.index.search(query_embedding, top_k)
+       if allowed_ids is None:
+           index = self.gpu_index if self.gpu_index is not None else self.index
+           scores, indices = index.search(query_embedding, top_k)
+       else:
+           # Vectors outside the subset are skipped during the scan itself
+           selector = faiss.IDSelectorBatch(np.ascontiguousarray(allowed_ids, dtype='int64'))
+           params = self._search_params(selector)
+           scores, indices = self.index.search(query_embedding, top_k, params=params)
        return scores, indices
    
+   def _mirror_to_gpu(self) -> None:
+       """Copy the loaded index to the GPU when configured; the CPU index is kept for saving and filtering."""
+       self.gpu_index = None
+       if not self.config.use_gpu:
+           return
+       
+       if not hasattr(faiss, 'StandardGpuResources') or faiss.get_num_gpus() == 0:
+           self.logger.info("FAISS GPU support not available, searching on CPU")
+           return
+       
+       try:
+           if self._gpu_resources is None:
+               self._gpu_resources = faiss.StandardGpuResources()
+           if self.config.gpu_index_type == "cagra" and self._build_cagra():
+               return
+           self.gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, self.index)
+           self.logger.info("Mirrored index to GPU")
+       except Exception as e:
+           # Not every index type has a GPU implementation (e.g. HNSW)
+           self.logger.warning(f"Could not move index to GPU, searching on CPU: {e}")
+   
+   def _build_cagra(self) -> bool:
+       """Build a CAGRA graph index on the GPU from the stored vectors; False if not possible.
+       
+       CAGRA keeps search time nearly flat as the corpus grows, but needs a FAISS build with
+       cuVS and the exact vectors, so it is built from flat and HNSW indexes only.
+       """
+       if not hasattr(faiss, 'GpuIndexCagra'):
+           self.logger.info("FAISS was built without cuVS, mirroring the index to GPU instead")
+           return False
+       if not isinstance(self.index, (faiss.IndexFlat, faiss.IndexHNSWFlat)):
+           self.logger.info("CAGRA needs exact vectors, mirroring the index to GPU instead")
+           return False
+       
+       vectors = self.index.reconstruct_n(0, self.index.ntotal)
+       cagra = faiss.GpuIndexCagra(self._gpu_resources, self.index.d, faiss.METRIC_INNER_PRODUCT,
+                                   faiss.GpuIndexCagraConfig())
+       cagra.train(vectors)
+       self.gpu_index = cagra
+       self.logger.info(f"Built CAGRA index on GPU with {cagra.ntotal} vectors")
+       return True
+   
+   def _search_params(self, selector: "faiss.IDSelector") -> "faiss.SearchParameters":
+       """Build search parameters matching the loaded index type.
+       
+       Explicit parameters replace the index defaults, so nprobe/efSearch are carried over.
+       """
+       if isinstance(self.index, faiss.IndexIVF):
+           return faiss.SearchParametersIVF(sel=selector, nprobe=self.index.nprobe)
+       if isinstance(self.index, faiss.IndexHNSW):
+           return faiss.SearchParametersHNSW(sel=selector, efSearch=self.index.hnsw.efSearch)
+       return faiss.SearchParameters(sel=selector)
+   
    def is_loaded(self) -> bool:
        """Check if index and metadata are loaded."""
        return self.index is not None and self.chunks is not None
@@ -100,10 +344,10 @@ class IndexManager:
        if not self.is_loaded():
            return {"status": "not_loaded"}
        
-       chunk_types = {}
-       for chunk in self.chunks:
-           chunk_type = chunk.get('chunk_type', 'unknown')
-           chunk_types[chunk_type] = chunk_types.get(chunk_type, 0) + 1
+       # Counted once per set of chunks; chunks are replaced, not mutated, on reload/rebuild
+       if self._chunk_type_counts is None or self._counted_chunks is not self.chunks:
+           self._chunk_type_counts = count_chunk_types(self.chunks)
+           self._counted_chunks = self.chunks
        
        return {
            "status": "loaded",
@@ -111,7 +355,7 @@ class IndexManager:
            "total_chunks": len(self.chunks),
            "vector_dimension": self.index.d,
            "index_type": type(self.index).__name__,
-           "chunk_types": chunk_types
+           "chunk_types": dict(self._chunk_type_counts)
        }
    
    def get_chunk(self, index: int) -> Optional[Dict[str, Any]]:
@@ -128,20 +372,19 @@ class IndexManager:
                     embeddings: np.ndarray) -> bool:
        """Rebuild index with new chunks and embeddings."""
        try:
-           dimension = embeddings.shape[1]
-           
-           # Create new index
-           new_index = faiss.IndexFlatIP(dimension)
+           embeddings = np.ascontiguousarray(embeddings, dtype='float32')
            
            # Normalize embeddings
            faiss.normalize_L2(embeddings)
            
-           # Add embeddings
-           new_index.add(embeddings.astype('float32'))
+           # Create new index sized to the corpus
+           new_index = create_index(embeddings, self.config)
            
            # Update stored data
            self.index = new_index
            self.chunks = new_chunks
+           self.chunk_table_file = None  # describes the old chunks
+           self._mirror_to_gpu()
            
            self.logger.info(f"Rebuilt index with {self.index.ntotal} vectors")
            return True
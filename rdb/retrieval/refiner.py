@@ -3,15 +3,84 @@ Query refiner using local LLMs for better search terms.
 """
 
 import os
+import re
+from functools import lru_cache
 from pathlib import Path
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, StoppingCriteria, StoppingCriteriaList
 import torch
-from typing import Optional
+from typing import Any, List, Optional
 
 from ..config.settings import Config
+from ..storage.cache import CacheManager
 from ..utils.logging import get_logger
 
 
+# Few-shot refinement prompt around the user query; the fixed parts are tokenized once per refiner
+REFINEMENT_PROMPT_PREFIX = """You are an expert Arch Linux system administrator. Convert user questions into specific technical search terms that match Arch Wiki page titles and content.
+
+        IMPORTANT: Include both specific commands AND general page titles in your search terms.
+
+        Examples:
+        User: "How do I connect to wifi?"
+        Search: "Wireless network configuration iwctl station connect NetworkManager wifi setup"
+
+        User: "wifi broken"  
+        Search: "Wireless network configuration troubleshooting iwctl connection NetworkManager"
+
+        User: "sound not working"
+        Search: "ALSA sound configuration PulseAudio audio troubleshooting"
+
+        User: "install packages"
+        Search: "Pacman package manager installation AUR"
+
+        User: \""""
+REFINEMENT_PROMPT_SUFFIX = """"
+        Search:"""
+
+# Label prefixes the model sometimes puts before its answer, each stripped at most once in this order
+RESPONSE_PREFIX_RE = re.compile(
+    r'^(?:technical search query:\s*)?(?:search terms:\s*)?(?:refined query:\s*)?(?:query:\s*)?',
+    re.IGNORECASE
+)
+
+# Refinements kept in memory per refiner; older ones are still found in the on-disk cache
+REFINEMENT_CACHE_SIZE = 512
+
+# Files of which a local model directory needs at least one, besides config.json
+MODEL_FILES = frozenset({"tokenizer.json", "tokenizer_config.json", "pytorch_model.bin", "model.safetensors"})
+
+# Queries generated together by refine_queries; decoding a 1.5B model is memory-bound,
+# so a small batch costs little more per step than a single query
+REFINEMENT_BATCH_SIZE = 8
+
+
+def _cpu_supports_bf16() -> bool:
+    """Check whether the CPU runs bfloat16 natively (AVX-512 BF16 or AMX) rather than emulating it."""
+    checks = ('_is_avx512_bf16_supported', '_is_amx_tile_supported')
+    return any(getattr(torch.cpu, check, lambda: False)() for check in checks)
+
+
+class StopAtNewline(StoppingCriteria):
+    """Stop generating once the refinement's line is finished; later lines are discarded anyway."""
+
+    def __init__(self, newline_ids: torch.Tensor):
+       """Initialize with the ids of all tokens whose text contains a newline."""
+       self.newline_ids = newline_ids
+       self.seen_text: Optional[torch.Tensor] = None
+
+    def __call__(self, input_ids: torch.Tensor, scores: torch.Tensor, **kwargs) -> torch.Tensor:
+       # Only the newest token of each row is checked, so a step costs the same however long
+       # the output is. Leading newlines are stripped by _clean_response, so a row only stops
+       # at a newline once it has generated some other token. A per-row result (transformers
+       # >= 4.39) lets each query of a batch stop on its own line.
+       is_newline = torch.isin(input_ids[:, -1], self.newline_ids.to(input_ids.device))
+       if self.seen_text is None:
+           self.seen_text = torch.zeros_like(is_newline)
+       done = is_newline & self.seen_text
+       self.seen_text |= ~is_newline
+       return done
+
+
 class QueryRefiner:
     """Refines user queries into technical search terms using local LLMs."""
 
@@ -35,30 +104,52 @@ class QueryRefiner:
        self.logger.info(f"Device: {self.device}")
        
        # Load tokenizer and model
-       self.tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+       self.tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True, use_fast=True)
+       quantization_config = self._quantization_config()
+       self.dtype = self._get_dtype()
        self.model = AutoModelForCausalLM.from_pretrained(
            model_path,
-           torch_dtype=torch.float16 if self.device != 'cpu' else torch.float32,
+           torch_dtype=self.dtype,
            device_map=self.device if self.device != 'cpu' else None,
+           quantization_config=quantization_config,
            trust_remote_code=True
        )
+       self.quantized = quantization_config is not None
+       
+       if self.device == 'cpu' and self.dtype == torch.bfloat16:
+           self._optimize_for_cpu()
        
        # Add pad token if needed
        if self.tokenizer.pad_token is None:
            self.tokenizer.pad_token = self.tokenizer.eos_token
        
+       # Warm up the tokenizer so the first query doesn't pay its one-time setup
+       self.tokenizer("warmup")
+       
+       # Token ids of the fixed prompt parts and of newline tokens, found on first refinement
+       self._prefix_ids: Optional[torch.Tensor] = None
+       self._suffix_ids: Optional[torch.Tensor] = None
+       self._newline_ids: Optional[torch.Tensor] = None
+       
+       if config.refiner_compile and self.device != 'cpu':
+           self._compile_decoding()
+       
        self.logger.info("Refiner model loaded successfully!")
        
+       # Repeated queries skip generation: in-memory LRU first, then the query cache on disk
+       self.cache_manager = CacheManager(config)
+       self._refine_cached = lru_cache(maxsize=REFINEMENT_CACHE_SIZE)(self._refine_uncached)
+       
     def _find_default_model(self) -> Optional[str]:
         """Find default model from local directory or fall back to remote."""
         # Check project-local models directory first
         models_dir = Path("local/models")
         
         if models_dir.exists():
-            valid_models = []
-            for model_dir in models_dir.iterdir():
-                if model_dir.is_dir() and self._is_valid_model_dir(model_dir):
-                    valid_models.append(model_dir)
+            # One scandir pass; DirEntry.is_dir() reuses the type from the listing
+            with os.scandir(models_dir) as entries:
+                valid_models = [Path(entry.path) for entry in entries
+                                if entry.is_dir() and self._is_valid_model_dir(Path(entry.path))]
             
             if len(valid_models) > 1:
                 # Sort for deterministic behavior
@@ -82,17 +173,83 @@ class QueryRefiner:
 
     def _is_valid_model_dir(self, path: Path) -> bool:
         """Check if directory contains a valid model."""
-        # Check for essential model files
-        required_files = ["config.json"]
-        optional_files = ["tokenizer.json", "tokenizer_config.json", "pytorch_model.bin", "model.safetensors"]
-        
-        # Must have config.json
-        if not (path / "config.json").exists():
+        # List the directory once instead of checking each file separately
+        try:
+            names = set(os.listdir(path))
+        except OSError:
             return False
         
-        # Must have at least one model file
-        has_model_file = any((path / file).exists() for file in optional_files)
-        return has_model_file
+        # Must have config.json and at least one model file
+        return "config.json" in names and not names.isdisjoint(MODEL_FILES)
+
+    def _tokenize(self, text: str, add_special_tokens: bool = False) -> torch.Tensor:
+       """Tokenize a piece of the prompt into a (1, n) id tensor on the model's device."""
+       input_ids = self.tokenizer(text, return_tensors="pt", add_special_tokens=add_special_tokens)['input_ids']
+       return input_ids.to(self.device) if self.device != 'cpu' else input_ids
+
+    def _quantization_config(self) -> Optional[Any]:
+       """Get a 4-bit NF4 weight quantization config if enabled; only used on GPU."""
+       quant = self.config.refiner_quant
+       if quant == "none" or self.device == 'cpu':
+           return None
+       
+       if quant != "nf4":
+           self.logger.warning(f"Unknown refiner quantization '{quant}', loading without it")
+           return None
+       
+       try:
+           import bitsandbytes  # noqa: F401
+           from transformers import BitsAndBytesConfig
+       except ImportError:
+           self.logger.warning("bitsandbytes not installed, loading refiner without quantization")
+           return None
+       
+       self.logger.info("Loading refiner with 4-bit NF4 weights")
+       return BitsAndBytesConfig(
+           load_in_4bit=True,
+           bnb_4bit_quant_type="nf4",
+           bnb_4bit_compute_dtype=torch.float16,
+           bnb_4bit_use_double_quant=True
+       )
+
+    def _get_dtype(self) -> torch.dtype:
+       """Get the model dtype: float16 on GPU, bfloat16 on CPUs with native support, else float32."""
+       if self.device != 'cpu':
+           return torch.float16
+       if self.config.refiner_cpu_bf16 and _cpu_supports_bf16():
+           return torch.bfloat16
+       return torch.float32
+
+    def _optimize_for_cpu(self) -> None:
+       """Fuse the bf16 model's attention and MLP kernels with IPEX, if installed."""
+       try:
+           import intel_extension_for_pytorch as ipex
+       except ImportError:
+           self.logger.debug("intel_extension_for_pytorch not installed, running bf16 refiner unfused")
+           return
+       
+       if not hasattr(ipex, 'llm'):
+           # ipex.llm.optimize was added in IPEX 2.2
+           self.logger.warning(f"IPEX {getattr(ipex, '__version__', '')} has no ipex.llm, running bf16 refiner unfused")
+           return
+       
+       self.logger.info("Optimizing bf16 refiner for CPU with IPEX")
+       try:
+           self.model = ipex.llm.optimize(self.model, dtype=torch.bfloat16)
+       except (AttributeError, RuntimeError) as e:
+           self.logger.warning(f"IPEX optimization failed, running bf16 refiner unfused: {e}")
+
+    def _compile_decoding(self) -> None:
+       """Decode with a preallocated static KV cache and a compiled forward pass.
+       
+       generate() then reuses one fixed-size cache across steps and queries, so the
+       compiled CUDA graph is replayed instead of reallocating cache tensors every step.
+       """
+       self.logger.info("Compiling refiner decoding with a static KV cache")
+       self.model.generation_config.cache_implementation = "static"
+       # bitsandbytes layers cause graph breaks, so quantized models compile in pieces
+       self.model.forward = torch.compile(self.model.forward, mode="reduce-overhead",
+                                          fullgraph=not self.quantized)
 
     def _get_device(self) -> str:
        """Determine the best device to use."""
@@ -101,61 +258,100 @@ class QueryRefiner:
        return 'cpu'
 
     def refine_query(self, user_query: str) -> str:
-       """Refine a user query into technical search terms."""
-       prompt = self._create_refinement_prompt(user_query)
+       """Refine a user query into technical search terms, reusing earlier refinements."""
+       user_query = user_query.strip()
+       return self._refine_cached(user_query.lower(), user_query)
+
+    def refine_queries(self, user_queries: List[str]) -> List[str]:
+       """Refine several queries, generating the ones not cached yet in batches."""
+       user_queries = [user_query.strip() for user_query in user_queries]
        
-       # Tokenize input
-       inputs = self.tokenizer(prompt, return_tensors="pt", padding=True, truncation=True)
+       # Queries differing only in case share a refinement, generated from the first one seen
+       by_key = {}
+       for user_query in user_queries:
+           by_key.setdefault(user_query.lower(), user_query)
        
-       if self.device != 'cpu':
-           inputs = {k: v.to(self.device) for k, v in inputs.items()}
+       # Refinements found in the on-disk cache (or in memory, via it) aren't generated again
+       pending = [
+           cache_key for cache_key in by_key
+           if self.cache_manager.get_cached_query_refinement(cache_key, self.model_path) is None
+       ]
+       # Kept here as well, so a failed cache write doesn't mean generating the query again
+       generated = {}
+       for start in range(0, len(pending), REFINEMENT_BATCH_SIZE):
+           batch = pending[start:start + REFINEMENT_BATCH_SIZE]
+           refinements = self._generate_refinements([by_key[cache_key] for cache_key in batch])
+           for cache_key, refined_query in zip(batch, refinements):
+               generated[cache_key] = refined_query
+               self.cache_manager.cache_query_refinement(cache_key, refined_query, self.model_path)
+       
+       return [
+           generated[user_query.lower()] if user_query.lower() in generated
+           else self._refine_cached(user_query.lower(), user_query)
+           for user_query in user_queries
+       ]
+
+    def _refine_uncached(self, cache_key: str, user_query: str) -> str:
+       """Refine a query, checking the on-disk cache under its lowercased key before generating.
        
-       # Generate response
-       with torch.no_grad():
+       The LLM is given the query as typed; the lowercased key only decides reuse.
+       """
+       refined_query = self.cache_manager.get_cached_query_refinement(cache_key, self.model_path)
+       if refined_query is None:
+           refined_query = self._generate_refinement(user_query)
+           self.cache_manager.cache_query_refinement(cache_key, refined_query, self.model_path)
+       return refined_query
+
+    def _generate_refinement(self, user_query: str) -> str:
+       """Generate search terms for a query with the LLM."""
+       return self._generate_refinements([user_query])[0]
+
+    def _newline_token_ids(self) -> torch.Tensor:
+       """Get the ids of all tokens whose text contains a newline, e.g. "\\n", "\\n\\n" or ".\\n"."""
+       token_ids = sorted(self.tokenizer.get_vocab().values())
+       texts = self.tokenizer.batch_decode([[token_id] for token_id in token_ids])
+       return torch.tensor([token_id for token_id, text in zip(token_ids, texts) if '\n' in text],
+                           dtype=torch.long)
+
+    def _generate_refinements(self, user_queries: List[str]) -> List[str]:
+       """Generate search terms for a batch of queries with one LLM generate call."""
+       if self._prefix_ids is None:
+           self._prefix_ids = self._tokenize(REFINEMENT_PROMPT_PREFIX, add_special_tokens=True)
+           self._suffix_ids = self._tokenize(REFINEMENT_PROMPT_SUFFIX)
+           self._newline_ids = self._newline_token_ids()
+       
+       # Only the queries are tokenized per call; the prompt around them is tokenized once
+       prompts = [torch.cat([self._prefix_ids, self._tokenize(user_query), self._suffix_ids], dim=1)[0]
+                  for user_query in user_queries]
+       
+       # Left-pad to a common length, so every row's generated tokens start at the same position
+       prompt_length = max(len(prompt) for prompt in prompts)
+       input_ids = torch.full((len(prompts), prompt_length), self.tokenizer.eos_token_id,
+                              dtype=prompts[0].dtype, device=prompts[0].device)
+       attention_mask = torch.zeros_like(input_ids)
+       for row, prompt in enumerate(prompts):
+           input_ids[row, prompt_length - len(prompt):] = prompt
+           attention_mask[row, prompt_length - len(prompt):] = 1
+       
+       # Generate response greedily, so the same query always refines the same way
+       with torch.inference_mode():
            outputs = self.model.generate(
-               **inputs,
+               input_ids=input_ids,
+               attention_mask=attention_mask,
                max_new_tokens=self.config.refiner_max_tokens,
-               temperature=self.config.refiner_temperature,
-               do_sample=True,
-               top_p=0.9,
+               do_sample=False,
+               num_beams=1,
                repetition_penalty=1.1,
+               stopping_criteria=StoppingCriteriaList([StopAtNewline(self._newline_ids)]),
                pad_token_id=self.tokenizer.eos_token_id,
                eos_token_id=self.tokenizer.eos_token_id
            )
        
-       # Decode response
-       full_response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-       
-       # Extract refined query
-       refined_query = full_response[len(prompt):].strip()
-       
-       # Clean up response
-       refined_query = self._clean_response(refined_query)
-       
-       return refined_query
-
-    def _create_refinement_prompt(self, user_query: str) -> str:
-        """Create a more specific prompt for Arch Linux documentation search."""
-        prompt = f"""You are an expert Arch Linux system administrator. Convert user questions into specific technical search terms that match Arch Wiki page titles and content.
-
-        IMPORTANT: Include both specific commands AND general page titles in your search terms.
-
-        Examples:
-        User: "How do I connect to wifi?"
-        Search: "Wireless network configuration iwctl station connect NetworkManager wifi setup"
-
-        User: "wifi broken"  
-        Search: "Wireless network configuration troubleshooting iwctl connection NetworkManager"
-
-        User: "sound not working"
-        Search: "ALSA sound configuration PulseAudio audio troubleshooting"
-
-        User: "install packages"
-        Search: "Pacman package manager installation AUR"
-
-        User: "{user_query}"
-        Search:"""
-        return prompt
+       # Decode only the generated tokens, not the prompt, and clean up each response
+       return [
+           self._clean_response(self.tokenizer.decode(output[prompt_length:], skip_special_tokens=True))
+           for output in outputs
+       ]
 
     def _clean_response(self, response: str) -> str:
        """Clean up model response."""
@@ -170,28 +366,14 @@ class QueryRefiner:
            response = response.split('\n')[0]
        
        # Remove common prefixes
-       prefixes_to_remove = [
-           "Technical search query:",
-           "Search terms:",
-           "Refined query:",
-           "Query:"
-       ]
+       response = RESPONSE_PREFIX_RE.sub('', response, count=1)
+       
+       # Remove excessive repetition, keeping the first spelling of each word
+       first_words = {}
+       for word in response.split():
+           first_words.setdefault(word.strip('",.').lower(), word)
        
-       for prefix in prefixes_to_remove:
-           if response.lower().startswith(prefix.lower()):
-               response = response[len(prefix):].strip()
-       
-       # Remove excessive repetition
-       words = response.split()
-       seen = set()
-       filtered_words = []
-       for word in words:
-           clean_word = word.strip('",.')
-           if clean_word.lower() not in seen:
-               seen.add(clean_word.lower())
-               filtered_words.append(word)
-       
-       response = ' '.join(filtered_words)
+       response = ' '.join(first_words.values())
        
        # Limit length
        if len(response) > 200:
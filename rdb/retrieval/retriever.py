@@ -2,17 +2,37 @@
 Document retriever for semantic search with deduplication.
 """
 
-import faiss
 import pickle
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Optional, Tuple
 
 from ..config.settings import Config
 from ..utils.logging import get_logger
 from ..embedding.models import EmbeddingModel
 from .refiner import QueryRefiner
 from .index_manager import IndexManager
+from .chunk_table import ChunkTable
+from .search_result import SearchResult
+from .semantic_cache import SemanticCache
+from ._numba_kernels import rank_topk
+
+
+TITLE_BOOST = 1.3  # Strong boost for page title match
+
+# Commands and package names that already match Arch Wiki titles and content,
+# so queries containing one are searched as typed instead of refined
+TECHNICAL_TERMS = frozenset({
+    'pacman', 'makepkg', 'yay', 'paru', 'aur', 'systemd', 'systemctl', 'journalctl',
+    'iwctl', 'iwd', 'nmcli', 'networkmanager', 'wpa_supplicant', 'netctl', 'grub',
+    'mkinitcpio', 'fstab', 'pipewire', 'pulseaudio', 'alsa', 'xorg', 'wayland',
+    'nftables', 'iptables', 'ufw', 'sudo', 'ssh', 'openssh', 'btrfs', 'lvm', 'luks'
+})
+
+
+def needs_refinement(query: str) -> bool:
+   """Check whether a query is vague enough to be worth refining with the LLM."""
+   return TECHNICAL_TERMS.isdisjoint(query.lower().split())
 
 
 class DocumentRetriever:
@@ -22,9 +42,18 @@ class DocumentRetriever:
        """Initialize document retriever with configuration."""
        self.config = config
        self.logger = get_logger(__name__)
-       self.embedding_model = EmbeddingModel(config.embedding_model, device=config.device)
+       self.embedding_model = EmbeddingModel(config.embedding_model, device=config.device,
+                                             half_precision=config.embedding_half_precision,
+                                             query_cache_size=config.query_cache_size,
+                                             quantize=config.embedding_quantize,
+                                             compile_model=config.embedding_compile)
        self.index_manager = IndexManager(config)
        self.query_refiner = None
+       self._chunk_table: Optional[ChunkTable] = None
+       self._chunk_table_source = None
+       self.semantic_cache = None
+       if config.enable_semantic_cache:
+           self.semantic_cache = SemanticCache(config.semantic_cache_size, config.semantic_cache_threshold)
        
        # Initialize query refiner if enabled
        if config.enable_query_refinement:
@@ -37,166 +66,238 @@ class DocumentRetriever:
 
     def load_index(self, index_dir: Optional[str] = None) -> bool:
        """Load FAISS index and metadata."""
-       return self.index_manager.load_index(index_dir)
+       if not self.index_manager.load_index(index_dir):
+           return False
+       self._get_chunk_table()
+       return True
+
+    def _get_chunk_table(self) -> ChunkTable:
+       """Get SoA arrays for the loaded chunks, rebuilding if the index changed."""
+       chunks = self.index_manager.chunks
+       if self._chunk_table is None or self._chunk_table_source is not chunks:
+           table_file = self.index_manager.chunk_table_file
+           if isinstance(table_file, Path):
+               # Precomputed at index build time, so chunks aren't scanned on every start
+               self._chunk_table = ChunkTable.load(table_file, chunks)
+           else:
+               self._chunk_table = ChunkTable(chunks)
+           self._chunk_table_source = chunks
+           # Cached results point into the old metadata
+           if self.semantic_cache is not None:
+               self.semantic_cache.clear()
+       return self._chunk_table
 
     def search(self, query: str, top_k: Optional[int] = None, 
               refine_query: bool = False, show_refinement: bool = False,
-              enable_deduplication: bool = True) -> List[Dict[str, Any]]:
-       """Search for similar documents with optional query refinement and deduplication."""
-       if not self.index_manager.is_loaded():
-           if not self.load_index():
-               raise RuntimeError("Index not loaded and could not load from default location")
+              enable_deduplication: bool = True,
+              chunk_types: Optional[List[str]] = None,
+              force_refine: bool = False) -> List[SearchResult]:
+       """Search for similar documents with optional query refinement and deduplication.
+       
+       If chunk_types is given, only chunks of those types are searched. Queries naming
+       a command, package or page are not refined unless force_refine is set.
+       """
+       self._ensure_index_loaded()
        
        if top_k is None:
            top_k = self.config.default_top_k
        
-       original_query = query
+       final_query = self._refine_query(query, refine_query, show_refinement, force_refine)
        
-       # Apply query refinement if requested and available
-       if refine_query and self.query_refiner:
-           try:
-               refined_query = self.query_refiner.refine_query(query)
-               if show_refinement:
-                   self.logger.info(f"Original query: {original_query}")
-                   self.logger.info(f"Refined query:  {refined_query}")
-               query = refined_query
-           except Exception as e:
-               self.logger.warning(f"Query refinement failed: {e}")
-               self.logger.info("Using original query")
+       # Encode query; already L2-normalized by the model, on its device
+       query_embedding = self.embedding_model.encode_query(final_query)
+       query_embedding = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
        
-       # Encode query
-       query_embedding = self.embedding_model.encode_query(query)
-       query_embedding = query_embedding.reshape(1, -1).astype('float32')
+       # Near-identical earlier queries with the same options skip the index search
+       cache_key = (top_k, enable_deduplication, tuple(chunk_types) if chunk_types is not None else None)
+       if self.semantic_cache is not None:
+           self._get_chunk_table()  # clears the cache if the index changed
+           cached = self.semantic_cache.get(query_embedding[0], cache_key)
+           if cached is not None:
+               self.logger.debug(f"Semantic cache hit for query: {final_query}")
+               return [result.copy(query, final_query) for result in cached]
        
-       # Normalize for cosine similarity
-       faiss.normalize_L2(query_embedding)
+       results = self._search_embeddings([query], [final_query], query_embedding, top_k,
+                                         enable_deduplication, chunk_types)[0]
        
-       # Search with higher top_k to account for deduplication
-       search_k = top_k * 3 if enable_deduplication else top_k
-       scores, indices = self.index_manager.search(query_embedding, search_k)
+       if self.semantic_cache is not None:
+           self.semantic_cache.put(query_embedding[0], cache_key,
+                                   [result.copy(query, final_query) for result in results])
+       return results
+
+    def search_batch(self, queries: List[str], top_k: Optional[int] = None,
+                    refine_query: bool = False, show_refinement: bool = False,
+                    enable_deduplication: bool = True,
+                    chunk_types: Optional[List[str]] = None,
+                    force_refine: bool = False) -> List[List[SearchResult]]:
+       """Search for several queries with one batched encode and one FAISS call.
        
-       # Format results
-       results = []
-       for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-           if idx < len(self.index_manager.chunks):
-               chunk = self.index_manager.chunks[idx]
-               results.append({
-                   'rank': i + 1,
-                   'score': float(score),
-                   'page_title': chunk['page_title'],
-                   'section_path': chunk['section_path'],
-                   'url': chunk['url'],
-                   'content': chunk['content'],
-                   'chunk_type': chunk['chunk_type'],
-                   'section_level': chunk['section_level'],
-                   'original_query': original_query,
-                   'final_query': query,
-                   'full_chunk': chunk
-               })
+       Returns one result list per query, in the same order as the queries.
+       """
+       if not queries:
+           return []
        
-       # Apply boosting logic
-       query_words = set(query.lower().split())
-       for result in results:
-           # Boost exact page title matches
-           title_words = set(result['page_title'].lower().replace('_', ' ').split())
-           if query_words.intersection(title_words):
-               result['score'] *= 1.3  # Strong boost for page title match
-           
-           # Boost medium/large chunks over small intro chunks
-           if result['chunk_type'] in ['medium', 'large']:
-               result['score'] *= 1.1
-           
-           # Boost chunks with actual configuration content
-           content_lower = result['content'].lower()
-           if any(word in content_lower for word in ['connect', 'configure', 'setup', 'install']) and len(result['content']) > 200:
-               result['score'] *= 1.1
+       self._ensure_index_loaded()
        
-       # Re-sort by boosted scores
-       results.sort(key=lambda x: x['score'], reverse=True)
+       if top_k is None:
+           top_k = self.config.default_top_k
        
-       # Apply deduplication if enabled
-       if enable_deduplication:
-           results = self._deduplicate_results(results)
-           self.logger.debug(f"Deduplication reduced results from {len(results)} to {len(results)}")
+       final_queries = self._refine_queries(queries, refine_query, show_refinement, force_refine)
        
-       # Trim to requested top_k
-       results = results[:top_k]
+       # Encode all queries in one batch, L2-normalized like single queries
+       query_embeddings = self.embedding_model.encode_queries(final_queries)
+       query_embeddings = np.asarray(query_embeddings, dtype=np.float32).reshape(len(queries), -1)
        
-       # Update ranks after deduplication and trimming
-       for i, result in enumerate(results):
-           result['rank'] = i + 1
+       return self._search_embeddings(queries, final_queries, query_embeddings, top_k,
+                                      enable_deduplication, chunk_types)
+
+    def _ensure_index_loaded(self) -> None:
+       """Load the index from the default location if it is not loaded yet."""
+       if not self.index_manager.is_loaded():
+           if not self.load_index():
+               raise RuntimeError("Index not loaded and could not load from default location")
+
+    def _refine_query(self, query: str, refine_query: bool, show_refinement: bool,
+                     force_refine: bool = False) -> str:
+       """Apply query refinement if requested and available, falling back to the original query."""
+       if not (refine_query and self.query_refiner):
+           return query
+       if not (force_refine or self._needs_refinement(query)):
+           self.logger.debug(f"Skipping refinement of technical query: {query}")
+           return query
        
-       return results
+       try:
+           refined_query = self.query_refiner.refine_query(query)
+           if show_refinement:
+               self.logger.info(f"Original query: {query}")
+               self.logger.info(f"Refined query:  {refined_query}")
+           return refined_query
+       except Exception as e:
+           self.logger.warning(f"Query refinement failed: {e}")
+           self.logger.info("Using original query")
+           return query
 
-    def _deduplicate_results(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-       """Remove duplicate results based on content similarity and page titles."""
-       if not results:
-           return results
+    def _refine_queries(self, queries: List[str], refine_query: bool, show_refinement: bool,
+                       force_refine: bool = False) -> List[str]:
+       """Refine several queries in batches if requested and available, falling back to the originals."""
+       if not (refine_query and self.query_refiner):
+           return queries
        
-       seen_content = {}
-       deduplicated = []
-       original_count = len(results)
+       rows = [i for i, query in enumerate(queries) if force_refine or self._needs_refinement(query)]
+       if not rows:
+           return queries
        
-       for result in results:
-           # Create content hash for exact content matching
-           content_hash = hash(result['content'].strip())
-           
-           # Also check for very similar page titles (case-insensitive, punctuation-normalized)
-           normalized_title = self._normalize_title(result['page_title'])
-           
-           # Create a composite key that considers both content and normalized title
-           dedup_key = (content_hash, normalized_title)
+       try:
+           refined = self.query_refiner.refine_queries([queries[i] for i in rows])
+       except Exception as e:
+           self.logger.warning(f"Query refinement failed: {e}")
+           self.logger.info("Using original queries")
+           return queries
+       
+       refined_queries = list(queries)
+       for i, refined_query in zip(rows, refined):
+           refined_queries[i] = refined_query
+           if show_refinement:
+               self.logger.info(f"Original query: {queries[i]}")
+               self.logger.info(f"Refined query:  {refined_query}")
+       return refined_queries
+
+    def _needs_refinement(self, query: str) -> bool:
+       """Check whether a query is worth refining; page names and technical terms already match."""
+       return needs_refinement(query) and not self._get_chunk_table().is_title(query)
+
+    def _search_embeddings(self, original_queries: List[str], queries: List[str],
+                          query_embeddings: np.ndarray, top_k: int,
+                          enable_deduplication: bool,
+                          chunk_types: Optional[List[str]]) -> List[List[SearchResult]]:
+       """Search the index with a matrix of L2-normalized query embeddings and format ranked results per query."""
+       # Search with higher top_k to account for deduplication
+       search_k = top_k * 3 if enable_deduplication else top_k
+       table = self._get_chunk_table()
+       if chunk_types is None:
+           scores, indices = self.index_manager.search(query_embeddings, search_k)
+       else:
+           allowed_ids = table.ids_for_types(chunk_types)
+           if len(allowed_ids) == 0:
+               return [[] for _ in queries]
+           scores, indices = self.index_manager.search(query_embeddings, search_k,
+                                                       allowed_ids=allowed_ids)
+       
+       chunks = self.index_manager.chunks
+       if self.config.enable_score_boosting:
+           # Query-dependent boost: exact page title matches, via the table's title word index
+           query_boost = np.ones(indices.shape, dtype=np.float64)
+           for row, query in enumerate(queries):
+               query_boost[row, table.title_matches(set(query.lower().split()), indices[row])] = TITLE_BOOST
            
-           if dedup_key not in seen_content:
-               # First occurrence of this content/title combination
-               seen_content[dedup_key] = len(deduplicated)
-               result['aliases'] = [result['page_title']]  # Track aliases
-               deduplicated.append(result)
-           else:
-               # Duplicate found - decide which one to keep
-               existing_idx = seen_content[dedup_key]
-               existing_result = deduplicated[existing_idx]
-               
-               # Add current page title as an alias
-               if result['page_title'] not in existing_result['aliases']:
-                   existing_result['aliases'].append(result['page_title'])
-               
-               # Keep the result with higher score
-               if result['score'] > existing_result['score']:
-                   # Update with higher scoring version but keep accumulated aliases
-                   aliases = existing_result['aliases']
-                   result['aliases'] = aliases
-                   deduplicated[existing_idx] = result
+           # Apply static boosts and order by boosted score in one compiled pass
+           boosted, order = rank_topk(scores, indices, table.static_boost, query_boost)
+       else:
+           # Raw similarity: FAISS already returns each row best first, invalid ids last
+           boosted, order = scores, np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
        
-       # Log deduplication stats
-       if original_count != len(deduplicated):
-           self.logger.info(f"Deduplication: {original_count} -> {len(deduplicated)} results")
+       all_results = []
+       for row, query in enumerate(queries):
+           # Pick survivors by FAISS id first, then build result dicts only for them
+           selected, alias_ids = self._select_results(table, indices[row], order[row], top_k,
+                                                       enable_deduplication)
+           
+           results = []
+           for pos, duplicate_ids in zip(selected, alias_ids):
+               chunk = chunks[indices[row, pos]]
+               aliases = None
+               if enable_deduplication:
+                   # Track aliases: titles of the duplicates merged into this result
+                   aliases = [chunk['page_title']]
+                   for duplicate_id in duplicate_ids:
+                       page_title = table.page_title(duplicate_id)
+                       if page_title not in aliases:
+                           aliases.append(page_title)
+               results.append(SearchResult(len(results) + 1, float(boosted[row, pos]), chunk,
+                                           original_queries[row], query, aliases))
            
-           # Log which titles were merged
-           for result in deduplicated:
-               if len(result['aliases']) > 1:
-                   self.logger.debug(f"Merged aliases: {', '.join(result['aliases'])}")
+           all_results.append(results)
        
-       return deduplicated
+       return all_results
 
-    def _normalize_title(self, title: str) -> str:
-       """Normalize page title for deduplication comparison."""
-       # Convert to lowercase and replace common variations
-       normalized = title.lower()
+    def _select_results(self, table: ChunkTable, row_indices: np.ndarray, row_order: np.ndarray,
+                       top_k: int, enable_deduplication: bool) -> Tuple[List[int], List[List[int]]]:
+       """Pick up to top_k result positions of one query, with the FAISS ids of their duplicates.
+       
+       Candidates come best first, so the first chunk with a dedup key is the one kept and
+       later duplicates are only recorded for its aliases.
+       """
+       num_chunks = table.size
+       if not enable_deduplication:
+           valid = [pos for pos in row_order if 0 <= row_indices[pos] < num_chunks]
+           return valid[:top_k], [[] for _ in valid[:top_k]]
        
-       # Remove/normalize common punctuation and spacing
-       replacements = {
-           '-': '',
-           '_': '',
-           ' ': '',
-           'wi-fi': 'wifi',
-           'wi_fi': 'wifi',
-       }
+       selected: List[int] = []
+       alias_ids: List[List[int]] = []
+       kept: Dict[Tuple[int, str], int] = {}
+       num_candidates = 0
+       for pos in row_order:
+           idx = row_indices[pos]
+           if not 0 <= idx < num_chunks:
+               continue
+           num_candidates += 1
+           
+           dedup_key = table.dedup_key(idx)
+           if dedup_key in kept:
+               if kept[dedup_key] >= 0:
+                   alias_ids[kept[dedup_key]].append(idx)
+           elif len(selected) == top_k:
+               # Unique but past top_k: counted for the log, never formatted
+               kept[dedup_key] = -1
+           else:
+               kept[dedup_key] = len(selected)
+               selected.append(pos)
+               alias_ids.append([])
        
-       for old, new in replacements.items():
-           normalized = normalized.replace(old, new)
+       if num_candidates != len(kept):
+           self.logger.info(f"Deduplication: {num_candidates} -> {len(kept)} results")
        
-       return normalized
+       return selected, alias_ids
 
     def search_interactive(self, top_k: Optional[int] = None, show_refinement: bool = True):
        """Interactive search loop."""
@@ -0,0 +1,73 @@
+"""
+Lightweight search result records.
+"""
+
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional
+
+
+# Keys of a result, in the order the former result dicts listed them
+RESULT_KEYS = ('rank', 'score', 'page_title', 'section_path', 'url', 'content', 'chunk_type',
+               'section_level', 'original_query', 'final_query', 'full_chunk', 'aliases')
+
+# Keys read straight from the chunk on access instead of being copied per result
+CHUNK_KEYS = frozenset({'page_title', 'section_path', 'url', 'content', 'chunk_type', 'section_level'})
+
+
+class SearchResult(Mapping):
+   """One ranked search hit, read like the result dicts it replaces (result['page_title']).
+
+   Only the per-query values are stored, in slots; chunk fields are looked up in
+   full_chunk when accessed. 'aliases' is present only when deduplication ran.
+   """
+
+   __slots__ = ('rank', 'score', 'original_query', 'final_query', 'full_chunk', 'aliases')
+
+   def __init__(self, rank: int, score: float, chunk: Dict[str, Any], original_query: str,
+                final_query: str, aliases: Optional[List[str]] = None):
+       """Create a result for a chunk."""
+       self.rank = rank
+       self.score = score
+       self.original_query = original_query
+       self.final_query = final_query
+       self.full_chunk = chunk
+       self.aliases = aliases
+
+   def __getitem__(self, key: str) -> Any:
+       if key in CHUNK_KEYS:
+           return self.full_chunk[key]
+       if key in self.__slots__ and (key != 'aliases' or self.aliases is not None):
+           return getattr(self, key)
+       raise KeyError(key)
+
+   def __setitem__(self, key: str, value: Any) -> None:
+       if key not in self.__slots__:
+           raise KeyError(key)
+       setattr(self, key, value)
+
+   def __iter__(self) -> Iterator[str]:
+       if self.aliases is None:
+           return iter(RESULT_KEYS[:-1])
+       return iter(RESULT_KEYS)
+
+   def __len__(self) -> int:
+       return len(RESULT_KEYS) - (self.aliases is None)
+
+   def __getattr__(self, name: str) -> Any:
+       # Only reached for names that aren't slots, e.g. result.page_title
+       if name in CHUNK_KEYS:
+           return self.full_chunk[name]
+       raise AttributeError(name)
+
+   def __repr__(self) -> str:
+       return (f"SearchResult(rank={self.rank}, score={self.score:.4f}, "
+               f"page_title={self['page_title']!r}, section_path={self['section_path']!r})")
+
+   def copy(self, original_query: Optional[str] = None, final_query: Optional[str] = None) -> "SearchResult":
+       """Copy the result, optionally for other queries; the chunk is shared, aliases are not."""
+       return SearchResult(
+           self.rank, self.score, self.full_chunk,
+           self.original_query if original_query is None else original_query,
+           self.final_query if final_query is None else final_query,
+           None if self.aliases is None else list(self.aliases)
+       )
@@ -0,0 +1,57 @@
+"""
+Semantic cache of recent search results, matched by query embedding similarity.
+"""
+
+import numpy as np
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class SemanticCache:
+   """Fixed-size FIFO of recent query embeddings and their results.
+
+   A query is answered from the cache when a stored query embedding is at least
+   ``threshold`` cosine-similar to it and was searched with the same options.
+   """
+
+   def __init__(self, size: int, threshold: float):
+       """Initialize an empty cache holding up to size queries."""
+       self.size = size
+       self.threshold = threshold
+       self.hits = 0
+       self.misses = 0
+
+       # Unit query embeddings, one row per slot; empty slots are zero and never match
+       self._embeddings: Optional[np.ndarray] = None
+       self._entries: List[Optional[Tuple[Hashable, List[Dict[str, Any]]]]] = [None] * size
+       self._next = 0
+
+   def get(self, embedding: np.ndarray, key: Hashable) -> Optional[List[Dict[str, Any]]]:
+       """Get the results of the most similar cached query with the same key, if similar enough."""
+       if self._embeddings is not None:
+           similarities = self._embeddings @ embedding
+           candidates = np.flatnonzero(similarities >= self.threshold)
+           for slot in candidates[np.argsort(-similarities[candidates])]:
+               entry = self._entries[slot]
+               if entry is not None and entry[0] == key:
+                   self.hits += 1
+                   return entry[1]
+
+       self.misses += 1
+       return None
+
+   def put(self, embedding: np.ndarray, key: Hashable, results: List[Dict[str, Any]]) -> None:
+       """Cache a query's results, replacing the oldest entry once full."""
+       if self.size <= 0:
+           return
+       if self._embeddings is None:
+           self._embeddings = np.zeros((self.size, len(embedding)), dtype=np.float32)
+
+       self._embeddings[self._next] = embedding
+       self._entries[self._next] = (key, results)
+       self._next = (self._next + 1) % self.size
+
+   def clear(self) -> None:
+       """Drop all cached results, e.g. after the index changed."""
+       self._embeddings = None
+       self._entries = [None] * self.size
+       self._next = 0
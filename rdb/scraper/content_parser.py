@@ -2,7 +2,6 @@
 Content parser for extracting structured data from HTML.
 """
 
-import re
 from bs4 import BeautifulSoup, Tag
 from urllib.parse import unquote
 from typing import Dict, List, Any, Optional
@@ -23,11 +22,9 @@ class ContentParser:
        if not text:
            return ""
        
-       # Remove [edit] links
-       text = re.sub(r'\[edit\]', '', text)
-       # Remove multiple spaces
-       text = re.sub(r'\s+', ' ', text)
-       return text.strip()
+       # Remove [edit] links, then collapse whitespace runs; str.split() splits on the
+       # same characters as \s and is much faster than two regex substitutions
+       return ' '.join(text.replace('[edit]', '').split())
    
    def extract_content(self, soup: BeautifulSoup, url: str) -> Optional[Dict[str, Any]]:
        """Extract structured content from a wiki page."""
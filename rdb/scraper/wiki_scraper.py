@@ -3,21 +3,76 @@ Arch Wiki scraper for RDB.
 """
 
 import os
+import re
 import requests
-from bs4 import BeautifulSoup
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
+import gzip
 import time
 import random
-from urllib.parse import urljoin, unquote
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing
+from hashlib import blake2b
+from urllib.parse import quote, unquote
 from pathlib import Path
-from typing import List, Optional
+from typing import Deque, Iterator, List, Optional
 import logging
 
 from ..config.settings import Config
 from ..utils.logging import get_logger
+from ..utils.helpers import PAGES_JSONL, dumps_json, read_json_file, read_jsonl_file, trim_partial_line
 from .content_parser import ContentParser
 
 
+# lxml builds the tree several times faster than the pure-Python html.parser
+HTML_PARSER = 'lxml'
+
+# Pages are parsed only as far as the article body the content parser reads
+CONTENT_ONLY = SoupStrainer('div', id='mw-content-text')
+
+# Namespaces and translations left out of the page list
+EXCLUDED_TITLE_PATTERNS = [
+    'Special:', 'Talk:', 'User:', 'File:', 'International_communities',
+    # European languages
+    '(Polski)', '(Español)', '(Português)', '(Français)', '(Deutsch)',
+    '(Italiano)', '(Nederlands)', '(Svenska)', '(Dansk)', '(Norsk)',
+    '(Suomi)', '(Magyar)', '(Čeština)', '(Slovenčina)', '(Slovenščina)',
+    '(Hrvatski)', '(Bosanski)', '(Lietuvių)', '(Română)', '(Türkçe)',
+    '(Ελληνικά)', '(Български)', '(Српски)', '(Українська)',
+    # Cyrillic
+    '(Русский)',
+    # Asian languages
+    '(简体中文)', '(繁體中文)', '(正體中文)', '(日本語)', '(한국어)',
+    '(ไทย)', '(हिन्दी)', '(বাংলা)',
+    # Middle Eastern/Other
+    '(العربية)', '(עברית)', '(فارسی)',
+    # Constructed/Regional
+    '(Esperanto)', '(Català)', '(Bahasa Indonesia)', '(Qhichwa)',
+    # Additional variations I spotted
+    '(Norsk Bokmål)'
+]
+
+# All patterns as one alternation, so each title is scanned once instead of once per pattern
+EXCLUDED_TITLES_RE = re.compile('|'.join(map(re.escape, EXCLUDED_TITLE_PATTERNS)))
+
+# Characters of page titles that can't appear in file names
+UNSAFE_FILENAME_CHARS = str.maketrans('/\\:', '___')
+
+# Characters MediaWiki leaves unescaped in /title/ URLs
+PATH_SAFE_CHARS = "/:()!*,;@$~'"
+
+
+def content_digest(page_data: dict) -> Optional[bytes]:
+    """Get a digest of a page's section text, ignoring case and whitespace; None if it has none."""
+    text = ' '.join(section.get('content', '') for section in page_data.get('sections', []))
+    normalized = ' '.join(text.lower().split())
+    if not normalized:
+        return None
+    return blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+
+
 class WikiScraper:
     """Scraper for Arch Wiki documentation."""
 
@@ -36,67 +91,50 @@ class WikiScraper:
        # Base URL for Arch Wiki
        self.base_url = "https://wiki.archlinux.org"
        
+       # Keep-alive connections shared by all requests, so each page skips the TCP/TLS handshake.
+       # The session's default Accept-Encoding asks for gzip/deflate, and for brotli too when
+       # the brotli package is installed, so only encodings requests can decode are offered
+       self.session = requests.Session()
+       self.session.headers.update(self.headers)
+       retry = Retry(total=config.scrape_max_retries, backoff_factor=0.5,
+                     status_forcelist=[429, 500, 502, 503, 504])
+       self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max(1, config.scrape_workers),
+                                                   max_retries=retry))
+       
     def get_all_pages(self) -> List[str]:
        """Get list of all pages on Arch Wiki."""
        self.logger.info("Getting list of all Arch Wiki pages...")
-       exclude_patterns = [
-
-           'Special:', 'Talk:', 'User:', 'File:', 'International_communities',
-           # European languages
-           '(Polski)', '(Español)', '(Português)', '(Français)', '(Deutsch)', 
-           '(Italiano)', '(Nederlands)', '(Svenska)', '(Dansk)', '(Norsk)',
-           '(Suomi)', '(Magyar)', '(Čeština)', '(Slovenčina)', '(Slovenščina)',
-           '(Hrvatski)', '(Bosanski)', '(Lietuvių)', '(Română)', '(Türkçe)',
-           '(Ελληνικά)', '(Български)', '(Српски)', '(Українська)',
-           # Cyrillic
-           '(Русский)',
-           # Asian languages  
-           '(简体中文)', '(繁體中文)', '(正體中文)', '(日本語)', '(한국어)',
-           '(ไทย)', '(हिन्दी)', '(বাংলা)',
-           # Middle Eastern/Other
-           '(العربية)', '(עברית)', '(فارسی)',
-           # Constructed/Regional
-           '(Esperanto)', '(Català)', '(Bahasa Indonesia)', '(Qhichwa)',
-           # Additional variations I spotted
-           '(Norsk Bokmål)'
-       ]
        
        all_pages = []
-       next_page_url = f"{self.base_url}/title/Special:AllPages?hideredirects=1"
+       # The MediaWiki API lists 500 titles per request as JSON, against ~200 per AllPages HTML page
+       params = {
+           'action': 'query',
+           'list': 'allpages',
+           'apnamespace': 0,
+           'apfilterredir': 'nonredirects',
+           'aplimit': 500,
+           'format': 'json'
+       }
        
-       while next_page_url:
-           self.logger.debug(f"Fetching page list from: {next_page_url}")
+       while params:
+           self.logger.debug(f"Fetching page list from: {params.get('apcontinue', 'start')}")
            
            try:
-               response = requests.get(next_page_url, headers=self.headers, timeout=30)
+               response = self.session.get(f"{self.base_url}/api.php", params=params, timeout=30)
                response.raise_for_status()
-           except requests.RequestException as e:
+               data = response.json()
+           except (requests.RequestException, ValueError) as e:
                self.logger.error(f"Error fetching page list: {e}")
                break
-               
-           soup = BeautifulSoup(response.text, 'html.parser')
            
-           # Extract page links
-           content = soup.find('div', {'class': 'mw-allpages-body'})
-           if content:
-               for link in content.find_all('a'):
-                   href = link.get('href')
-                   if href and '/title/' in href:
-                       href = href.replace('/title//', '/title/')
-                       page_url = urljoin(self.base_url, href)
-
-                       # Decode URL before filtering
-                       decoded_url = unquote(page_url)
-
-                       if not any(pattern in decoded_url for pattern in exclude_patterns):
-                           all_pages.append(page_url)
-           # Find next page link
-           next_page_url = None
-           nav_links = soup.find('div', {'class': 'mw-allpages-nav'})
-           if nav_links:
-               next_links = [link for link in nav_links.find_all('a') if 'Next page' in link.text]
-               if next_links:
-                   next_page_url = urljoin(self.base_url, next_links[0].get('href'))
+           for page in data.get('query', {}).get('allpages', []):
+               title = page['title']
+               path_title = title.replace(' ', '_')
+               if not (EXCLUDED_TITLES_RE.search(title) or EXCLUDED_TITLES_RE.search(path_title)):
+                   all_pages.append(f"{self.base_url}/title/{quote(path_title, safe=PATH_SAFE_CHARS)}")
+           
+           # Continue from where this batch ended, if there are more pages
+           params = {**params, **data['continue']} if 'continue' in data else None
            
            # Be respectful to the server
            time.sleep(1)
@@ -110,7 +148,7 @@ class WikiScraper:
             page_title = unquote(url.split('/title/')[-1].replace('_', ' '))
             self.logger.debug(f"Scraping: {page_title}")
             
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = self.session.get(url, timeout=30)
             response.raise_for_status()
             
             # Check if this was a redirect
@@ -121,7 +159,7 @@ class WikiScraper:
                 canonical_title = unquote(canonical_url.split('/title/')[-1].replace('_', ' '))
                 self.logger.debug(f"Redirect detected: {page_title} -> {canonical_title}")
             
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = BeautifulSoup(response.text, HTML_PARSER, parse_only=CONTENT_ONLY)
             page_data = self.parser.extract_content(soup, canonical_url)
             
             if page_data:
@@ -146,15 +184,58 @@ class WikiScraper:
            self.logger.error(f"Error scraping {url}: {e}")
            return None
 
+    def _fetch_page(self, url: str) -> Optional[dict]:
+        """Scrape a page after a random delay, so each worker keeps its own polite request rate."""
+        time.sleep(random.uniform(self.config.scrape_delay_min, self.config.scrape_delay_max))
+        return self.scrape_page(url)
+
+    def _fetch_pages(self, urls: List[str]) -> Iterator[Optional[dict]]:
+        """Scrape pages with the configured workers, yielding results in order.
+        
+        At most two pages per worker are queued or in progress, and closing the
+        generator (e.g. on Ctrl-C in the caller) cancels the ones not yet started.
+        """
+        workers = max(1, self.config.scrape_workers)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        queued: Deque[Future] = deque()
+        try:
+            for url in urls:
+                queued.append(executor.submit(self._fetch_page, url))
+                if len(queued) >= 2 * workers:
+                    yield queued.popleft().result()
+            while queued:
+                yield queued.popleft().result()
+        finally:
+            # Same as shutdown(cancel_futures=True), which needs Python 3.9
+            for future in queued:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _page_files(self, output_dir: Path, safe_title: str) -> List[Path]:
+       """Get possible output files for a page, preferred format first."""
+       plain_file = output_dir / f"{safe_title}.json"
+       gzip_file = output_dir / f"{safe_title}.json.gz"
+       if self.config.compress_raw_pages:
+           return [gzip_file, plain_file]
+       return [plain_file, gzip_file]
+
     def save_page(self, page_data: dict, output_dir: Path) -> bool:
-       """Save page data to JSON file."""
+       """Save page data to JSON file, gzip-compressed if enabled in the config, or append it to pages.jsonl."""
        try:
+           if self.config.raw_pages_jsonl:
+               with open(output_dir / PAGES_JSONL, 'ab') as f:
+                   f.write(dumps_json(page_data) + b'\n')
+               return True
+           
            page_title = page_data.get('title', 'Unknown')
-           safe_title = page_title.replace('/', '_').replace('\\', '_').replace(':', '_')
-           output_file = output_dir / f"{safe_title}.json"
+           safe_title = page_title.translate(UNSAFE_FILENAME_CHARS)
+           output_file = self._page_files(output_dir, safe_title)[0]
            
-           with open(output_file, 'w', encoding='utf-8') as f:
-               json.dump(page_data, f, indent=2, ensure_ascii=False)
+           if output_file.suffix == '.gz':
+               with gzip.open(output_file, 'wb') as f:
+                   f.write(dumps_json(page_data))
+           else:
+               output_file.write_bytes(dumps_json(page_data, indent=True))
            
            return True
            
@@ -171,8 +252,9 @@ class WikiScraper:
         
         output_dir.mkdir(parents=True, exist_ok=True)
         
-        # Track canonical URLs to avoid scraping duplicates
+        # Track canonical URLs and page content digests to avoid saving duplicates
         canonical_urls_seen = set()
+        content_digests_seen = set()
         redirect_mappings = {}  # original_url -> canonical_url
         
         # Get or load page list
@@ -180,13 +262,11 @@ class WikiScraper:
         
         if page_list_file.exists():
             self.logger.info("Loading existing page list...")
-            with open(page_list_file, 'r', encoding='utf-8') as f:
-                page_list = json.load(f)
+            page_list = read_json_file(page_list_file)
         else:
             page_list = self.get_all_pages()
             # Save page list for future reference
-            with open(page_list_file, 'w', encoding='utf-8') as f:
-                json.dump(page_list, f, indent=2)
+            page_list_file.write_bytes(dumps_json(page_list, indent=True))
         
         # Process pages
         total_pages = len(page_list)
@@ -196,56 +276,72 @@ class WikiScraper:
         
         self.logger.info(f"Starting scraping of {total_pages} pages...")
         
+        # One directory listing instead of a stat per page when resuming
+        existing_files = {entry.name for entry in os.scandir(output_dir)}
+        if PAGES_JSONL in existing_files:
+            # A page cut off by an interrupted append is dropped, so it is scraped again
+            # and the next append doesn't continue the partial line
+            if trim_partial_line(output_dir / PAGES_JSONL):
+                self.logger.warning(f"Removed an incomplete last page from {PAGES_JSONL}")
+            # Pages appended to the shard count as saved under their file names
+            for page_data in read_jsonl_file(output_dir / PAGES_JSONL):
+                safe_title = page_data.get('title', 'Unknown').translate(UNSAFE_FILENAME_CHARS)
+                existing_files.update(page_file.name for page_file in self._page_files(output_dir, safe_title))
+        
+        pending = []
         for i, url in enumerate(page_list):
             page_title = unquote(url.split('/title/')[-1].replace('_', ' '))
-            safe_title = page_title.replace('/', '_').replace('\\', '_').replace(':', '_')
-            output_file = output_dir / f"{safe_title}.json"
+            safe_title = page_title.translate(UNSAFE_FILENAME_CHARS)
             
-            # Skip if already exists
-            if output_file.exists():
+            # Skip if already exists in either format
+            if any(page_file.name in existing_files for page_file in self._page_files(output_dir, safe_title)):
                 skip_count += 1
                 if i % 50 == 0:
                     self.logger.info(f"Progress: {i+1}/{total_pages} - "
                                    f"Skipped: {skip_count}, Success: {success_count}, Error: {error_count}")
                 continue
-            
-            # Scrape page
-            page_data = self.scrape_page(url)
-            if page_data:
-                canonical_url = page_data.get('canonical_url', url)
-                
-                # Check if we've already scraped this canonical URL
-                if canonical_url in canonical_urls_seen:
-                    # Store redirect mapping but skip saving
-                    redirect_mappings[url] = canonical_url
-                    skip_count += 1
-                    self.logger.debug(f"Skipping duplicate canonical URL: {canonical_url}")
-                else:
-                    # Mark canonical URL as seen
-                    canonical_urls_seen.add(canonical_url)
+            pending.append((i, url))
+        
+        # Pages are fetched by a few workers, but results are handled here in page list order
+        with closing(self._fetch_pages([url for _, url in pending])) as fetched:
+            for (i, url), page_data in zip(pending, fetched):
+                if page_data:
+                    canonical_url = page_data.get('canonical_url', url)
+                    digest = content_digest(page_data)
                     
-                    # Save the page
-                    if self.save_page(page_data, output_dir):
-                        success_count += 1
+                    # Check if we've already scraped this canonical URL
+                    if canonical_url in canonical_urls_seen:
+                        # Store redirect mapping but skip saving
+                        redirect_mappings[url] = canonical_url
+                        skip_count += 1
+                        self.logger.debug(f"Skipping duplicate canonical URL: {canonical_url}")
+                    elif digest is not None and digest in content_digests_seen:
+                        # Different page with the same text, e.g. a mirror of another page
+                        canonical_urls_seen.add(canonical_url)
+                        skip_count += 1
+                        self.logger.debug(f"Skipping duplicate content: {canonical_url}")
                     else:
-                        error_count += 1
-            else:
-                error_count += 1
-            
-            # Progress logging
-            if i % 50 == 0 or i == total_pages - 1:
-                self.logger.info(f"Progress: {i+1}/{total_pages} - "
-                               f"Skipped: {skip_count}, Success: {success_count}, Error: {error_count}")
-            
-            # Rate limiting
-            delay = random.uniform(self.config.scrape_delay_min, self.config.scrape_delay_max)
-            time.sleep(delay)
+                        # Mark canonical URL and content as seen
+                        canonical_urls_seen.add(canonical_url)
+                        content_digests_seen.add(digest)
+                        
+                        # Save the page
+                        if self.save_page(page_data, output_dir):
+                            success_count += 1
+                        else:
+                            error_count += 1
+                else:
+                    error_count += 1
+                
+                # Progress logging
+                if i % 50 == 0 or i == total_pages - 1:
+                    self.logger.info(f"Progress: {i+1}/{total_pages} - "
+                                   f"Skipped: {skip_count}, Success: {success_count}, Error: {error_count}")
         
         # Save redirect mappings for reference
         if redirect_mappings:
             redirect_file = output_dir / "redirects.json"
-            with open(redirect_file, 'w', encoding='utf-8') as f:
-                json.dump(redirect_mappings, f, indent=2)
+            redirect_file.write_bytes(dumps_json(redirect_mappings, indent=True))
             self.logger.info(f"Saved {len(redirect_mappings)} redirect mappings to {redirect_file}")
         
         self.logger.info(f"Scraping complete! Total: {total_pages}, "
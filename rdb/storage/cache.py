@@ -2,15 +2,24 @@
 Cache manager for temporary storage and performance optimization.
 """
 
+import os
 import json
-import pickle
+import time
 import hashlib
+import sqlite3
+import numpy as np
 from pathlib import Path
 from typing import Any, Optional, Dict
 from datetime import datetime, timedelta
 
 from ..config.settings import Config
 from ..utils.logging import get_logger
+from ..utils.helpers import dumps_json, loads_json
+
+
+# Embedding cache: one float32 matrix file per dimension, and an SQLite index of
+# cache key -> row, instead of a pickle file per embedding
+EMBEDDING_INDEX_FILE = "index.db"
 
 
 class CacheManager:
@@ -31,13 +40,17 @@ class CacheManager:
            cache_path.mkdir(parents=True, exist_ok=True)
    
    def _get_cache_key(self, data: Any) -> str:
-       """Generate cache key from data."""
+       """Generate a 128-bit hex cache key from data."""
        if isinstance(data, str):
            content = data
        else:
            content = json.dumps(data, sort_keys=True)
        
-       return hashlib.md5(content.encode()).hexdigest()
+       return self._key_for_text(content)
+   
+   def _key_for_text(self, text: str) -> str:
+       """Generate the cache key of a string, as used by all cache entry points."""
+       return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
    
    def _is_cache_valid(self, cache_file: Path, max_age_hours: int = 24) -> bool:
        """Check if cache file is still valid."""
@@ -47,74 +60,115 @@ class CacheManager:
        file_age = datetime.now() - datetime.fromtimestamp(cache_file.stat().st_mtime)
        return file_age < timedelta(hours=max_age_hours)
    
+   def _embedding_index(self) -> sqlite3.Connection:
+       """Open the embedding cache index, creating its table if needed."""
+       conn = sqlite3.connect(self.embeddings_cache / EMBEDDING_INDEX_FILE)
+       conn.execute("""
+           CREATE TABLE IF NOT EXISTS embeddings (
+               key TEXT PRIMARY KEY,
+               dim INTEGER,
+               row INTEGER,
+               model_name TEXT,
+               timestamp REAL
+           )
+       """)
+       return conn
+   
+   def _embedding_vectors_file(self, dim: int) -> Path:
+       """Get the float32 matrix file holding cached embeddings of a dimension."""
+       return self.embeddings_cache / f"vectors_{dim}.f32"
+   
    def cache_embedding(self, text: str, embedding: Any, model_name: str) -> None:
        """Cache an embedding for a text."""
-       cache_key = self._get_cache_key(f"{model_name}:{text}")
-       cache_file = self.embeddings_cache / f"{cache_key}.pkl"
+       cache_key = self._key_for_text(f"{model_name}:{text}")
+       vector = np.asarray(embedding, dtype=np.float32).ravel()
+       dim = len(vector)
        
        try:
-           with open(cache_file, 'wb') as f:
-               pickle.dump({
-                   'text': text,
-                   'embedding': embedding,
-                   'model_name': model_name,
-                   'timestamp': datetime.now()
-               }, f)
+           conn = self._embedding_index()
+           try:
+               with conn:
+                   # Take the write lock first, so no other process can pick the same new row
+                   conn.execute("BEGIN IMMEDIATE")
+                   existing = conn.execute("SELECT row FROM embeddings WHERE key = ? AND dim = ?",
+                                           (cache_key, dim)).fetchone()
+                   if existing is not None:
+                       row = existing[0]
+                   else:
+                       row = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM embeddings WHERE dim = ?",
+                                          (dim,)).fetchone()[0]
+                   
+                   # Rows are written in place, so the file only grows for new keys
+                   vectors_file = self._embedding_vectors_file(dim)
+                   with open(vectors_file, 'r+b' if vectors_file.exists() else 'w+b') as f:
+                       f.seek(row * vector.nbytes)
+                       f.write(vector.tobytes())
+                   
+                   conn.execute("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)",
+                                (cache_key, dim, row, model_name, datetime.now().timestamp()))
+           finally:
+               conn.close()
        except Exception as e:
            self.logger.warning(f"Failed to cache embedding: {e}")
    
-   def get_cached_embedding(self, text: str, model_name: str, max_age_hours: int = 168) -> Optional[Any]:
-       """Get cached embedding for text (default 7 days)."""
-       cache_key = self._get_cache_key(f"{model_name}:{text}")
-       cache_file = self.embeddings_cache / f"{cache_key}.pkl"
-       
-       if not self._is_cache_valid(cache_file, max_age_hours):
+   def get_cached_embedding(self, text: str, model_name: str, max_age_hours: int = 168) -> Optional[np.ndarray]:
+       """Get cached embedding for text as a float32 array (default 7 days)."""
+       if not (self.embeddings_cache / EMBEDDING_INDEX_FILE).exists():
            return None
        
+       cache_key = self._key_for_text(f"{model_name}:{text}")
+       min_timestamp = (datetime.now() - timedelta(hours=max_age_hours)).timestamp()
+       
        try:
-           with open(cache_file, 'rb') as f:
-               cached_data = pickle.load(f)
-               return cached_data['embedding']
+           conn = self._embedding_index()
+           try:
+               entry = conn.execute("SELECT dim, row FROM embeddings WHERE key = ? AND timestamp > ?",
+                                    (cache_key, min_timestamp)).fetchone()
+           finally:
+               conn.close()
+           if entry is None:
+               return None
+           
+           dim, row = entry
+           vectors = np.memmap(self._embedding_vectors_file(dim), dtype=np.float32, mode='r').reshape(-1, dim)
+           return np.array(vectors[row])
        except Exception as e:
            self.logger.warning(f"Failed to load cached embedding: {e}")
            return None
    
    def cache_query_refinement(self, original_query: str, refined_query: str, model_name: str) -> None:
        """Cache a query refinement."""
-       cache_key = self._get_cache_key(f"{model_name}:{original_query}")
+       cache_key = self._key_for_text(f"{model_name}:{original_query}")
        cache_file = self.queries_cache / f"{cache_key}.json"
        
        try:
-           with open(cache_file, 'w', encoding='utf-8') as f:
-               json.dump({
-                   'original_query': original_query,
-                   'refined_query': refined_query,
-                   'model_name': model_name,
-                   'timestamp': datetime.now().isoformat()
-               }, f, indent=2)
+           cache_file.write_bytes(dumps_json({
+               'original_query': original_query,
+               'refined_query': refined_query,
+               'model_name': model_name,
+               'timestamp': datetime.now().isoformat()
+           }, indent=True))
        except Exception as e:
            self.logger.warning(f"Failed to cache query refinement: {e}")
    
    def get_cached_query_refinement(self, original_query: str, model_name: str, 
                                   max_age_hours: int = 24) -> Optional[str]:
        """Get cached query refinement."""
-       cache_key = self._get_cache_key(f"{model_name}:{original_query}")
+       cache_key = self._key_for_text(f"{model_name}:{original_query}")
        cache_file = self.queries_cache / f"{cache_key}.json"
        
        if not self._is_cache_valid(cache_file, max_age_hours):
            return None
        
        try:
-           with open(cache_file, 'r', encoding='utf-8') as f:
-               cached_data = json.load(f)
-               return cached_data['refined_query']
+           return loads_json(cache_file.read_bytes())['refined_query']
        except Exception as e:
            self.logger.warning(f"Failed to load cached query refinement: {e}")
            return None
    
    def cache_page_content(self, url: str, content: Dict[str, Any]) -> None:
        """Cache scraped page content."""
-       cache_key = self._get_cache_key(url)
+       cache_key = self._key_for_text(url)
        cache_file = self.pages_cache / f"{cache_key}.json"
        
        try:
@@ -124,23 +178,20 @@ class CacheManager:
                'timestamp': datetime.now().isoformat()
            }
            
-           with open(cache_file, 'w', encoding='utf-8') as f:
-               json.dump(cache_data, f, indent=2, ensure_ascii=False)
+           cache_file.write_bytes(dumps_json(cache_data, indent=True))
        except Exception as e:
            self.logger.warning(f"Failed to cache page content: {e}")
    
    def get_cached_page_content(self, url: str, max_age_hours: int = 168) -> Optional[Dict[str, Any]]:
        """Get cached page content (default 7 days)."""
-       cache_key = self._get_cache_key(url)
+       cache_key = self._key_for_text(url)
        cache_file = self.pages_cache / f"{cache_key}.json"
        
        if not self._is_cache_valid(cache_file, max_age_hours):
            return None
        
        try:
-           with open(cache_file, 'r', encoding='utf-8') as f:
-               cached_data = json.load(f)
-               return cached_data['content']
+           return loads_json(cache_file.read_bytes())['content']
        except Exception as e:
            self.logger.warning(f"Failed to load cached page content: {e}")
            return None
@@ -186,26 +237,69 @@ class CacheManager:
            cache_files = list(cache_dir.iterdir())
            total_size = sum(f.stat().st_size for f in cache_files if f.is_file())
            
+           # Embeddings share the index and vector files, so they are counted by index entry
+           file_count = self._embedding_count() if cache_dir == self.embeddings_cache else len(cache_files)
+           
            stats[cache_name] = {
-               "file_count": len(cache_files),
+               "file_count": file_count,
                "total_size_mb": round(total_size / (1024 * 1024), 2),
                "directory": str(cache_dir)
            }
        
        return stats
    
+   def _embedding_count(self) -> int:
+       """Count the entries in the embedding cache index."""
+       if not (self.embeddings_cache / EMBEDDING_INDEX_FILE).exists():
+           return 0
+       
+       try:
+           conn = self._embedding_index()
+           try:
+               return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+           finally:
+               conn.close()
+       except Exception as e:
+           self.logger.warning(f"Failed to count cached embeddings: {e}")
+           return 0
+   
    def cleanup_expired_cache(self, max_age_hours: int = 168) -> int:
        """Remove expired cache files (default 7 days)."""
        cleaned_count = 0
        
-       for cache_dir in [self.embeddings_cache, self.queries_cache, self.pages_cache]:
-           for cache_file in cache_dir.iterdir():
-               if cache_file.is_file() and not self._is_cache_valid(cache_file, max_age_hours):
-                   try:
-                       cache_file.unlink()
-                       cleaned_count += 1
-                   except Exception as e:
-                       self.logger.warning(f"Failed to delete expired cache file {cache_file}: {e}")
+       # Per-embedding pickles from the old cache format are never read, so they always go
+       for legacy_file in self.embeddings_cache.glob("*.pkl"):
+           try:
+               legacy_file.unlink()
+               cleaned_count += 1
+           except Exception as e:
+               self.logger.warning(f"Failed to delete legacy embedding cache file {legacy_file}: {e}")
+       
+       # Embeddings share files, so they expire by index entry; the vector files keep their size
+       if (self.embeddings_cache / EMBEDDING_INDEX_FILE).exists():
+           min_timestamp = (datetime.now() - timedelta(hours=max_age_hours)).timestamp()
+           try:
+               conn = self._embedding_index()
+               try:
+                   with conn:
+                       cleaned_count += conn.execute("DELETE FROM embeddings WHERE timestamp <= ?",
+                                                     (min_timestamp,)).rowcount
+               finally:
+                   conn.close()
+           except Exception as e:
+               self.logger.warning(f"Failed to clean up expired embeddings: {e}")
+       
+       # Directory entries carry their file type and stat, so each file costs one stat at most
+       min_mtime = time.time() - max_age_hours * 3600
+       for cache_dir in [self.queries_cache, self.pages_cache]:
+           with os.scandir(cache_dir) as entries:
+               for entry in entries:
+                   if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime <= min_mtime:
+                       try:
+                           os.unlink(entry.path)
+                           cleaned_count += 1
+                       except Exception as e:
+                           self.logger.warning(f"Failed to delete expired cache file {entry.path}: {e}")
        
        self.logger.info(f"Cleaned up {cleaned_count} expired cache files")
        return cleaned_count
@@ -4,9 +4,10 @@ Database manager for persistent storage.
 
 import json
 import sqlite3
+import threading
 from pathlib import Path
 from typing import Dict, List, Any, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from ..config.settings import Config
 from ..utils.logging import get_logger
@@ -20,11 +21,18 @@ class DatabaseManager:
        self.config = config
        self.logger = get_logger(__name__)
        self.db_path = config.data_dir / "rdb.db"
+       
+       # One connection for the manager's lifetime instead of one per call; WAL lets
+       # readers run alongside the writer and makes commits cheaper
+       self._lock = threading.Lock()
+       self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+       self.conn.execute("PRAGMA journal_mode=WAL")
+       self.conn.execute("PRAGMA synchronous=NORMAL")
        self._init_database()
    
    def _init_database(self):
        """Initialize database tables if they don't exist."""
-       with sqlite3.connect(self.db_path) as conn:
+       with self._lock, self.conn as conn:
            cursor = conn.cursor()
            
            # Scraping sessions table
@@ -84,12 +92,16 @@ class DatabaseManager:
                )
            """)
            
+           # Search history is read newest first and pruned by age, sessions by completion time
+           cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_ts ON search_history(timestamp DESC)")
+           cursor.execute("CREATE INDEX IF NOT EXISTS idx_scrape_completed ON scraping_sessions(completed_at)")
+           
            conn.commit()
            self.logger.info(f"Database initialized at {self.db_path}")
    
    def log_scraping_session(self, session_data: Dict[str, Any]) -> int:
        """Log a scraping session to the database."""
-       with sqlite3.connect(self.db_path) as conn:
+       with self._lock, self.conn as conn:
            cursor = conn.cursor()
            
            cursor.execute("""
@@ -116,7 +128,7 @@ class DatabaseManager:
    
    def log_indexing_session(self, session_data: Dict[str, Any]) -> int:
        """Log an indexing session to the database."""
-       with sqlite3.connect(self.db_path) as conn:
+       with self._lock, self.conn as conn:
            cursor = conn.cursor()
            
            cursor.execute("""
@@ -143,7 +155,7 @@ class DatabaseManager:
    
    def log_search(self, search_data: Dict[str, Any]) -> int:
        """Log a search query to the database."""
-       with sqlite3.connect(self.db_path) as conn:
+       with self._lock, self.conn as conn:
            cursor = conn.cursor()
            
            cursor.execute("""
@@ -168,27 +180,28 @@ class DatabaseManager:
    
    def update_page_metadata(self, page_data: Dict[str, Any]):
        """Update or insert page metadata."""
-       with sqlite3.connect(self.db_path) as conn:
-           cursor = conn.cursor()
-           
-           cursor.execute("""
+       self.update_page_metadata_many([page_data])
+   
+   def update_page_metadata_many(self, pages: List[Dict[str, Any]]):
+       """Update or insert metadata of several pages in one transaction."""
+       now = datetime.now()
+       with self._lock, self.conn as conn:
+           conn.executemany("""
                INSERT OR REPLACE INTO page_metadata 
                (page_title, url, last_scraped, content_hash, section_count, word_count)
                VALUES (?, ?, ?, ?, ?, ?)
-           """, (
+           """, [(
                page_data.get('page_title'),
                page_data.get('url'),
-               datetime.now(),
+               now,
                page_data.get('content_hash'),
                page_data.get('section_count', 0),
                page_data.get('word_count', 0)
-           ))
-           
-           conn.commit()
+           ) for page_data in pages])
    
    def get_recent_searches(self, limit: int = 50) -> List[Dict[str, Any]]:
        """Get recent search history."""
-       with sqlite3.connect(self.db_path) as conn:
+       with self._lock, self.conn as conn:
            cursor = conn.cursor()
            
            cursor.execute("""
@@ -207,7 +220,7 @@ class DatabaseManager:
    
    def get_scraping_stats(self) -> Dict[str, Any]:
        """Get scraping statistics."""
-       with sqlite3.connect(self.db_path) as conn:
+       with self._lock, self.conn as conn:
            cursor = conn.cursor()
            
            cursor.execute("""
@@ -231,7 +244,7 @@ class DatabaseManager:
    
    def get_search_stats(self) -> Dict[str, Any]:
        """Get search statistics."""
-       with sqlite3.connect(self.db_path) as conn:
+       with self._lock, self.conn as conn:
            cursor = conn.cursor()
            
            cursor.execute("""
@@ -254,10 +267,10 @@ class DatabaseManager:
    
    def cleanup_old_data(self, days_old: int = 30):
        """Remove old search history and session data."""
-       with sqlite3.connect(self.db_path) as conn:
+       with self._lock, self.conn as conn:
            cursor = conn.cursor()
            
-           cutoff_date = datetime.now().replace(day=datetime.now().day - days_old)
+           cutoff_date = datetime.now() - timedelta(days=days_old)
            
            cursor.execute("""
                DELETE FROM search_history 
@@ -276,3 +289,14 @@ class DatabaseManager:
            conn.commit()
            
            self.logger.info(f"Cleaned up {deleted_searches} old searches and {deleted_sessions} old sessions")
+   
+   def close(self):
+       """Close the database connection."""
+       with self._lock:
+           self.conn.close()
+   
+   def __enter__(self) -> "DatabaseManager":
+       return self
+   
+   def __exit__(self, exc_type, exc_value, traceback) -> None:
+       self.close()
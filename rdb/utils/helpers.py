@@ -2,13 +2,30 @@
 Helper utilities for RDB.
 """
 
+import os
 import re
+import gzip
+import json
 import hashlib
 import time
 from pathlib import Path
-from typing import Union, List, Dict, Any
+from typing import Union, List, Dict, Any, Iterator
 from datetime import datetime, timedelta
 
+from .logging import get_logger
+
+try:
+   import orjson
+except ImportError:
+   orjson = None
+
+
+# Scraped page files, plain or gzip-compressed
+JSON_FILE_PATTERNS = ("*.json", "*.json.gz")
+
+# Scraped pages appended as one JSON document per line, instead of a file per page
+PAGES_JSONL = "pages.jsonl"
+
 
 def sanitize_filename(filename: str, max_length: int = 200) -> str:
    """Sanitize a string to be safe for use as a filename."""
@@ -99,6 +116,85 @@ def ensure_directory(path: Union[str, Path]) -> Path:
    return path
 
 
+def loads_json(data: Union[str, bytes]) -> Any:
+   """Decode JSON, using orjson when it is installed."""
+   if orjson is not None:
+       return orjson.loads(data)
+   return json.loads(data)
+
+
+def dumps_json(data: Any, indent: bool = False) -> bytes:
+   """Encode JSON as UTF-8 bytes, using orjson when it is installed."""
+   if orjson is not None:
+       return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+   return json.dumps(data, indent=2 if indent else None, ensure_ascii=False).encode('utf-8')
+
+
+def read_json_file(file_path: Union[str, Path]) -> Any:
+   """Read a JSON file, decompressing it first if it ends in .gz."""
+   file_path = Path(file_path)
+   data = file_path.read_bytes()
+   if file_path.suffix == '.gz':
+       data = gzip.decompress(data)
+   return loads_json(data)
+
+
+def read_jsonl_file(file_path: Union[str, Path]) -> Iterator[Any]:
+   """Read a JSON Lines file one document at a time, skipping blank lines.
+   
+   An undecodable last line, as left by a write that was interrupted, is skipped with a
+   warning; an undecodable line anywhere else raises.
+   """
+   with open(file_path, 'rb') as f:
+       lines = (line for line in f if line.strip())
+       line = next(lines, None)
+       while line is not None:
+           next_line = next(lines, None)
+           try:
+               doc = loads_json(line)
+           except ValueError:
+               if next_line is not None:
+                   raise
+               get_logger(__name__).warning(f"Skipping incomplete last line of {file_path}")
+               return
+           yield doc
+           line = next_line
+
+
+def trim_partial_line(file_path: Union[str, Path], block_size: int = 65536) -> bool:
+   """Cut a JSON Lines file back to its last complete line, so appends start on a fresh one.
+   
+   Returns True if a partial last line was removed.
+   """
+   with open(file_path, 'rb+') as f:
+       end = f.seek(0, os.SEEK_END)
+       cut = 0
+       # Search backwards for the last newline, one block at a time
+       pos = end
+       while pos > 0:
+           start = max(0, pos - block_size)
+           f.seek(start)
+           newline = f.read(pos - start).rfind(b'\n')
+           if newline != -1:
+               cut = start + newline + 1
+               break
+           pos = start
+       
+       if cut == end:
+           return False
+       f.truncate(cut)
+       return True
+
+
+def list_json_files(directory: Union[str, Path]) -> List[Path]:
+   """List plain and gzip-compressed JSON files in a directory."""
+   directory = Path(directory)
+   files = []
+   for pattern in JSON_FILE_PATTERNS:
+       files.extend(directory.glob(pattern))
+   return files
+
+
 def get_file_age(file_path: Union[str, Path]) -> timedelta:
    """Get age of a file."""
    file_path = Path(file_path)
@@ -200,12 +296,12 @@ class Timer:
    
    def __enter__(self):
        """Start timing."""
-       self.start_time = time.time()
+       self.start_time = time.perf_counter()
        return self
    
    def __exit__(self, exc_type, exc_val, exc_tb):
        """Stop timing."""
-       self.end_time = time.time()
+       self.end_time = time.perf_counter()
    
    @property
    def elapsed(self) -> float:
@@ -213,7 +309,7 @@ class Timer:
        if self.start_time is None:
            return 0.0
        
-       end = self.end_time if self.end_time else time.time()
+       end = self.end_time if self.end_time else time.perf_counter()
        return end - self.start_time
    
    def __str__(self) -> str:
@@ -122,7 +122,6 @@ def search_query():
             return jsonify({'error': f'Search failed: {error_msg}'}), 500
         
         # Log search to database
-        db_manager = DatabaseManager(current_app.config['RDB_CONFIG'])
         search_data = {
             'original_query': query,
             'refined_query': query,
@@ -131,7 +130,8 @@ def search_query():
             'results_count': 0,  # CLI doesn't easily return count
             'search_time_ms': int(timer.elapsed * 1000)
         }
-        db_manager.log_search(search_data)
+        with DatabaseManager(current_app.config['RDB_CONFIG']) as db_manager:
+            db_manager.log_search(search_data)
         
         return jsonify({
             'query': query,
@@ -155,9 +155,9 @@ def search_history():
         limit = request.args.get('limit', 20, type=int)
         config = current_app.config['RDB_CONFIG']
         
-        db_manager = DatabaseManager(config)
-        history = db_manager.get_recent_searches(limit)
-        stats = db_manager.get_search_stats()
+        with DatabaseManager(config) as db_manager:
+            history = db_manager.get_recent_searches(limit)
+            stats = db_manager.get_search_stats()
         
         return jsonify({
             'history': history,
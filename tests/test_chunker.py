@@ -4,10 +4,12 @@ Tests for the chunking module.
 
 import pytest
 import json
+import gzip
 from pathlib import Path
 
 from rdb.config.settings import Config
 from rdb.chunking.chunker import DocumentChunker, Chunk
+from rdb.chunking.models import FlatDoc
 from rdb.chunking.strategies import SmallChunkStrategy, MediumChunkStrategy, LargeChunkStrategy
 
 
@@ -33,6 +35,25 @@ class TestChunk:
        assert chunk.section_level == 2
 
 
+class TestFlatDoc:
+   """Test cases for FlatDoc."""
+   
+   def test_from_sections(self):
+       """Test flattening sections into parallel lists."""
+       sections = [
+           {'title': 'Getting started', 'content': 'Intro', 'level': 1},
+           {'title': 'Tips/tricks', 'content': '   ', 'level': 2}
+       ]
+       
+       doc = FlatDoc.from_sections("http://example.com/test", sections)
+       
+       assert len(doc) == 2
+       assert doc.levels == [1, 2]
+       assert doc.section_urls[0] == "http://example.com/test#Getting_started"
+       assert doc.section_urls[1] == "http://example.com/test#Tipstricks"
+       assert doc.has_content == [True, False]
+
+
 class TestSmallChunkStrategy:
    """Test cases for SmallChunkStrategy."""
    
@@ -221,6 +242,77 @@ class TestDocumentChunker:
        assert "Document 1" in page_titles
        assert "Document 2" in page_titles
    
+   def test_process_directory_parallel(self, tmp_path):
+       """Test that chunking pages in worker processes matches serial chunking."""
+       for i in range(4):
+           doc = {
+               'title': f'Document {i}',
+               'url': f'http://example.com/doc{i}',
+               'sections': [
+                   {'title': 'Section 1', 'content': f'Content {i}', 'level': 1}
+               ]
+           }
+           with open(tmp_path / f"doc{i}.json", 'w') as f:
+               json.dump(doc, f)
+       
+       self.config.chunk_workers = 1
+       serial_chunks = self.chunker.process_directory(str(tmp_path))
+       
+       self.config.chunk_workers = 2
+       parallel_chunks = self.chunker.process_directory(str(tmp_path))
+       
+       assert [c.chunk_text for c in parallel_chunks] == [c.chunk_text for c in serial_chunks]
+   
+   def test_process_directory_gzip(self, tmp_path):
+       """Test processing gzip-compressed JSON files."""
+       doc = {
+           'title': 'Compressed Document',
+           'url': 'http://example.com/compressed',
+           'sections': [
+               {'title': 'Section 1', 'content': 'Content 1', 'level': 1}
+           ]
+       }
+       
+       with gzip.open(tmp_path / "compressed.json.gz", 'wt', encoding='utf-8') as f:
+           json.dump(doc, f)
+       
+       chunks = self.chunker.process_directory(str(tmp_path))
+       
+       assert len(chunks) > 0
+       assert all(chunk.page_title == "Compressed Document" for chunk in chunks)
+   
+   def test_process_directory_pages_jsonl(self, tmp_path):
+       """Test processing pages appended to pages.jsonl alongside page files."""
+       with open(tmp_path / "pages.jsonl", 'w', encoding='utf-8') as f:
+           for i in range(2):
+               doc = {
+                   'title': f'Line Document {i}',
+                   'url': f'http://example.com/line{i}',
+                   'sections': [{'title': 'Section 1', 'content': f'Content {i}', 'level': 1}]
+               }
+               f.write(json.dumps(doc) + '\n')
+       
+       chunks = self.chunker.process_directory(str(tmp_path))
+       
+       assert {chunk.page_title for chunk in chunks} == {'Line Document 0', 'Line Document 1'}
+   
+   def test_process_directory_pages_jsonl_torn_line(self, tmp_path):
+       """Test a partial last line in pages.jsonl is skipped, but a bad line before it raises."""
+       doc = {
+           'title': 'Line Document',
+           'url': 'http://example.com/line',
+           'sections': [{'title': 'Section 1', 'content': 'Content', 'level': 1}]
+       }
+       line = json.dumps(doc)
+       (tmp_path / "pages.jsonl").write_text(line + '\n' + line[:20], encoding='utf-8')
+       
+       chunks = self.chunker.process_directory(str(tmp_path))
+       assert {chunk.page_title for chunk in chunks} == {'Line Document'}
+       
+       (tmp_path / "pages.jsonl").write_text(line[:20] + '\n' + line + '\n', encoding='utf-8')
+       with pytest.raises(ValueError):
+           self.chunker.process_directory(str(tmp_path))
+   
    def test_save_and_load_chunks(self, tmp_path):
        """Test saving and loading chunks."""
        # Create some test chunks
@@ -250,6 +342,46 @@ class TestDocumentChunker:
        assert loaded_chunks[0].page_title == "Test Page"
        assert loaded_chunks[0].chunk_type == "medium"
    
+   def test_save_and_load_chunks_jsonl(self, tmp_path):
+       """Test memory-mapped JSONL chunks decode lazily on access."""
+       self.chunker.chunks = [
+           Chunk("Page1", "Sec1", "Content1", "Text1", "URL1", "small", 1),
+           Chunk("Päge2", "Sec2", "Cöntent2", "Text2", "URL2", "large", 2)
+       ]
+       
+       output_file = tmp_path / "test_chunks.jsonl"
+       self.chunker.save_chunks_jsonl(str(output_file))
+       
+       assert (tmp_path / "test_chunks.jsonl.idx").exists()
+       
+       new_chunker = DocumentChunker(self.config)
+       loaded_chunks = new_chunker.load_chunks(str(output_file))
+       
+       assert len(loaded_chunks) == 2
+       assert loaded_chunks[1].page_title == "Päge2"
+       assert loaded_chunks[-1].content == "Cöntent2"
+       assert loaded_chunks[0].section_level == 1
+       assert new_chunker.get_stats()['large'] == 1
+       loaded_chunks.close()
+   
+   def test_load_chunks_jsonl_stale_index(self, tmp_path):
+       """Test the offsets are rebuilt when the sidecar is stale or missing."""
+       self.chunker.chunks = [Chunk("Page1", "Sec1", "Content1", "Text1", "URL1", "small", 1)]
+       output_file = tmp_path / "test_chunks.jsonl"
+       self.chunker.save_chunks_jsonl(str(output_file))
+       
+       # Replaced data file with the old sidecar left in place
+       records = [json.dumps({'page_title': f'Page{i}', 'content': 'x'}) for i in range(3)]
+       output_file.write_text('\n'.join(records) + '\n', encoding='utf-8')
+       loaded_chunks = DocumentChunker(self.config).load_chunks(str(output_file))
+       assert [chunk.page_title for chunk in loaded_chunks] == ['Page0', 'Page1', 'Page2']
+       loaded_chunks.close()
+       
+       (tmp_path / "test_chunks.jsonl.idx").unlink()
+       loaded_chunks = DocumentChunker(self.config).load_chunks(str(output_file))
+       assert len(loaded_chunks) == 3
+       loaded_chunks.close()
+   
    def test_get_stats(self):
        """Test getting chunking statistics."""
        # Add some test chunks
@@ -10,6 +10,7 @@ from pathlib import Path
 from rdb.config.settings import Config
 from rdb.embedding.embedder import DocumentEmbedder
 from rdb.embedding.models import EmbeddingModel
+from rdb.storage.cache import CacheManager
 
 
 class TestEmbeddingModel:
@@ -36,7 +37,23 @@ class TestEmbeddingModel:
        assert embedding_model.device == self.device
        assert embedding_model.dimension == 768
        assert embedding_model.max_seq_length == 512
-   
+
+   @patch('torch.ao.quantization.quantize_dynamic')
+   @patch('rdb.embedding.models.SentenceTransformer')
+   def test_init_int8(self, mock_sentence_transformer, mock_quantize_dynamic):
+       """Test int8 quantization is applied on CPU and ignored on CUDA."""
+       import torch
+       mock_model = Mock()
+       mock_model.get_sentence_embedding_dimension.return_value = 768
+       mock_sentence_transformer.return_value = mock_model
+
+       EmbeddingModel(self.model_name, device='cpu', quantize="int8")
+       mock_quantize_dynamic.assert_called_once_with(mock_model, {torch.nn.Linear},
+                                                     dtype=torch.qint8, inplace=True)
+
+       EmbeddingModel(self.model_name, device='cuda', half_precision=False, quantize="int8")
+       mock_quantize_dynamic.assert_called_once()
+
    @patch('rdb.embedding.models.SentenceTransformer')
    def test_encode(self, mock_sentence_transformer):
        """Test text encoding."""
@@ -74,6 +91,26 @@ class TestEmbeddingModel:
        mock_model.encode.assert_called_with(["query: test query"])
        assert isinstance(result, np.ndarray)
    
+   @patch('rdb.embedding.models.SentenceTransformer')
+   def test_encode_query_cached(self, mock_sentence_transformer):
+       """Test that repeated queries reuse the cached embedding."""
+       mock_model = Mock()
+       mock_model.get_sentence_embedding_dimension.return_value = 3
+       mock_model.max_seq_length = 512
+       mock_model.encode.return_value = np.array([[0.1, 0.2, 0.3]], dtype=np.float32)
+       mock_sentence_transformer.return_value = mock_model
+       
+       embedding_model = EmbeddingModel('intfloat/e5-large-v2', device=self.device)
+       
+       first = embedding_model.encode_query("test query")
+       second = embedding_model.encode_query("test query")
+       
+       assert mock_model.encode.call_count == 1
+       np.testing.assert_array_equal(first, second)
+       assert not second.flags.writeable
+       assert embedding_model.get_info()['query_cache']['hits'] == 1
+       assert embedding_model.get_info()['query_cache']['misses'] == 1
+   
    @patch('rdb.embedding.models.SentenceTransformer')
    def test_encode_passage(self, mock_sentence_transformer):
        """Test passage encoding with proper prefix."""
@@ -156,6 +193,91 @@ class TestDocumentEmbedder:
        assert len(loaded_chunks) == 1
        assert loaded_chunks[0]['page_title'] == 'Test Page'
    
+   @patch('rdb.embedding.embedder.EmbeddingModel')
+   def test_load_chunks_legacy_json(self, mock_embedding_model, tmp_path):
+       """Test an existing chunks.json is used by default when there is no chunks.jsonl."""
+       (tmp_path / "chunks").mkdir()
+       (tmp_path / "chunks" / "chunks.json").write_text('[{"page_title": "Test Page"}]')
+       
+       config = Config(data_dir=str(tmp_path))
+       assert config.chunks_file.name == "chunks.json"
+       
+       loaded_chunks = DocumentEmbedder(config).load_chunks()
+       assert loaded_chunks[0]['page_title'] == 'Test Page'
+   
+   @patch('rdb.embedding.embedder.EmbeddingModel')
+   def test_load_chunks_jsonl(self, mock_embedding_model, tmp_path):
+       """Test embedding chunks streamed from a memory-mapped JSONL file."""
+       from rdb.chunking.chunk_file import ChunkFile, write_chunks_jsonl
+       
+       mock_model = Mock()
+       mock_model.dimension = 3
+       mock_model.encode.side_effect = lambda texts, **kwargs: np.ones((len(texts), 3), dtype=np.float32)
+       mock_embedding_model.return_value = mock_model
+       
+       chunks_file = tmp_path / "chunks.jsonl"
+       write_chunks_jsonl(
+           ({'chunk_text': f'Page {i}', 'page_title': f'Page {i}'} for i in range(5)),
+           chunks_file
+       )
+       
+       self.config.embedding_cache = False
+       embedder = DocumentEmbedder(self.config)
+       loaded_chunks = embedder.load_chunks(str(chunks_file))
+       
+       assert isinstance(loaded_chunks, ChunkFile)
+       assert len(loaded_chunks) == 5
+       
+       embeddings = embedder.create_embeddings()
+       
+       assert embeddings.shape == (5, 3)
+       texts = mock_model.encode.call_args[0][0]
+       assert texts[0] == 'passage: Page 0'
+       assert len(texts) == 5
+       loaded_chunks.close()
+   
+   @patch('rdb.embedding.embedder.EmbeddingModel')
+   def test_create_embeddings_deduplicates(self, mock_embedding_model):
+       """Test that identical chunk texts are encoded once and their embeddings reused."""
+       mock_model = Mock()
+       mock_model.dimension = 2
+       mock_model.encode.side_effect = lambda texts, **kwargs: np.array(
+           [[len(text), 1.0] for text in texts], dtype=np.float32
+       )
+       mock_embedding_model.return_value = mock_model
+       
+       test_chunks = [{'chunk_text': text} for text in ['a', 'bb', 'a', 'ccc', 'bb']]
+       
+       self.config.embedding_cache = False
+       embedder = DocumentEmbedder(self.config)
+       embeddings = embedder.create_embeddings(test_chunks)
+       
+       texts = mock_model.encode.call_args[0][0]
+       assert texts == ['passage: a', 'passage: bb', 'passage: ccc']
+       np.testing.assert_array_equal(embeddings[2], embeddings[0])
+       np.testing.assert_array_equal(embeddings[4], embeddings[1])
+       assert embeddings[3][0] == len('passage: ccc')
+   
+   @patch('rdb.embedding.embedder.EmbeddingModel')
+   def test_create_embeddings_uses_cache(self, mock_embedding_model, tmp_path):
+       """Test that a rebuild only encodes chunk texts missing from the embedding cache."""
+       mock_model = Mock()
+       mock_model.dimension = 2
+       mock_model.encode.side_effect = lambda texts, **kwargs: np.array(
+           [[len(text), 1.0] for text in texts], dtype=np.float32
+       )
+       mock_embedding_model.return_value = mock_model
+       
+       config = Config(data_dir=str(tmp_path))
+       DocumentEmbedder(config).create_embeddings([{'chunk_text': 'a'}, {'chunk_text': 'bb'}])
+       
+       embedder = DocumentEmbedder(config)
+       embeddings = embedder.create_embeddings([{'chunk_text': 'bb'}, {'chunk_text': 'ccc'}])
+       
+       assert mock_model.encode.call_args[0][0] == ['passage: ccc']
+       assert embeddings[0][0] == len('passage: bb')
+       assert embeddings[1][0] == len('passage: ccc')
+   
    @patch('rdb.embedding.models.EmbeddingModel')
    @patch('faiss.IndexFlatIP')
    @patch('faiss.normalize_L2')
@@ -281,3 +403,28 @@ class TestDocumentEmbedder:
        
        # Verify normalization was applied
        mock_normalize.assert_called_once()
+
+
+class TestCacheManager:
+   """Test cases for the embedding cache."""
+   
+   def test_cache_embeddings_round_trip(self, tmp_path):
+       """Test that each cached key reads back its own vector."""
+       cache_manager = CacheManager(Config(data_dir=str(tmp_path)))
+       
+       cache_manager.cache_embedding('first', np.array([1.0, 2.0], dtype=np.float32), 'test-model')
+       cache_manager.cache_embedding('second', np.array([3.0, 4.0], dtype=np.float32), 'test-model')
+       
+       np.testing.assert_array_equal(cache_manager.get_cached_embedding('first', 'test-model'), [1.0, 2.0])
+       np.testing.assert_array_equal(cache_manager.get_cached_embedding('second', 'test-model'), [3.0, 4.0])
+   
+   def test_cleanup_and_stats(self, tmp_path):
+       """Test cleanup removes legacy pickles and stats count embeddings by index entry."""
+       cache_manager = CacheManager(Config(data_dir=str(tmp_path)))
+       (cache_manager.embeddings_cache / 'legacy.pkl').write_bytes(b'')
+       cache_manager.cache_embedding('first', np.array([1.0, 2.0], dtype=np.float32), 'test-model')
+       cache_manager.cache_embedding('second', np.array([3.0, 4.0], dtype=np.float32), 'test-model')
+       
+       assert cache_manager.cleanup_expired_cache() == 1
+       assert not (cache_manager.embeddings_cache / 'legacy.pkl').exists()
+       assert cache_manager.get_cache_stats()['embeddings']['file_count'] == 2
@@ -9,8 +9,11 @@ from pathlib import Path
 
 from rdb.config.settings import Config
 from rdb.retrieval.retriever import DocumentRetriever
-from rdb.retrieval.index_manager import IndexManager
-from rdb.retrieval.refiner import QueryRefiner
+from rdb.retrieval.index_manager import IndexManager, create_index, find_metadata_file, load_metadata
+from rdb.retrieval.refiner import QueryRefiner, StopAtNewline
+from rdb.retrieval.chunk_table import ChunkTable
+from rdb.retrieval.search_result import SearchResult
+from rdb.retrieval._numba_kernels import rank_topk, _rank_topk_numpy
 
 
 class TestIndexManager:
@@ -54,8 +57,9 @@ class TestIndexManager:
    
    @patch('faiss.write_index')
    @patch('pickle.dump')
+   @patch('rdb.retrieval.index_manager.PYARROW_AVAILABLE', False)
    def test_save_index(self, mock_pickle_dump, mock_faiss_write, tmp_path):
-       """Test saving index and metadata."""
+       """Test saving index and metadata without pyarrow (pickle fallback)."""
        mock_index = Mock()
        test_chunks = [{'test': 'chunk'}]
        
@@ -71,6 +75,42 @@ class TestIndexManager:
        mock_faiss_write.assert_called_once()
        mock_pickle_dump.assert_called_once()
    
+   @patch('faiss.write_index')
+   def test_save_and_load_parquet_metadata(self, mock_faiss_write, tmp_path):
+       """Test metadata round-trips through Parquet when pyarrow is installed."""
+       pytest.importorskip("pyarrow")
+       test_chunks = [
+           {'page_title': 'Pacman', 'chunk_type': 'small', 'section_level': 2},
+           {'page_title': 'Systemd', 'chunk_type': 'large', 'section_level': 1}
+       ]
+       (tmp_path / "metadata.pkl").touch()  # stale metadata from an older build
+       
+       _, metadata_file = self.index_manager.save_index(Mock(), test_chunks, str(tmp_path))
+       
+       assert metadata_file.endswith("metadata.parquet")
+       assert not (tmp_path / "metadata.pkl").exists()
+       assert find_metadata_file(tmp_path) == tmp_path / "metadata.parquet"
+       assert load_metadata(tmp_path / "metadata.parquet") == test_chunks
+   
+   def test_load_index_memory_mapped(self, tmp_path):
+       """Test loading a real index and Parquet metadata with memory mapping."""
+       import faiss
+       pytest.importorskip("pyarrow")
+       
+       index = faiss.IndexFlatIP(4)
+       index.add(np.eye(4, dtype='float32'))
+       test_chunks = [{'page_title': f'Page {i}', 'chunk_type': 'small'} for i in range(4)]
+       self.index_manager.save_index(index, test_chunks, str(tmp_path))
+       
+       self.index_manager.config.mmap_index = True
+       assert self.index_manager.load_index(str(tmp_path)) is True
+       
+       assert len(self.index_manager.chunks) == 4
+       assert self.index_manager.get_chunk(2) == test_chunks[2]
+       assert self.index_manager.chunks[-1]['page_title'] == 'Page 3'
+       assert list(self.index_manager.chunks) == test_chunks
+       assert self.index_manager.get_stats()['chunk_types'] == {'small': 4}
+   
    def test_search_not_loaded(self):
        """Test searching when index is not loaded."""
        query_embedding = np.array([[0.1, 0.2, 0.3]])
@@ -127,6 +167,250 @@ class TestIndexManager:
        assert stats["chunk_types"]["large"] == 1
 
 
+class TestCreateIndex:
+   """Test cases for corpus-size based index selection."""
+   
+   def setup_method(self):
+       """Setup test fixtures."""
+       import faiss
+       
+       self.config = Config()
+       self.config.index_hnsw_threshold = 100
+       self.config.index_ivfpq_threshold = 500
+       self.config.ivf_nlist = 4
+       self.config.ivf_pq_m = 4
+       self.config.ivf_pq_nbits = 4
+       
+       rng = np.random.default_rng(0)
+       self.vectors = rng.random((1000, 16), dtype='float32')
+       faiss.normalize_L2(self.vectors)
+   
+   def test_flat_for_small_corpus(self):
+       """Test small corpora get an exact flat index."""
+       import faiss
+       
+       index = create_index(self.vectors[:50], self.config)
+       
+       assert isinstance(index, faiss.IndexFlatIP)
+       assert index.ntotal == 50
+   
+   def test_hnsw_for_medium_corpus(self):
+       """Test medium corpora get an HNSW index with configured efSearch."""
+       import faiss
+       
+       index = create_index(self.vectors[:300], self.config)
+       _, indices = index.search(self.vectors[:1], 1)
+       
+       assert isinstance(index, faiss.IndexHNSW)
+       assert index.hnsw.efSearch == self.config.hnsw_ef_search
+       assert indices[0, 0] == 0
+   
+   def test_scalar_quantization(self):
+       """Test sq8 quantization stores one byte per dimension."""
+       import faiss
+       
+       self.config.index_quantization = "sq8"
+       index = create_index(self.vectors[:50], self.config)
+       _, indices = index.search(self.vectors[:1], 1)
+       
+       assert isinstance(index, faiss.IndexScalarQuantizer)
+       assert index.sa_code_size() == 16
+       assert indices[0, 0] == 0
+   
+   def test_product_quantization_small_corpus(self):
+       """Test pq on a small corpus builds a single-list IVF-PQ index."""
+       import faiss
+       
+       self.config.index_quantization = "pq"
+       index = create_index(self.vectors[:50], self.config)
+       
+       assert isinstance(index, faiss.IndexIVFPQ)
+       assert index.nlist == 1
+       assert index.ntotal == 50
+   
+   def test_product_quantization_too_few_vectors(self):
+       """Test pq falls back to SQ8 when there are fewer vectors than PQ centroids."""
+       import faiss
+       
+       self.config.index_quantization = "pq"
+       index = create_index(self.vectors[:10], self.config)
+       
+       assert isinstance(index, faiss.IndexScalarQuantizer)
+       assert index.ntotal == 10
+   
+   @pytest.mark.parametrize("quantization", ["sq8", "pq"])
+   @pytest.mark.parametrize("num_vectors", [50, 300, 1000])
+   def test_quantized_filtered_search(self, quantization, num_vectors):
+       """Test filtered searches work on every quantized index tier."""
+       self.config.index_quantization = quantization
+       index_manager = IndexManager(self.config)
+       index_manager.index = create_index(self.vectors[:num_vectors], self.config)
+       index_manager.chunks = [{} for _ in range(num_vectors)]
+       allowed_ids = np.arange(1, num_vectors, 2)
+       
+       _, indices = index_manager.search(self.vectors[:1], 5, allowed_ids=allowed_ids)
+       
+       found = indices[0][indices[0] >= 0]
+       assert len(found) > 0
+       assert set(found) <= set(allowed_ids)
+   
+   def test_unknown_quantization(self):
+       """Test an unknown quantization mode is rejected."""
+       self.config.index_quantization = "int4"
+       
+       with pytest.raises(ValueError, match="Unknown index quantization"):
+           create_index(self.vectors[:50], self.config)
+   
+   def test_ivfpq_for_large_corpus(self):
+       """Test large corpora get a trained IVF-PQ index."""
+       import faiss
+       
+       index = create_index(self.vectors, self.config)
+       
+       assert isinstance(index, faiss.IndexIVFPQ)
+       assert index.is_trained
+       assert index.ntotal == 1000
+       assert index.nprobe == self.config.ivf_nprobe
+
+
+class TestRankTopk:
+   """Test cases for the post-search ranking kernel."""
+   
+   def test_rank_topk_orders_by_boosted_score(self):
+       """Test static and query boosts reorder FAISS results."""
+       scores = np.array([[0.9, 0.85, 0.8]], dtype='float32')
+       indices = np.array([[0, 1, 2]], dtype='int64')
+       boost_flags = np.array([1.0, 1.0, 1.21])
+       query_boost = np.array([[1.0, 1.3, 1.0]])
+       
+       boosted, order = rank_topk(scores, indices, boost_flags, query_boost)
+       
+       assert list(order[0]) == [1, 2, 0]
+       assert boosted[0, 1] == pytest.approx(0.85 * 1.3)
+   
+   def test_rank_topk_invalid_ids_sort_last(self):
+       """Test FAISS padding ids (-1) are ranked after valid hits."""
+       scores = np.array([[0.5, 0.9, 0.7]], dtype='float32')
+       indices = np.array([[0, -1, 1]], dtype='int64')
+       boost_flags = np.ones(2)
+       
+       boosted, order = rank_topk(scores, indices, boost_flags, np.ones((1, 3)))
+       
+       assert list(order[0]) == [2, 0, 1]
+       assert boosted[0, 1] == -np.inf
+   
+   def test_numpy_fallback_matches(self):
+       """Test the NumPy fallback agrees with the active implementation."""
+       rng = np.random.default_rng(0)
+       scores = rng.random((3, 8))
+       indices = rng.integers(-1, 20, size=(3, 8))
+       boost_flags = rng.random(20) + 1.0
+       query_boost = rng.random((3, 8)) + 1.0
+       
+       boosted, order = rank_topk(scores, indices, boost_flags, query_boost)
+       expected_boosted, expected_order = _rank_topk_numpy(scores, indices, boost_flags, query_boost)
+       
+       np.testing.assert_allclose(boosted, expected_boosted)
+       np.testing.assert_array_equal(order, expected_order)
+   
+   def test_chunk_table_static_boost(self):
+       """Test static boosts are derived from chunk type and content."""
+       chunks = [
+           {'chunk_type': 'small', 'content': 'short'},
+           {'chunk_type': 'medium', 'content': 'short'},
+           {'chunk_type': 'large', 'content': 'install it. ' * 30}
+       ]
+       
+       table = ChunkTable(chunks)
+       
+       assert table.static_boost[0] == pytest.approx(1.0)
+       assert table.static_boost[1] == pytest.approx(1.1)
+       assert table.static_boost[2] == pytest.approx(1.21)
+   
+   def test_chunk_table_type_ids(self):
+       """Test chunk type id lists used for filtered searches."""
+       chunks = [
+           {'chunk_type': 'small', 'content': ''},
+           {'chunk_type': 'large', 'content': ''},
+           {'chunk_type': 'medium', 'content': ''},
+           {'chunk_type': 'medium', 'content': ''}
+       ]
+       
+       table = ChunkTable(chunks)
+       
+       assert list(table.type_ids['medium']) == [2, 3]
+       assert list(table.ids_for_types(['medium', 'large'])) == [1, 2, 3]
+       assert len(table.ids_for_types(['unknown'])) == 0
+   
+   def test_chunk_table_dedup_keys(self):
+       """Test precomputed deduplication keys match on content and normalized title."""
+       chunks = [
+           {'page_title': 'Wi-Fi', 'content': 'same text '},
+           {'page_title': 'wifi', 'content': 'same text'},
+           {'page_title': 'Wi-Fi', 'content': 'other text'}
+       ]
+       
+       table = ChunkTable(chunks)
+       
+       assert table.dedup_key(0) == table.dedup_key(1)
+       assert table.dedup_key(0) != table.dedup_key(2)
+       assert table.title_keys[0] == 'wifi'
+       assert [table.page_title(i) for i in range(3)] == ['Wi-Fi', 'wifi', 'Wi-Fi']
+       assert table.is_title('WiFi ') and not table.is_title('wifi broken')
+   
+   def test_chunk_table_save_and_load(self, tmp_path):
+       """Test a saved ChunkTable loads with the same arrays, and stale files are rebuilt."""
+       chunks = [
+           {'page_title': 'Wi-Fi', 'content': 'connect ' * 40, 'chunk_type': 'medium'},
+           {'page_title': 'Pacman', 'content': 'text', 'chunk_type': 'small'}
+       ]
+       table = ChunkTable(chunks)
+       table.save(tmp_path / "chunk_table.npz")
+       
+       loaded = ChunkTable.load(tmp_path / "chunk_table.npz", chunks)
+       
+       np.testing.assert_array_equal(loaded.static_boost, table.static_boost)
+       assert [loaded.dedup_key(i) for i in range(2)] == [table.dedup_key(i) for i in range(2)]
+       assert loaded.ids_for_types(['small']).tolist() == [1]
+       assert loaded.title_matches({'pacman'}, np.array([0, 1])).tolist() == [False, True]
+       
+       stale = ChunkTable.load(tmp_path / "chunk_table.npz", chunks + chunks)
+       assert stale.size == 4
+       
+       # Changed boost constants invalidate the saved static boosts
+       with patch('rdb.retrieval.chunk_table.TYPE_BOOST', 2.0):
+           rebuilt = ChunkTable.load(tmp_path / "chunk_table.npz", chunks)
+       assert rebuilt.static_boost[0] > table.static_boost[0]
+   
+   def test_chunk_table_title_matches(self):
+       """Test the title word index used for the query title boost."""
+       chunks = [
+           {'page_title': 'Network_Manager'},
+           {'page_title': 'Pacman'},
+           {'page_title': 'Network_Manager'}
+       ]
+       
+       table = ChunkTable(chunks)
+       
+       mask = table.title_matches({'network', 'wifi'}, np.array([2, -1, 1, 0]))
+       assert list(mask) == [True, False, False, True]
+       assert not table.title_matches({'wifi'}, np.array([0, 1])).any()
+   
+   def test_index_search_allowed_ids(self):
+       """Test FAISS search restricted to a subset of ids."""
+       import faiss
+       
+       vectors = np.eye(4, dtype='float32')
+       index_manager = IndexManager(Config())
+       index_manager.index = faiss.IndexFlatIP(4)
+       index_manager.index.add(vectors)
+       index_manager.chunks = [{} for _ in range(4)]
+       
+       scores, indices = index_manager.search(vectors[:1], 2, allowed_ids=np.array([1, 3]))
+       
+       assert set(indices[0]) == {1, 3}
+
+
 class TestDocumentRetriever:
    """Test cases for DocumentRetriever."""
    
@@ -208,6 +492,86 @@ class TestDocumentRetriever:
        assert results[1]['rank'] == 2
        assert results[2]['rank'] == 3
    
+   def test_search_without_score_boosting(self):
+       """Test disabling score boosting keeps raw FAISS scores and order."""
+       self.config.enable_score_boosting = False
+       self.retriever.index_manager.is_loaded.return_value = True
+       self.retriever.index_manager.search.return_value = (
+           np.array([[0.9, 0.8, -3.4e38]]),
+           np.array([[0, 1, -1]])
+       )
+       chunk = {'section_path': 'Usage', 'url': 'http://example.com', 'section_level': 2,
+                'content': 'configure ' * 30}
+       self.retriever.index_manager.chunks = [
+           dict(chunk, page_title='Intro', chunk_type='small'),
+           dict(chunk, page_title='Test', chunk_type='large', content='other')
+       ]
+       self.retriever.embedding_model.encode_query.return_value = np.array([0.1, 0.2, 0.3])
+       
+       results = self.retriever.search("test query", top_k=3)
+       
+       assert [r['page_title'] for r in results] == ['Intro', 'Test']
+       assert [r['score'] for r in results] == [pytest.approx(0.9), pytest.approx(0.8)]
+   
+   def test_search_batch(self):
+       """Test batched search returns one ranked result list per query."""
+       self.retriever.index_manager.is_loaded.return_value = True
+       self.retriever.index_manager.search.return_value = (
+           np.array([[0.9, 0.5], [0.8, 0.7]]),
+           np.array([[0, 1], [1, 0]])
+       )
+       self.retriever.index_manager.chunks = [
+           {
+               'page_title': 'Pacman',
+               'section_path': 'Usage',
+               'url': 'http://example.com/pacman',
+               'content': 'Pacman content',
+               'chunk_type': 'small',
+               'section_level': 2
+           },
+           {
+               'page_title': 'Systemd',
+               'section_path': 'Units',
+               'url': 'http://example.com/systemd',
+               'content': 'Systemd content',
+               'chunk_type': 'small',
+               'section_level': 2
+           }
+       ]
+       self.retriever.embedding_model.encode_queries.return_value = np.ones((2, 3))
+       
+       results = self.retriever.search_batch(["first query", "second query"], top_k=2)
+       
+       assert self.retriever.index_manager.search.call_count == 1
+       assert len(results) == 2
+       assert [r['page_title'] for r in results[0]] == ['Pacman', 'Systemd']
+       assert [r['page_title'] for r in results[1]] == ['Systemd', 'Pacman']
+       assert results[1][0]['original_query'] == "second query"
+       assert results[1][0]['score'] == pytest.approx(0.8)
+
+   def test_search_deduplicates_while_streaming(self):
+       """Test duplicates become aliases of the best result and top_k counts unique results."""
+       self.retriever.index_manager.is_loaded.return_value = True
+       self.retriever.index_manager.search.return_value = (
+           np.array([[0.9, 0.8, 0.7, 0.6]]),
+           np.array([[0, 1, 2, 3]])
+       )
+       chunk = {'section_path': 'Usage', 'url': 'http://example.com/wifi',
+                'content': 'Same content', 'chunk_type': 'small', 'section_level': 2}
+       self.retriever.index_manager.chunks = [
+           dict(chunk, page_title='Wi-Fi'),
+           dict(chunk, page_title='wifi'),
+           dict(chunk, page_title='Pacman', content='Pacman content'),
+           dict(chunk, page_title='Systemd', content='Systemd content')
+       ]
+       self.retriever.embedding_model.encode_query.return_value = np.array([0.1, 0.2, 0.3])
+
+       results = self.retriever.search("test query", top_k=2)
+
+       assert [r['page_title'] for r in results] == ['Wi-Fi', 'Pacman']
+       assert [r['rank'] for r in results] == [1, 2]
+       assert results[0]['aliases'] == ['Wi-Fi', 'wifi']
+
    @patch('rdb.retrieval.retriever.QueryRefiner')
    def test_search_with_query_refinement(self, mock_refiner_class):
        """Test search with query refinement enabled."""
@@ -251,6 +615,73 @@ class TestDocumentRetriever:
        assert results[0]['original_query'] == "test query"
        assert results[0]['final_query'] == "enhanced test query"
 
+   def test_search_result_reads_like_dict(self):
+       """Test search results expose chunk fields by key without copying them."""
+       chunk = {'page_title': 'Iwd', 'section_path': 'Usage', 'url': 'http://example.com/iwd',
+                'content': 'Iwd content', 'chunk_type': 'small', 'section_level': 2}
+       result = SearchResult(1, 0.9, chunk, "wifi", "wifi setup")
+
+       assert result['page_title'] == 'Iwd'
+       assert result['full_chunk'] is chunk
+       assert result.get('aliases', []) == []
+       assert 'aliases' not in result
+       assert dict(result)['final_query'] == "wifi setup"
+
+       result['aliases'] = ['Iwd']
+       copy = result.copy(original_query="wlan")
+       copy['aliases'].append('iwd')
+       assert result['aliases'] == ['Iwd']
+       assert copy['original_query'] == "wlan" and copy['final_query'] == "wifi setup"
+       with pytest.raises(KeyError):
+           result['missing']
+
+   def test_semantic_cache(self):
+       """Test a near-identical query is answered from the semantic cache."""
+       self.config.enable_semantic_cache = True
+       self.config.semantic_cache_threshold = 0.95
+       with patch('rdb.retrieval.retriever.EmbeddingModel'), \
+            patch('rdb.retrieval.retriever.IndexManager'):
+           retriever = DocumentRetriever(self.config)
+       retriever.index_manager.is_loaded.return_value = True
+       retriever.index_manager.search.return_value = (np.array([[0.9]]), np.array([[0]]))
+       retriever.index_manager.chunks = [
+           {'page_title': 'Iwd', 'section_path': 'Usage', 'url': 'http://example.com/iwd',
+            'content': 'Iwd content', 'chunk_type': 'small', 'section_level': 2}
+       ]
+       retriever.embedding_model.encode_query.side_effect = lambda query: {
+           'wifi setup': np.array([1.0, 0.0]),
+           'setup wifi': np.array([0.99, 0.141]),
+           'sound': np.array([0.0, 1.0])
+       }[query]
+
+       retriever.search("wifi setup", top_k=1)
+       results = retriever.search("setup wifi", top_k=1)
+
+       assert retriever.index_manager.search.call_count == 1
+       assert results[0]['page_title'] == 'Iwd'
+       assert results[0]['original_query'] == "setup wifi"
+
+       # Different options or a dissimilar query search the index again
+       retriever.search("setup wifi", top_k=2)
+       retriever.search("sound", top_k=1)
+       assert retriever.index_manager.search.call_count == 3
+
+   def test_technical_queries_skip_refinement(self):
+       """Test queries naming a command or page are searched as typed unless refinement is forced."""
+       self.retriever.index_manager.chunks = [{'page_title': 'Wi-Fi', 'content': 'text'}]
+       self.retriever.index_manager.chunk_table_file = None
+       self.retriever.query_refiner = Mock()
+       self.retriever.query_refiner.refine_query.return_value = "refined"
+       self.retriever.query_refiner.refine_queries.side_effect = lambda queries: ["refined"] * len(queries)
+
+       assert self.retriever._refine_query("pacman keyring error", True, False) == "pacman keyring error"
+       self.retriever.query_refiner.refine_query.assert_not_called()
+       assert self.retriever._refine_query("pacman keyring error", True, False, force_refine=True) == "refined"
+
+       queries = ["wifi broken", "systemctl enable sshd", "WiFi"]
+       assert self.retriever._refine_queries(queries, True, False) == ["refined", "systemctl enable sshd", "WiFi"]
+       self.retriever.query_refiner.refine_queries.assert_called_once_with(["wifi broken"])
+
 
 class TestQueryRefiner:
    """Test cases for QueryRefiner."""
@@ -282,6 +713,19 @@ class TestQueryRefiner:
        assert refiner.tokenizer == mock_tokenizer
        assert refiner.model == mock_model
    
+   def test_optimize_for_cpu_old_ipex(self):
+       """Test an IPEX without ipex.llm leaves the bf16 model unfused instead of failing."""
+       import types
+       refiner = QueryRefiner.__new__(QueryRefiner)
+       refiner.logger = Mock()
+       refiner.model = model = Mock()
+       
+       with patch.dict('sys.modules', {'intel_extension_for_pytorch': types.ModuleType('intel_extension_for_pytorch')}):
+           refiner._optimize_for_cpu()
+       
+       assert refiner.model is model
+       refiner.logger.warning.assert_called_once()
+   
    def test_init_no_model(self):
        """Test QueryRefiner initialization with no model available."""
        config = Config()
@@ -294,8 +738,9 @@ class TestQueryRefiner:
    @patch('rdb.retrieval.refiner.AutoTokenizer')
    @patch('rdb.retrieval.refiner.AutoModelForCausalLM')
    @patch('torch.cuda.is_available')
-   def test_refine_query(self, mock_cuda_available, mock_model_class, mock_tokenizer_class):
+   def test_refine_query(self, mock_cuda_available, mock_model_class, mock_tokenizer_class, tmp_path):
        """Test query refinement."""
+       import torch
        mock_cuda_available.return_value = False
        
        # Mock tokenizer
@@ -303,24 +748,20 @@ class TestQueryRefiner:
        mock_tokenizer.pad_token = None
        mock_tokenizer.eos_token = '<eos>'
        mock_tokenizer.eos_token_id = 2
-       mock_tokenizer.return_value = {
-           'input_ids': [[1, 2, 3]],
-           'attention_mask': [[1, 1, 1]]
-       }
-       mock_tokenizer.decode.return_value = "prompt text refined: networking configuration troubleshooting"
+       mock_tokenizer.return_value = {'input_ids': torch.tensor([[1, 2, 3]])}
+       mock_tokenizer.decode.return_value = "networking configuration troubleshooting"
+       mock_tokenizer.get_vocab.return_value = {'net': 0, '\n': 1}
+       mock_tokenizer.batch_decode.side_effect = lambda ids: [['net', '\n'][i] for i, in ids]
        mock_tokenizer_class.from_pretrained.return_value = mock_tokenizer
        
-       # Mock model
+       # Mock model: prefix, query and suffix are 3 tokens each, then 2 generated tokens
        mock_model = Mock()
-       mock_outputs = Mock()
-       mock_outputs.__getitem__.return_value = [1, 2, 3, 4, 5]  # Mock output tokens
-       mock_model.generate.return_value = mock_outputs
+       mock_model.generate.return_value = torch.arange(11).reshape(1, 11)
        mock_model_class.from_pretrained.return_value = mock_model
        
-       config = Config()
+       config = Config(data_dir=str(tmp_path))
        config.refiner_model = "test-model"
        config.refiner_max_tokens = 30
-       config.refiner_temperature = 0.7
        
        refiner = QueryRefiner(config)
        
@@ -328,13 +769,99 @@ class TestQueryRefiner:
        
        # Should return the refined part (after the prompt)
        assert "networking configuration troubleshooting" in result
+       assert mock_tokenizer.decode.call_args[0][0].tolist() == [9, 10]
        
        # Verify model.generate was called with correct parameters
        mock_model.generate.assert_called_once()
        call_kwargs = mock_model.generate.call_args[1]
+       assert call_kwargs['input_ids'].shape == (1, 9)
        assert call_kwargs['max_new_tokens'] == 30
-       assert call_kwargs['temperature'] == 0.7
+       assert call_kwargs['do_sample'] is False
+       assert call_kwargs['stopping_criteria'][0].newline_ids.tolist() == [1]
+   
+   @patch('rdb.retrieval.refiner.AutoTokenizer')
+   @patch('rdb.retrieval.refiner.AutoModelForCausalLM')
+   def test_refine_query_cached(self, mock_model_class, mock_tokenizer_class, tmp_path):
+       """Test that repeated queries reuse the refinement, in memory and on disk."""
+       config = Config(data_dir=str(tmp_path))
+       config.refiner_model = "test-model"
+       config.use_gpu = False
+       
+       refiner = QueryRefiner(config)
+       with patch.object(refiner, '_generate_refinement', return_value="wireless") as mock_generate:
+           assert refiner.refine_query("Wifi broken ") == "wireless"
+           assert refiner.refine_query("wifi broken") == "wireless"
+       # Matched ignoring case, but generated from the query as typed
+       mock_generate.assert_called_once_with("Wifi broken")
+       
+       # A new refiner finds the refinement in the on-disk query cache
+       new_refiner = QueryRefiner(config)
+       with patch.object(new_refiner, '_generate_refinement') as mock_generate:
+           assert new_refiner.refine_query("wifi broken") == "wireless"
+       mock_generate.assert_not_called()
+
+   @patch('rdb.retrieval.refiner.AutoTokenizer')
+   @patch('rdb.retrieval.refiner.AutoModelForCausalLM')
+   def test_refine_queries_batched(self, mock_model_class, mock_tokenizer_class, tmp_path):
+       """Test that uncached queries are generated in one left-padded batch."""
+       import torch
+       mock_tokenizer = Mock()
+       mock_tokenizer.eos_token_id = 0
+       # Prompt parts are 1 token; each query has one token per word
+       mock_tokenizer.side_effect = lambda text, **kwargs: {
+           'input_ids': torch.ones(1, 1 if 'Search:' in text else len(text.split()), dtype=torch.long)
+       }
+       mock_tokenizer.decode.side_effect = lambda ids, **kwargs: f"terms {len(ids)}"
+       mock_tokenizer.get_vocab.return_value = {}
+       mock_tokenizer.batch_decode.return_value = []
+       mock_tokenizer_class.from_pretrained.return_value = mock_tokenizer
+
+       mock_model = Mock()
+       mock_model.generate.side_effect = lambda input_ids, **kwargs: torch.cat(
+           [input_ids, torch.ones(input_ids.shape[0], 2, dtype=torch.long)], dim=1)
+       mock_model_class.from_pretrained.return_value = mock_model
+
+       config = Config(data_dir=str(tmp_path))
+       config.refiner_model = "test-model"
+       config.use_gpu = False
+       refiner = QueryRefiner(config)
+
+       results = refiner.refine_queries(["wifi", "sound not working", "Wifi"])
+
+       assert results == ["terms 2", "terms 2", "terms 2"]
+       mock_model.generate.assert_called_once()
+       call_kwargs = mock_model.generate.call_args[1]
+       assert call_kwargs['input_ids'].shape == (2, 5)
+       assert call_kwargs['attention_mask'].tolist() == [[0, 0, 1, 1, 1], [1, 1, 1, 1, 1]]
+
+       # Refinements were cached, so asking again doesn't generate
+       assert refiner.refine_queries(["sound not working"]) == ["terms 2"]
+       mock_model.generate.assert_called_once()
+
+   @patch('rdb.retrieval.refiner.AutoTokenizer')
+   @patch('rdb.retrieval.refiner.AutoModelForCausalLM')
+   def test_refine_queries_cache_write_fails(self, mock_model_class, mock_tokenizer_class, tmp_path):
+       """Test that batched refinements are returned even if they can't be cached."""
+       config = Config(data_dir=str(tmp_path))
+       config.refiner_model = "test-model"
+       config.use_gpu = False
+       refiner = QueryRefiner(config)
+       refiner.cache_manager.cache_query_refinement = Mock()
+
+       with patch.object(refiner, '_generate_refinements', return_value=["wireless", "audio"]) as mock_generate:
+           assert refiner.refine_queries(["wifi", "sound"]) == ["wireless", "audio"]
+       mock_generate.assert_called_once_with(["wifi", "sound"])
 
+   def test_stop_at_newline(self):
+       """Test that generation stops after a line of text, but not on a leading newline."""
+       import torch
+       # Token 1 is a newline; generate() calls the criteria once per new token
+       criteria = StopAtNewline(torch.tensor([1]))
+       scores = torch.zeros(2, 4)
+       
+       assert criteria(torch.tensor([[0, 1], [0, 2]]), scores).tolist() == [False, False]
+       assert criteria(torch.tensor([[0, 1, 2], [0, 2, 1]]), scores).tolist() == [False, True]
+       assert criteria(torch.tensor([[0, 1, 2, 1], [0, 2, 1, 1]]), scores).tolist() == [True, True]
 
 class TestRetrievalIntegration:
    """Integration tests for the retrieval module."""
@@ -10,6 +10,7 @@ from pathlib import Path
 from rdb.config.settings import Config
 from rdb.scraper.wiki_scraper import WikiScraper
 from rdb.scraper.content_parser import ContentParser
+from rdb.utils.helpers import read_json_file
 
 
 class TestContentParser:
@@ -89,7 +90,7 @@ class TestWikiScraper:
        self.config = Config()
        self.scraper = WikiScraper(self.config)
    
-   @patch('requests.get')
+   @patch('requests.Session.get')
    def test_scrape_page_success(self, mock_get):
        """Test successful page scraping."""
        # Mock response
@@ -112,7 +113,7 @@ class TestWikiScraper:
        assert result['title'] == "Test"
        assert result['url'] == "http://example.com/title/Test"
    
-   @patch('requests.get')
+   @patch('requests.Session.get')
    def test_scrape_page_network_error(self, mock_get):
        """Test page scraping with network error."""
        import requests
@@ -134,16 +135,65 @@ class TestWikiScraper:
        
        assert success is True
        
-       # Check file was created
-       expected_file = tmp_path / "Test_Page.json"
+       # Check file was created (gzip-compressed by default)
+       expected_file = tmp_path / "Test Page.json.gz"
        assert expected_file.exists()
        
        # Check file contents
-       with open(expected_file, 'r', encoding='utf-8') as f:
-           loaded_data = json.load(f)
+       loaded_data = read_json_file(expected_file)
        
        assert loaded_data == page_data
    
+   @patch('rdb.scraper.wiki_scraper.WikiScraper.get_all_pages')
+   @patch('rdb.scraper.wiki_scraper.WikiScraper.scrape_page')
+   def test_save_page_jsonl(self, mock_scrape, mock_get_pages, tmp_path):
+       """Test pages are appended to pages.jsonl when enabled, and count as saved when resuming."""
+       self.scraper.config.raw_pages_jsonl = True
+       for title in ['Test Page', 'Other/Page']:
+           assert self.scraper.save_page({'title': title, 'sections': []}, tmp_path) is True
+       
+       lines = (tmp_path / "pages.jsonl").read_text(encoding='utf-8').splitlines()
+       assert [json.loads(line)['title'] for line in lines] == ['Test Page', 'Other/Page']
+       
+       mock_get_pages.return_value = ["http://example.com/title/Test_Page", "http://example.com/title/Other/Page"]
+       assert self.scraper.scrape_all(str(tmp_path)) == 0
+       mock_scrape.assert_not_called()
+   
+   @patch('rdb.scraper.wiki_scraper.WikiScraper.get_all_pages')
+   @patch('rdb.scraper.wiki_scraper.WikiScraper.scrape_page')
+   def test_scrape_all_resumes_torn_jsonl(self, mock_scrape, mock_get_pages, tmp_path):
+       """Test a page cut off at the end of pages.jsonl is removed and scraped again."""
+       self.scraper.config.raw_pages_jsonl = True
+       self.scraper.config.scrape_delay_min = 0
+       self.scraper.config.scrape_delay_max = 0
+       (tmp_path / "pages.jsonl").write_text('{"title": "Test Page"}\n{"title": "Other', encoding='utf-8')
+       mock_get_pages.return_value = ["http://example.com/title/Test_Page", "http://example.com/title/Other"]
+       mock_scrape.return_value = {'title': 'Other', 'sections': [{'content': 'text'}]}
+       
+       assert self.scraper.scrape_all(str(tmp_path)) == 1
+       lines = (tmp_path / "pages.jsonl").read_text(encoding='utf-8').splitlines()
+       assert [json.loads(line)['title'] for line in lines] == ['Test Page', 'Other']
+   
+   @patch('rdb.scraper.wiki_scraper.time.sleep')
+   @patch('requests.Session.get')
+   def test_get_all_pages(self, mock_get, mock_sleep):
+       """Test the page list is read from the API, following continuation and skipping translations."""
+       first, second = Mock(), Mock()
+       first.json.return_value = {
+           'continue': {'apcontinue': 'Pacman', 'continue': '-||'},
+           'query': {'allpages': [{'title': 'Arch Linux'}, {'title': 'Installation guide (Deutsch)'}]}
+       }
+       second.json.return_value = {'query': {'allpages': [{'title': 'Pacman/Tips and tricks'}]}}
+       mock_get.side_effect = [first, second]
+       
+       pages = self.scraper.get_all_pages()
+       
+       assert pages == [
+           "https://wiki.archlinux.org/title/Arch_Linux",
+           "https://wiki.archlinux.org/title/Pacman/Tips_and_tricks"
+       ]
+       assert mock_get.call_args_list[1].kwargs['params']['apcontinue'] == 'Pacman'
+   
    @patch('rdb.scraper.wiki_scraper.WikiScraper.get_all_pages')
    @patch('rdb.scraper.wiki_scraper.WikiScraper.scrape_page')
    @patch('rdb.scraper.wiki_scraper.WikiScraper.save_page')
@@ -173,6 +223,52 @@ class TestWikiScraper:
        assert result == 2
        assert mock_scrape.call_count == 2
        assert mock_save.call_count == 2
+   
+   @patch('rdb.scraper.wiki_scraper.WikiScraper.get_all_pages')
+   @patch('rdb.scraper.wiki_scraper.WikiScraper.scrape_page')
+   @patch('rdb.scraper.wiki_scraper.WikiScraper.save_page')
+   def test_scrape_all_stops_fetching_on_error(self, mock_save, mock_scrape, mock_get_pages, tmp_path):
+       """Test only a bounded number of pages is queued, and queued pages are dropped when scraping fails."""
+       mock_get_pages.return_value = [f"http://example.com/title/Page{i}" for i in range(20)]
+       mock_scrape.side_effect = lambda url: {'url': url, 'sections': [{'content': url}]}
+       mock_save.side_effect = KeyboardInterrupt
+       self.scraper.config.scrape_workers = 2
+       self.scraper.config.scrape_delay_min = 0
+       self.scraper.config.scrape_delay_max = 0
+       
+       with pytest.raises(KeyboardInterrupt):
+           self.scraper.scrape_all(str(tmp_path))
+       assert mock_scrape.call_count <= 4
+   
+   @patch('rdb.scraper.wiki_scraper.WikiScraper.get_all_pages')
+   @patch('rdb.scraper.wiki_scraper.WikiScraper.scrape_page')
+   def test_scrape_all_skips_existing(self, mock_scrape, mock_get_pages, tmp_path):
+       """Test pages already saved in either format are not scraped again."""
+       mock_get_pages.return_value = [
+           "http://example.com/title/Page1",
+           "http://example.com/title/Page:2"
+       ]
+       (tmp_path / "Page1.json").write_text("{}")
+       (tmp_path / "Page_2.json.gz").write_bytes(b"")
+       
+       assert self.scraper.scrape_all(str(tmp_path)) == 0
+       mock_scrape.assert_not_called()
+   
+   @patch('rdb.scraper.wiki_scraper.WikiScraper.get_all_pages')
+   @patch('rdb.scraper.wiki_scraper.WikiScraper.scrape_page')
+   @patch('rdb.scraper.wiki_scraper.WikiScraper.save_page')
+   def test_scrape_all_skips_duplicate_content(self, mock_save, mock_scrape, mock_get_pages, tmp_path):
+       """Test a page with the same text as an earlier page, up to case and spacing, is not saved."""
+       mock_get_pages.return_value = [f"http://example.com/title/Page{i}" for i in range(4)]
+       contents = ['Release 2023  notes', 'Release 2024 notes', 'release 2023 Notes', 'Other text']
+       mock_scrape.side_effect = lambda url: {'url': url, 'sections': [{'content': contents[int(url[-1])]}]}
+       mock_save.return_value = True
+       self.scraper.config.scrape_delay_min = 0
+       self.scraper.config.scrape_delay_max = 0
+       
+       # Pages differing only in numbers are distinct pages
+       assert self.scraper.scrape_all(str(tmp_path)) == 3
+       assert mock_save.call_count == 3
 
 
 class TestScraperIntegration:
@@ -206,7 +302,7 @@ class TestScraperIntegration:
        """
        
        # Mock the HTTP request
-       with patch('requests.get') as mock_get:
+       with patch('requests.Session.get') as mock_get:
            mock_response = Mock()
            mock_response.status_code = 200
            mock_response.text = test_html